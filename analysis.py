@@ -1,27 +1,217 @@
+import os
+import time
+import tracemalloc
+
 import numpy as np
+import cache
+import csvparse
+import cube
+import groupby
+import memo
+import parallel
+import query
+import table
+import validity
+from index import ThresholdIndex
+from spatial import GridIndex
+from table import Table
 
 # Load Data Part
-def load_data(filename):
+def load_table(filename, use_cache=True, compact=False):
 
     """
-    Load data from a CSV file.
+    Load a CSV file as a typed columnar table.
+
+    Numeric columns are float arrays and 'ocean_proximity' is
+    dictionary-encoded as uint8 codes plus a category list. The parsed
+    columns are kept in a binary cache next to the CSV file, so later runs
+    memory-map them instead of parsing the text again. The cache is
+    rebuilt automatically when the CSV file changes.
 
     Args:
     - filename (str): Path to the CSV file.
+    - use_cache (bool): Read from and write to the columnar cache.
+    - compact (bool): Store columns in the smaller types of
+      table.COMPACT_SCHEMA. Columns are converted one at a time as they
+      are parsed or memory-mapped from the cache, so the float64 table is
+      never held in memory, except on the parse that fills the cache,
+      which keeps full precision.
 
     Returns:
-    - data (numpy.ndarray): Loaded data as a numpy array.
-    - column_names (list): List of column names extracted from the file.
+    - table (Table): Loaded table, or None if the file was not found or has
+      malformed rows.
     """
 
     try:
-        data = np.genfromtxt(filename, delimiter=',', dtype=float, skip_header=1)
-        with open(filename, 'r') as f:
-            column_names = f.readline().strip().split(',')
-        return data, column_names
+        if use_cache:
+            columns, column_names, categories = cache.load_columns(filename)
+            if columns is not None:
+                loaded = Table(columns, column_names, categories)
+                return loaded.compact() if compact else loaded
+
+        if not use_cache:
+            return csvparse.read_csv(filename, schema=table.COMPACT_SCHEMA if compact else None)
+        loaded = csvparse.read_csv(filename)
+        try:
+            cache.write_cache(filename, [loaded.column(name) for name in loaded.column_names],
+                              loaded.column_names, loaded.categories)
+        except OSError as e:
+            print(f"Warning: could not write cache for '{filename}': {e}")
     except FileNotFoundError:
         print(f"Error: The file '{filename}' was not found.")
+        return None
+    except csvparse.MalformedRowsError as e:
+        print(f"Error: {e}")
+        return None
+    return loaded.compact() if compact else loaded
+
+def load_data(filename, use_cache=True, compact=False):
+
+    """
+    Load data from a CSV file.
+
+    Categorical columns such as 'ocean_proximity' hold their category
+    codes (see load_table) instead of NaN.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - use_cache (bool): Read from and write to the columnar cache.
+    - compact (bool): Return a float32 array, half the memory; the
+      analysis functions still accumulate in float64.
+
+    Returns:
+    - data (numpy.ndarray): Loaded data as a numpy array.
+    - column_names (list): List of column names extracted from the file.
+    """
+
+    loaded = load_table(filename, use_cache, compact)
+    if loaded is None:
         return None, None
+    data = loaded.to_array(table.COMPACT_ARRAY_DTYPE if compact else np.float64)
+    return data, loaded.column_names
+
+def load_session(filename, use_cache=True, remove_missing=False, compact=False):
+
+    """
+    Load everything the non-interactive modes need to answer queries.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - use_cache (bool): Read from and write to the columnar cache.
+    - remove_missing (bool): Analyse a copy of the data with missing
+      values replaced by 0; the table and validity mask keep the raw
+      values.
+    - compact (bool): Use compact column types and a float32 array, see
+      load_data.
+
+    Returns:
+    - session (dict or None): 'table', 'data', 'column_names', the
+      ValidityMask 'validity' of the loaded values, the ThresholdIndex
+      'index', the spatial GridIndex 'grid' and the DataCube 'cube' of
+      the data, or None if the file was not found.
+    """
+
+    loaded = load_table(filename, use_cache, compact)
+    if loaded is None:
+        return None
+    data = loaded.to_array(table.COMPACT_ARRAY_DTYPE if compact else np.float64)
+    mask = validity.ValidityMask.from_array(data, loaded.column_names)
+    if remove_missing:
+        data = remove_missing_values(data, 'zero', mask)
+    # The saved cube describes the file as is, so modified data gets its own
+    data_cube = cube.cube_for(filename, data, loaded.column_names, loaded.categories,
+                              persist=use_cache and not remove_missing)
+    return {'table': loaded, 'data': data, 'column_names': loaded.column_names,
+            'validity': mask, 'index': ThresholdIndex(data), 'grid': GridIndex(data, loaded.column_names),
+            'cube': data_cube}
+
+def measure_load(filename):
+
+    """
+    Measure cold parse and warm cache load of a CSV file.
+
+    The cold run parses the CSV and rebuilds the cache, the warm run loads
+    from the fresh cache. Peak memory is traced with tracemalloc.
+
+    Args:
+    - filename (str): Path to the CSV file.
+
+    Returns:
+    - report (dict): Seconds and peak bytes for the cold and warm loads,
+      plus the size of the data in memory and of the cache on disk.
+    """
+
+    report = {}
+    for label, clear in (('cold', True), ('warm', False)):
+        if clear:
+            manifest_path = os.path.join(cache.cache_dir_for(filename), cache.MANIFEST_NAME)
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        data, _ = load_data(filename)
+        report[f'{label}_seconds'] = time.perf_counter() - start
+        report[f'{label}_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    cache_dir = cache.cache_dir_for(filename)
+    report['data_bytes'] = data.nbytes
+    report['cache_bytes'] = sum(os.path.getsize(os.path.join(cache_dir, name))
+                                for name in os.listdir(cache_dir))
+    return report
+
+def measure_compact(filename):
+
+    """
+    Compare the compact mode (see load_data) with the default float64 mode:
+    memory of the table and of the 2-D array, and the accuracy of the
+    statistics and thresholded averages computed from it.
+
+    Args:
+    - filename (str): Path to the CSV file.
+
+    Returns:
+    - report (dict): 'dtypes' of the compact columns, 'table_bytes',
+      'compact_table_bytes', 'data_bytes', 'compact_data_bytes', and
+      'max_relative_error', the largest relative difference of each
+      column's statistics and of each average.
+    """
+
+    full = load_table(filename)
+    if full is None:
+        return None
+    compact = full.compact()
+    data, compact_data = full.to_array(), compact.to_array(table.COMPACT_ARRAY_DTYPE)
+
+    def relative_error(exact, approximate):
+        exact, approximate = np.asarray(exact, dtype=float), np.asarray(approximate, dtype=float)
+        both_nan = np.isnan(exact) & np.isnan(approximate)
+        error = np.abs(approximate - exact) / np.maximum(np.abs(exact), np.finfo(float).tiny)
+        return float(np.max(np.where(both_nan, 0.0, error)))
+
+    errors = {}
+    exact_stats = describe(data, full.column_names)
+    compact_stats = describe(compact_data, full.column_names)
+    for name in full.column_names:
+        if name in table.CATEGORICAL_COLUMNS:
+            continue
+        keys = ('sum', 'min', 'max', 'mean', 'std', 'median', 'mode')
+        errors[name] = relative_error([exact_stats[name][k] for k in keys],
+                                      [compact_stats[name][k] for k in keys])
+    errors['income_mean'] = relative_error(calculate_income_mean(data),
+                                           calculate_income_mean(compact_data))
+    for func in (calculate_avg_population_bedrooms_gt_n, calculate_avg_house_value_bedrooms_gt_n,
+                 calculate_avg_income_bedrooms_gt_n):
+        errors[func.__name__] = relative_error(func(data, 3), func(compact_data, 3))
+    for func in (calculate_avg_income_rooms_gt_3, calculate_avg_population_high_density,
+                 calculate_avg_house_value_high_density):
+        errors[func.__name__] = relative_error(func(data), func(compact_data))
+
+    return {'dtypes': {name: compact.column(name).dtype.name for name in compact.column_names},
+            'table_bytes': full.nbytes, 'compact_table_bytes': compact.nbytes,
+            'data_bytes': data.nbytes, 'compact_data_bytes': compact_data.nbytes,
+            'max_relative_error': errors}
     
 def display_dataset_preview(data, column_names):
 
@@ -84,78 +274,340 @@ def show_basic_info(data):
     print("\nPreview of the first 5 rows:")
     print(data[:5])
 
-def show_missing_values(data, filename):
+@memo.memoize
+def count_missing_values(data, column_names, mask=None):
+
+    """
+    Count the missing (NaN) values in each column of a numpy array.
+
+    Parameters:
+    data (numpy.ndarray): The numpy array containing the dataset.
+    column_names (list): List of column names corresponding to the dataset.
+    mask (ValidityMask): Optional validity bitmaps of the data, whose null
+    counts are read in O(1) instead of scanning the data.
+
+    Returns:
+    missing_counts (dict): Number of missing values keyed by column name.
+    """
+
+    if mask is not None:
+        return mask.null_counts()
+    missing_counts = np.count_nonzero(np.isnan(data), axis=0)
+    return {col: int(missing_counts[i]) for i, col in enumerate(column_names)}
+
+def show_missing_values(data, filename, mask=None):
 
     """
     Prints the number of missing (NaN) values in each column of a numpy array.
 
     Parameters:
     data (numpy.ndarray): The numpy array containing the dataset.
+    mask (ValidityMask): Optional validity bitmaps of the data.
 
     Returns: None
     """
 
-    missing_counts = np.sum(np.isnan(data), axis=0)
     print("\nMissing value counts per column:")
     column_names = show_column_names(filename)
     print(column_names)
-    for i, col in enumerate(column_names):
-        print(f"Column '{col}': {missing_counts[i]} missing values")
+    for col, count in count_missing_values(data, column_names, mask).items():
+        print(f"Column '{col}': {count} missing values")
 
 # Remove missing values
-def remove_missing_values(data):
+def remove_missing_values(data, strategy='zero', mask=None):
 
     """
-    Replace missing values (NaN) in the data with 0.
+    Return a copy of the data with missing values (NaN) replaced, by 0 or
+    the mean or median of each column.
+
+    The data itself is left unchanged. For a lazy view that fills only
+    the rows it is indexed with, see impute_view.
 
     Args:
     - data (numpy.ndarray): Input data with potential missing values.
+    - strategy (str): One of validity.IMPUTATIONS.
+    - mask (ValidityMask): Validity of the data, built if not given.
 
     Returns:
-    - data (numpy.ndarray): Data with missing values replaced by 0.
+    - data (numpy.ndarray): Data with missing values replaced.
+    """
+
+    return np.asarray(impute_view(data, strategy, mask))
+
+def impute_view(data, strategy='zero', mask=None):
+
+    """
+    Return a lazy view of the data with missing values replaced, see
+    validity.ImputedData; np.asarray(view) gives the filled copy of
+    remove_missing_values.
     """
-    
-    data[np.isnan(data)] = 0
-    return data
+
+    return validity.impute(data, mask, strategy)
 
 # Finding mean, max, median values
-def calculate_statistics(data, column_names):
+STATS_BLOCK_SIZE = 1 << 16
+
+def empty_summary():
 
     """
-    Calculate mean, max, median, and mode values for each column of the data.
+    Return the summary of a column with no values.
+
+    Returns:
+    - summary (dict): Summary with zero counts and NaN statistics.
+    """
+
+    return {'count': 0, 'nan_count': 0, 'sum': 0.0, 'min': np.nan,
+            'max': np.nan, 'mean': np.nan, 'm2': 0.0}
+
+def merge_summaries(a, b):
+
+    """
+    Merge the summaries of two parts of a column.
+
+    Counts and sums are added, min/max combined, and mean and the sum of
+    squared deviations (m2) merged with Chan's parallel update, so parts
+    can be summarized in any order (blocks, chunks or processes).
+
+    Args:
+    - a (dict): Summary of the first part.
+    - b (dict): Summary of the second part.
+
+    Returns:
+    - summary (dict): Summary of both parts together.
+    """
+
+    count = a['count'] + b['count']
+    merged = {'count': count, 'nan_count': a['nan_count'] + b['nan_count'],
+              'sum': a['sum'] + b['sum']}
+    if a['count'] == 0 or b['count'] == 0:
+        valid = b if a['count'] == 0 else a
+        merged.update(min=valid['min'], max=valid['max'], mean=valid['mean'], m2=valid['m2'])
+        return merged
+
+    delta = b['mean'] - a['mean']
+    merged['min'] = min(a['min'], b['min'])
+    merged['max'] = max(a['max'], b['max'])
+    merged['mean'] = a['mean'] + delta * b['count'] / count
+    merged['m2'] = a['m2'] + b['m2'] + delta * delta * a['count'] * b['count'] / count
+    return merged
+
+def summarize_block(block):
+
+    """
+    Summarize one block of a column, skipping NaN values.
+
+    Args:
+    - block (numpy.ndarray): 1-D block of column values.
+
+    Returns:
+    - summary (dict): count, nan_count, sum, min, max, mean and m2 of the block.
+    """
+
+    nan_mask = np.isnan(block)
+    nan_count = int(np.count_nonzero(nan_mask))
+    if nan_count:
+        block = block[~nan_mask]
+    summary = empty_summary()
+    summary['nan_count'] = nan_count
+    if block.size == 0:
+        return summary
+
+    block = block.astype(np.float64, copy=False)
+    total = float(np.sum(block))
+    mean = total / block.size
+    deviations = block - mean
+    summary.update(count=int(block.size), sum=total, min=float(np.min(block)),
+                   max=float(np.max(block)), mean=mean,
+                   m2=float(np.dot(deviations, deviations)))
+    return summary
+
+def summarize_column(column, block_size=STATS_BLOCK_SIZE):
+
+    """
+    Summarize a column in one pass over cache-sized blocks.
+
+    Args:
+    - column (numpy.ndarray): 1-D column values.
+    - block_size (int): Number of values summarized at a time.
+
+    Returns:
+    - summary (dict): count, nan_count, sum, min, max, mean, m2 and the
+      population variance (var) of the non-NaN values.
+    """
+
+    summary = empty_summary()
+    for start in range(0, column.shape[0], block_size):
+        summary = merge_summaries(summary, summarize_block(column[start:start + block_size]))
+    summary['var'] = summary['m2'] / summary['count'] if summary['count'] else np.nan
+    return summary
+
+def column_quantiles(column, quantiles):
+
+    """
+    Calculate quantiles of a column with partial selection instead of a sort.
+
+    NaN values are skipped. Quantiles use linear interpolation like
+    numpy.quantile, and a single np.partition call places every needed
+    order statistic.
+
+    Args:
+    - column (numpy.ndarray): 1-D column values.
+    - quantiles (sequence): Quantiles between 0 and 1.
+
+    Returns:
+    - values (numpy.ndarray): Value of each quantile, NaN if the column
+      has no values.
+    """
+
+    values = column[~np.isnan(column)]
+    quantiles = np.asarray(quantiles, dtype=float)
+    if values.size == 0:
+        return np.full(quantiles.shape, np.nan)
+
+    positions = quantiles * (values.size - 1)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.ceil(positions).astype(np.intp)
+    values = np.partition(values, np.unique(np.concatenate([lower, upper])))
+
+    below, above = values[lower].astype(np.float64), values[upper].astype(np.float64)
+    weight = positions - lower
+    diff = above - below
+    return np.where(weight >= 0.5, above - diff * (1 - weight), below + diff * weight)
+
+def column_median(column):
+
+    """
+    Calculate the median of a column with partial selection, skipping NaN.
+
+    Args:
+    - column (numpy.ndarray): 1-D column values.
+
+    Returns:
+    - median (float): Median value, NaN if the column has no values.
+    """
+
+    values = column[~np.isnan(column)]
+    if values.size == 0:
+        return np.nan
+
+    middle = values.size // 2
+    if values.size % 2:
+        return float(np.partition(values, middle)[middle])
+    values = np.partition(values, [middle - 1, middle])
+    return (float(values[middle - 1]) + float(values[middle])) / 2
+
+def column_mode(column):
+
+    """
+    Calculate the most frequent value of a column, skipping NaN.
+
+    Values are counted with np.unique, so negative and fractional values
+    are handled. Ties go to the smallest value.
+
+    Args:
+    - column (numpy.ndarray): 1-D column values.
+
+    Returns:
+    - mode (float): Most frequent value, NaN if the column has no values.
+    """
+
+    values = column[~np.isnan(column)]
+    if values.size == 0:
+        return np.nan
+    unique_values, counts = np.unique(values, return_counts=True)
+    return float(unique_values[np.argmax(counts)])
+
+def describe_column(column, quantiles=(0.25, 0.75)):
+
+    """
+    Build the statistical summary of one column, see describe.
+    """
+
+    stats = summarize_column(column)
+    del stats['m2']
+    stats['std'] = float(np.sqrt(stats['var']))
+    stats['median'] = column_median(column)
+    stats['mode'] = column_mode(column)
+    stats['quantiles'] = dict(zip(quantiles, column_quantiles(column, quantiles).tolist()))
+    return stats
+
+def describe_categories(column):
+
+    """
+    Build the summary of a categorical column, see describe: only counts,
+    since means or medians of category codes mean nothing.
+
+    Args:
+    - column (numpy.ndarray): Category codes as floats, NaN if missing.
+
+    Returns:
+    - stats (dict): count (rows), nan_count and counts, the number of rows
+      per category code.
+    """
+
+    present = ~np.isnan(column)
+    codes, counts = np.unique(column[present].astype(np.intp), return_counts=True)
+    return {'count': int(column.size), 'nan_count': int(column.size - np.count_nonzero(present)),
+            'counts': dict(zip(codes.tolist(), counts.tolist()))}
+
+@memo.memoize
+def describe(data, column_names, quantiles=(0.25, 0.75), workers=None, mode='thread'):
+
+    """
+    Build a statistical summary of every column of the data. Columns are
+    summarized in parallel, with the same results as one after another.
 
     Args:
     - data (numpy.ndarray): Input data.
+    - column_names (list): List of column names.
+    - quantiles (sequence): Extra quantiles to report besides the median.
+    - workers (int): Number of workers, see parallel.map_columns.
+    - mode (str): 'thread', 'process' or 'serial', see parallel.map_columns.
 
     Returns:
-    - mean_values (numpy.ndarray): Mean values for each column.
-    - max_values (numpy.ndarray): Maximum values for each column.
-    - median_values (numpy.ndarray): Median values for each column.
-    - mode_values (numpy.ndarray): Mode values for each column.
+    - summary (dict): For each numeric column name, a dict with count,
+      nan_count, sum, min, max, mean, var, std, median, mode and quantiles
+      (a dict from quantile to value); for each categorical column (see
+      table.CATEGORICAL_COLUMNS), the counts of describe_categories.
     """
 
-    mean_values = np.mean(data, axis=0)
-    max_values = np.max(data, axis=0)
-    median_values = np.median(data, axis=0)
-    mode_values = np.zeros(data.shape[1], dtype=float)
+    numeric = [i for i, name in enumerate(column_names) if name not in table.CATEGORICAL_COLUMNS]
+    summaries = iter(parallel.map_columns(describe_column, data, numeric, (tuple(quantiles),),
+                                          workers, mode))
+    return {name: describe_categories(data[:, i]) if name in table.CATEGORICAL_COLUMNS
+            else next(summaries) for i, name in enumerate(column_names)}
 
-    for i in range(data.shape[1]):
-        col_data = data[:, i]
+def calculate_statistics(data, column_names, workers=None):
 
-        if np.any(col_data < 0):
-            mode_values[i] = np.nan
-            continue
+    """
+    Calculate and print mean, max, median, and mode values (and more) for
+    each column of the data. NaN values are skipped and counted.
 
-        col_data = col_data.astype(int)
-        mode_values[i] = np.argmax(np.bincount(col_data))
+    Args:
+    - data (numpy.ndarray): Input data.
+    - column_names (list): List of column names.
+    - workers (int): Number of threads summarizing columns, defaults to
+      the CPU count.
+
+    Returns:
+    - summary (dict): Per-column statistics, see describe.
+    """
+
+    summary = describe(data, column_names, workers=workers)
     print("\nStatistical summary:")
-    for i, col in enumerate(column_names):
-        print(f"Column '{col}': Mean={mean_values[i]}, Max={max_values[i]}, \
-              Median={median_values[i]}, Mode={mode_values[i]}")
+    for col, stats in summary.items():
+        if col in table.CATEGORICAL_COLUMNS:
+            print(f"Column '{col}': Rows per category code={stats['counts']}, "
+                  f"Missing={stats['nan_count']}")
+            continue
+        print(f"Column '{col}': Mean={stats['mean']}, Max={stats['max']}, "
+              f"Median={stats['median']}, Mode={stats['mode']}, Min={stats['min']}, "
+              f"Std={stats['std']}, Missing={stats['nan_count']}")
 
-    return mean_values, max_values, median_values, mode_values
+    return summary
 
 # Income mean calculation
+@memo.memoize
 def calculate_income_mean(data):
 
     """
@@ -168,11 +620,11 @@ def calculate_income_mean(data):
     - income_mean (float): Mean income.
     """
 
-    return np.mean(data[:, 7])
+    return np.mean(data[:, 7], dtype=np.float64)
 
 # Analysis Part
 
-def calculate_avg_population_bedrooms_gt_n(data, n):
+def calculate_avg_population_bedrooms_gt_n(data, n, index=None):
 
     """
     Calculate the average population in areas with bedrooms greater than n.
@@ -180,15 +632,18 @@ def calculate_avg_population_bedrooms_gt_n(data, n):
     Args:
     - data (numpy.ndarray): Input data.
     - n (int): Number of bedrooms threshold.
+    - index (ThresholdIndex): Optional prebuilt index answering the query
+      without scanning the rows.
 
     Returns:
     - avg_population (float): Average population in areas with bedrooms > n.
     """
 
-    bedrooms_gt_n = data[data[:, 4] > n]
-    return np.mean(bedrooms_gt_n[:, 5])
+    if index is not None:
+        return index.avg_gt(4, n, 5)
+    return query.average(data, 'population', [('total_bedrooms', '>', n)])
 
-def calculate_avg_house_value_bedrooms_gt_n(data, n):
+def calculate_avg_house_value_bedrooms_gt_n(data, n, index=None):
 
     """
     Calculate the average house value in areas with bedrooms greater than n.
@@ -196,15 +651,18 @@ def calculate_avg_house_value_bedrooms_gt_n(data, n):
     Args:
     - data (numpy.ndarray): Input data.
     - n (int): Number of bedrooms threshold.
+    - index (ThresholdIndex): Optional prebuilt index answering the query
+      without scanning the rows.
 
     Returns:
     - avg_house_value (float): Average house value in areas with bedrooms > n.
     """
 
-    bedrooms_gt_n = data[data[:, 4] > n]
-    return np.mean(bedrooms_gt_n[:, 8])
+    if index is not None:
+        return index.avg_gt(4, n, 8)
+    return query.average(data, 'median_house_value', [('total_bedrooms', '>', n)])
 
-def calculate_avg_income_bedrooms_gt_n(data, n):
+def calculate_avg_income_bedrooms_gt_n(data, n, index=None):
 
     """
     Calculate the average income in areas with bedrooms greater than n.
@@ -212,64 +670,82 @@ def calculate_avg_income_bedrooms_gt_n(data, n):
     Args:
     - data (numpy.ndarray): Input data.
     - n (int): Number of bedrooms threshold.
+    - index (ThresholdIndex): Optional prebuilt index answering the query
+      without scanning the rows.
 
     Returns:
     - avg_income (float): Average income in areas with bedrooms > n.
     """
 
-    bedrooms_gt_n = data[data[:, 4] > n]
-    return np.mean(bedrooms_gt_n[:, 7])
+    if index is not None:
+        return index.avg_gt(4, n, 7)
+    return query.average(data, 'median_income', [('total_bedrooms', '>', n)])
 
-def calculate_avg_income_rooms_gt_3(data):
+def calculate_avg_income_rooms_gt_3(data, index=None):
 
     """
     Calculate the average income of people with more than 3 rooms per household.
 
+    Rooms per household is the derived column total_rooms / households
+    (see derived.DERIVED_COLUMNS).
+
     Args:
     - data (numpy.ndarray): Input data.
+    - index (ThresholdIndex): Optional prebuilt index answering the query
+      without scanning the rows.
 
     Returns:
     - avg_income (float): Average income of people with more than 3 rooms per household.
     """
 
-    rooms_per_household_gt_3 = data[data[:, 4] > 3]
-    return np.mean(rooms_per_household_gt_3[:, 7])
+    if index is not None:
+        return index.avg_gt('rooms_per_household', 3, 7)
+    return query.average(data, 'median_income', [('rooms_per_household', '>', 3)])
 
-def calculate_avg_population_high_density(data):
+def calculate_avg_population_high_density(data, index=None):
 
     """
     Calculate the average population in households with high density (> 1000).
 
     Args:
     - data (numpy.ndarray): Input data.
+    - index (ThresholdIndex): Optional prebuilt index answering the query
+      without scanning the rows.
 
     Returns:
     - avg_population (float): Average population in households with high density (> 1000).
     """
 
-    high_density_households = data[data[:, 5] > 1000]
-    return np.mean(high_density_households[:, 5])
+    if index is not None:
+        return index.avg_gt(5, 1000, 5)
+    return query.average(data, 'population', [('population', '>', 1000)])
 
-def calculate_avg_house_value_high_density(data):
+def calculate_avg_house_value_high_density(data, index=None):
 
     """
     Calculate the average house value in households with high density (> 1000).
 
     Args:
     - data (numpy.ndarray): Input data.
+    - index (ThresholdIndex): Optional prebuilt index answering the query
+      without scanning the rows.
 
     Returns:
     - avg_house_value (float): Average house value in households with high density (> 1000).
     """
 
-    high_density_households = data[data[:, 5] > 1000]
-    return np.mean(high_density_households[:, 8])
+    if index is not None:
+        return index.avg_gt(5, 1000, 8)
+    return query.average(data, 'median_house_value', [('population', '>', 1000)])
 
+@memo.memoize
 def average_income_by_bedrooms(data):
 
     """
     Calculate the average income by total number of bedrooms.
 
+    Rows with a missing bedroom count are left out.
+
     Args:
     - data (numpy.ndarray): Input data.
 
@@ -279,14 +755,24 @@ def average_income_by_bedrooms(data):
       each unique total bedrooms value.
     """
 
-    total_bedrooms = data[:, 4]
-    median_income = data[:, 7]
+    return groupby.group_by(data[:, 4], data[:, 7], 'mean')
 
-    unique_bedrooms, counts = np.unique(total_bedrooms, return_counts=True)
-    avg_income_by_bedrooms = np.zeros_like(unique_bedrooms, dtype=float)
+def aggregate_by_category(table, category_column, value_column, agg='mean'):
 
-    for i, bedrooms in enumerate(unique_bedrooms):
-        avg_income_by_bedrooms[i] = np.mean(median_income[total_bedrooms == bedrooms])
+    """
+    Aggregate a column per category, e.g. the average house value per
+    'ocean_proximity' value. Groups are formed on the integer codes.
+
+    Args:
+    - table (Table): Loaded table, see load_table.
+    - category_column (str): Name of a categorical column.
+    - value_column (str): Name of the column to aggregate.
+    - agg (str or sequence): Aggregation name(s), see groupby.AGGREGATIONS.
 
-    return unique_bedrooms, avg_income_by_bedrooms
+    Returns:
+    - categories (numpy.ndarray): Category names.
+    - result (numpy.ndarray or dict): Aggregated values per category.
+    """
 
+    return groupby.group_by(table.column(category_column), table.values(value_column), agg,
+                            categories=table.categories[category_column])
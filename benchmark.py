@@ -0,0 +1,472 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import analysis
+import downsample
+import memo
+import parallel
+import partition
+import query
+import table
+from index import ThresholdIndex
+
+# Standard dataset sizes, from the real dataset's size up to statewide extracts
+DEFAULT_SIZES = (20_000, 100_000, 1_000_000, 10_000_000)
+
+COLUMN_NAMES = list(table.COLUMN_NAMES)
+OCEAN_PROXIMITY = np.array(['<1H OCEAN', 'INLAND', 'NEAR OCEAN', 'NEAR BAY', 'ISLAND'])
+OCEAN_PROXIMITY_SHARE = [0.443, 0.317, 0.129, 0.111, 0.0002]
+
+def generate_rows(rows, seed=0):
+
+    """
+    Generate synthetic housing-shaped rows.
+
+    Value ranges and rough distributions follow data/housing.csv, and about
+    1% of the bedroom counts are missing.
+
+    Args:
+    - rows (int): Number of rows.
+    - seed (int): Seed of the random generator.
+
+    Returns:
+    - columns (list): Ten 1-D numpy arrays; the last holds category names.
+    """
+
+    rng = np.random.default_rng(seed)
+    households = np.clip(rng.lognormal(6.0, 0.65, rows), 1, 6082).round()
+    rooms = np.clip(households * rng.lognormal(1.6, 0.25, rows), 2, 39320).round()
+    bedrooms = np.clip(rooms * rng.normal(0.21, 0.05, rows), 1, 6445).round()
+    bedrooms[rng.random(rows) < 0.01] = np.nan
+    proximity_share = np.array(OCEAN_PROXIMITY_SHARE) / np.sum(OCEAN_PROXIMITY_SHARE)
+    return [
+        rng.uniform(-124.35, -114.31, rows).round(2),
+        rng.uniform(32.54, 41.95, rows).round(2),
+        rng.integers(1, 53, rows).astype(float),
+        rooms,
+        bedrooms,
+        np.clip(households * rng.lognormal(1.0, 0.3, rows), 3, 35682).round(),
+        households,
+        np.clip(rng.lognormal(1.25, 0.45, rows), 0.4999, 15.0001).round(4),
+        np.clip(rng.lognormal(12.0, 0.55, rows), 14999, 500001).round(),
+        OCEAN_PROXIMITY[rng.choice(len(OCEAN_PROXIMITY), rows, p=proximity_share)],
+    ]
+
+def write_dataset(path, rows, seed=0, chunk_size=500_000):
+
+    """
+    Write a synthetic dataset with the columns of data/housing.csv.
+
+    Args:
+    - path (str): Output CSV path.
+    - rows (int): Number of rows.
+    - seed (int): Seed of the random generator.
+    - chunk_size (int): Rows generated and formatted at a time.
+    """
+
+    formats = ['%.2f', '%.2f', '%d', '%d', '%d', '%d', '%d', '%.4f', '%d', '%s']
+    with open(path, 'w') as f:
+        f.write(','.join(COLUMN_NAMES) + '\n')
+        for start in range(0, rows, chunk_size):
+            columns = generate_rows(min(chunk_size, rows - start), seed + start)
+            text = []
+            for fmt, column in zip(formats, columns):
+                if fmt == '%d':
+                    missing = np.isnan(column)
+                    formatted = np.char.mod(fmt, np.nan_to_num(column).astype(np.int64))
+                    formatted[missing] = ''
+                    text.append(formatted)
+                else:
+                    text.append(np.char.mod(fmt, column))
+            lines = text[0]
+            for formatted in text[1:]:
+                lines = np.char.add(np.char.add(lines, ','), formatted)
+            f.write('\n'.join(lines.tolist()) + '\n')
+
+def dataset_path(rows, data_dir='bench_data', seed=0):
+
+    """
+    Return the path of the synthetic dataset of a size, writing it first
+    if it does not exist yet.
+    """
+
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'housing_{rows}_{seed}.csv')
+    if not os.path.exists(path):
+        write_dataset(path, rows, seed)
+    return path
+
+def measure(func, repeat=3):
+
+    """
+    Time a function and trace its peak memory.
+
+    The time is the best of several runs without tracing; one more run
+    under tracemalloc gives the peak of memory allocated during the call.
+    The result cache (see memo.py) is cleared before every run, so
+    memoized functions are timed computing, not served from the cache.
+
+    Args:
+    - func (callable): Function without arguments.
+    - repeat (int): Number of timed runs.
+
+    Returns:
+    - result (dict): 'seconds' and 'peak_bytes'.
+    """
+
+    seconds = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            memo.default_cache.clear()
+            start = time.perf_counter()
+            func()
+            seconds.append(time.perf_counter() - start)
+
+        memo.default_cache.clear()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'seconds': min(seconds), 'peak_bytes': peak}
+
+def time_to_first_prompt(path, repeat=3):
+
+    """
+    Time the interactive program from process start to its first menu
+    prompt, then exit it.
+
+    Args:
+    - path (str): Dataset the program loads.
+    - repeat (int): Number of runs.
+
+    Returns:
+    - result (dict): Best 'seconds' of the runs and 'peak_bytes' (0, not
+      traced across processes).
+    """
+
+    prompt = b'Enter your choice'
+    code = f'import main; main.main({path!r})'
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-c', code], stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        output = b''
+        while prompt not in output:
+            byte = process.stdout.read(1)
+            if not byte:
+                break
+            output += byte
+        seconds.append(time.perf_counter() - start)
+        process.communicate(b'9\n')
+    return {'seconds': min(seconds), 'peak_bytes': 0}
+
+def benchmark_cases(path, data, column_names, out_dir, plots=True):
+
+    """
+    List the benchmarked operations on one dataset.
+
+    Returns:
+    - cases (list): (name, function without arguments, repeat) tuples.
+    """
+
+    index = ThresholdIndex(data)
+    n = 3
+    cases = [
+        ('load_data_cold', lambda: analysis.load_data(path, use_cache=False), 1),
+        ('load_data_warm', lambda: analysis.load_data(path), 3),
+        ('calculate_statistics', lambda: analysis.calculate_statistics(data, column_names), 3),
+        ('calculate_income_mean', lambda: analysis.calculate_income_mean(data), 3),
+        ('average_income_by_bedrooms', lambda: analysis.average_income_by_bedrooms(data), 3),
+        ('threshold_index_build', lambda: ThresholdIndex(data), 3),
+    ]
+    for name in ('calculate_avg_population_bedrooms_gt_n',
+                 'calculate_avg_house_value_bedrooms_gt_n',
+                 'calculate_avg_income_bedrooms_gt_n'):
+        func = getattr(analysis, name)
+        cases.append((name, lambda func=func: func(data, n), 3))
+        cases.append((f'{name}_indexed', lambda func=func: func(data, n, index), 3))
+    for name in ('calculate_avg_income_rooms_gt_3',
+                 'calculate_avg_population_high_density',
+                 'calculate_avg_house_value_high_density'):
+        func = getattr(analysis, name)
+        cases.append((name, lambda func=func: func(data), 3))
+        cases.append((f'{name}_indexed', lambda func=func: func(data, index), 3))
+
+    if plots:
+        import report
+        plot = report.load_plot()
+        income_mean = analysis.calculate_income_mean(data)
+        bedrooms = analysis.average_income_by_bedrooms(data)
+
+        def save(name):
+            return os.path.join(out_dir, f'{name}.png')
+
+        cases += [
+            ('plot_income_mean', lambda: plot.plot_income_mean(income_mean, save('a')), 1),
+            ('plot_income_population',
+             lambda: plot.plot_income_population(data, 5, save('b')), 1),
+            ('plot_avg_population_bedrooms_gt_n',
+             lambda: plot.plot_avg_population_bedrooms_gt_n(data, n, save_path=save('c')), 1),
+            ('plot_income_density_bar',
+             lambda: plot.plot_income_density_bar(['a', 'b'], [1, 2], save('d')), 1),
+            ('plot_avg_house_value_bedrooms_gt_n',
+             lambda: plot.plot_avg_house_value_bedrooms_gt_n(data, n, save_path=save('e')), 1),
+            ('plot_income_vs_bedrooms', lambda: plot.plot_income_vs_bedrooms(*bedrooms, save('f')), 1),
+            ('plot_frequency', lambda: plot.plot_frequency(column_names, data, save('g')), 1),
+            ('plot_statistics_bar', lambda: plot.plot_statistics_bar(column_names, data, save('h')), 1),
+        ]
+    return cases
+
+def speedup_report(data, column_names, worker_counts=None, repeat=3):
+
+    """
+    Time the column-parallel operations and a batch of threshold queries
+    with different worker counts, relative to one worker.
+
+    Args:
+    - data (numpy.ndarray): Input data.
+    - column_names (list): List of column names.
+    - worker_counts (sequence): Worker counts, defaults to 1, 2, 4, ...
+      up to the CPU count.
+    - repeat (int): Number of timed runs, the best is kept.
+
+    Returns:
+    - report (dict): 'cpus' and, per operation and mode, the 'seconds',
+      'speedup' over one worker and 'efficiency' (speed-up per core used)
+      for every worker count.
+    """
+
+    cpus = os.cpu_count() or 1
+    if worker_counts is None:
+        worker_counts = sorted({1, cpus} | {2 ** i for i in range(1, cpus.bit_length())})
+    queries = [(name, n) for name in ('calculate_avg_population_bedrooms_gt_n',
+                                      'calculate_avg_house_value_bedrooms_gt_n',
+                                      'calculate_avg_income_bedrooms_gt_n')
+               for n in range(1, 9)]
+
+    def threshold_batch(workers):
+        parallel.map_tasks(lambda q: getattr(analysis, q[0])(data, q[1]), queries, workers)
+
+    operations = {
+        ('describe', 'thread'): lambda w: analysis.describe.__wrapped__(data, column_names,
+                                                                        workers=w),
+        ('describe', 'process'): lambda w: analysis.describe.__wrapped__(data, column_names,
+                                                                         workers=w, mode='process'),
+        ('histograms', 'thread'): lambda w: parallel.map_columns(
+            downsample.histogram_counts, data, range(data.shape[1]), workers=w),
+        ('medians', 'thread'): lambda w: parallel.map_columns(
+            np.median, data, range(data.shape[1] - 2), workers=w),
+        ('threshold_batch', 'thread'): threshold_batch,
+    }
+    report = {'cpus': cpus}
+    for (name, mode), func in operations.items():
+        timings = {}
+        for workers in worker_counts:
+            timings[workers] = measure(lambda: func(workers), repeat)['seconds']
+        report[f'{name}_{mode}'] = {
+            str(workers): {'seconds': seconds, 'speedup': timings[1] / seconds,
+                           'efficiency': timings[1] / seconds / min(workers, cpus)}
+            for workers, seconds in timings.items()}
+    return report
+
+# Partitioned layouts compared by partition_report: write_partitioned options
+PARTITION_LAYOUTS = {
+    'row_ranges': {},
+    'by_ocean_proximity': {'by': 'ocean_proximity'},
+    'ordered_by_population': {'order_by': 'population'},
+}
+
+def partition_report(path, out_dir, repeat=3):
+
+    """
+    Time the threshold queries and the income/population selection on
+    partitioned copies of a dataset, with the partitions each one scanned
+    and pruned.
+
+    Args:
+    - path (str): Dataset CSV file.
+    - out_dir (str): Directory the partitioned copies are written to.
+    - repeat (int): Number of timed runs, the best is kept.
+
+    Returns:
+    - report (dict): Per layout of PARTITION_LAYOUTS, the number of
+      'partitions' and, per query, its 'seconds' and scan counts (see
+      PartitionedDataset.last_scan).
+    """
+
+    loaded = analysis.load_table(path)
+    n = 3
+    queries = {name: (lambda dataset, func=getattr(analysis, name): func(dataset, n))
+               for name in ('calculate_avg_population_bedrooms_gt_n',
+                            'calculate_avg_house_value_bedrooms_gt_n',
+                            'calculate_avg_income_bedrooms_gt_n')}
+    queries.update({name: (lambda dataset, func=getattr(analysis, name): func(dataset))
+                    for name in ('calculate_avg_income_rooms_gt_3',
+                                 'calculate_avg_population_high_density',
+                                 'calculate_avg_house_value_high_density')})
+    queries['select_income_population'] = lambda dataset: query.select(
+        dataset, [('median_income', '>', 5)], ['median_income', 'population'])
+
+    report = {}
+    for layout, options in PARTITION_LAYOUTS.items():
+        dataset = partition.write_partitioned(loaded, os.path.join(out_dir, layout), **options)
+        report[layout] = {'partitions': len(dataset.partitions)}
+        for name, func in queries.items():
+            timing = measure(lambda: func(dataset), repeat)
+            report[layout][name] = {'seconds': timing['seconds'], **dataset.last_scan}
+    return report
+
+def run_benchmarks(sizes=DEFAULT_SIZES, data_dir='bench_data', plots=True, seed=0,
+                   speedup=False, compact=False, partitioned=False):
+
+    """
+    Run every benchmark on synthetic datasets of the given sizes.
+
+    Args:
+    - sizes (sequence): Row counts.
+    - data_dir (str): Directory of the generated datasets.
+    - plots (bool): Also benchmark the plot functions.
+    - seed (int): Seed of the generated datasets.
+    - speedup (bool): Also report the multi-core speed-up, see
+      speedup_report.
+    - compact (bool): Also report the memory and accuracy of the compact
+      mode, see analysis.measure_compact.
+    - partitioned (bool): Also time queries on partitioned copies of the
+      data, see partition_report.
+
+    Returns:
+    - results (dict): 'meta' about the run and 'results', mapping each size
+      (as a string) to the measurement of every operation; with speedup,
+      'speedup' maps each size to its speed-up report, and with compact,
+      'compact' to its compact mode report, and with partitioned,
+      'partitioned' to its partition report.
+    """
+
+    results = {}
+    speedups = {}
+    compact_reports = {}
+    partition_reports = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for rows in sizes:
+            path = dataset_path(rows, data_dir, seed)
+            data, column_names = analysis.load_data(path)
+            results[str(rows)] = {}
+            results[str(rows)]['time_to_first_prompt'] = time_to_first_prompt(path)
+            for name, func, repeat in benchmark_cases(path, data, column_names, out_dir, plots):
+                results[str(rows)][name] = measure(func, repeat)
+                print(f"{rows:>10} rows  {name:<50} "
+                      f"{results[str(rows)][name]['seconds']:10.4f}s", file=sys.stderr)
+            if speedup:
+                speedups[str(rows)] = speedup_report(data, column_names)
+                for name, timings in list(speedups[str(rows)].items())[1:]:
+                    for workers, timing in timings.items():
+                        print(f"{rows:>10} rows  {name:<30} {workers:>3} workers "
+                              f"{timing['seconds']:10.4f}s  x{timing['speedup']:.2f}",
+                              file=sys.stderr)
+            if compact:
+                compact_reports[str(rows)] = analysis.measure_compact(path)
+                print(f"{rows:>10} rows  compact data "
+                      f"{compact_reports[str(rows)]['compact_data_bytes'] / 1e6:.1f} MB instead of "
+                      f"{compact_reports[str(rows)]['data_bytes'] / 1e6:.1f} MB, max relative error "
+                      f"{max(compact_reports[str(rows)]['max_relative_error'].values()):.2e}",
+                      file=sys.stderr)
+            if partitioned:
+                partition_reports[str(rows)] = partition_report(path, out_dir)
+                for layout, timings in partition_reports[str(rows)].items():
+                    for name, timing in list(timings.items())[1:]:
+                        print(f"{rows:>10} rows  {layout:<22} {name:<42} "
+                              f"{timing['seconds']:10.4f}s  scanned "
+                              f"{timing['partitions_scanned']}/{timing['partitions']}, pruned "
+                              f"{timing['partitions_pruned']}", file=sys.stderr)
+
+    meta = {'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    output = {'meta': meta, 'results': results}
+    if speedup:
+        output['speedup'] = speedups
+    if compact:
+        output['compact'] = compact_reports
+    if partitioned:
+        output['partitioned'] = partition_reports
+    return output
+
+def compare(results, baseline, threshold=0.2, min_seconds=0.001):
+
+    """
+    Compare benchmark results with a stored baseline.
+
+    Args:
+    - results (dict): Output of run_benchmarks.
+    - baseline (dict): Earlier output of run_benchmarks.
+    - threshold (float): Allowed relative slowdown, e.g. 0.2 for 20%.
+    - min_seconds (float): Timings below this are too noisy to compare.
+
+    Returns:
+    - regressions (list): One dict per operation slower than allowed, with
+      the size, operation name, baseline and current seconds and ratio.
+    """
+
+    regressions = []
+    for rows, operations in results['results'].items():
+        for name, current in operations.items():
+            previous = baseline['results'].get(rows, {}).get(name)
+            if previous is None or max(previous['seconds'], current['seconds']) < min_seconds:
+                continue
+            ratio = current['seconds'] / previous['seconds'] if previous['seconds'] else np.inf
+            if ratio > 1 + threshold:
+                regressions.append({'rows': rows, 'operation': name,
+                                    'baseline_seconds': previous['seconds'],
+                                    'seconds': current['seconds'], 'ratio': ratio})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark loading, statistics, queries, group-by and plotting '
+                    'on synthetic housing datasets.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--data-dir', default='bench_data', help='Generated datasets directory')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-plots', action='store_true', help='Skip the plot benchmarks')
+    parser.add_argument('--speedup', action='store_true',
+                        help='Report the multi-core speed-up of the parallel operations')
+    parser.add_argument('--compact', action='store_true',
+                        help='Report memory and accuracy of the compact dtype mode')
+    parser.add_argument('--partitioned', action='store_true',
+                        help='Time queries on partitioned copies with zone map pruning')
+    parser.add_argument('-o', '--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='Earlier results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed relative slowdown before a regression is reported')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.data_dir, not args.no_plots, args.seed,
+                             args.speedup, args.compact, args.partitioned)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['rows']} rows {r['operation']}: {r['baseline_seconds']:.4f}s -> "
+                  f"{r['seconds']:.4f}s ({r['ratio']:.2f}x)", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
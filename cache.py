@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Bump whenever the on-disk layout changes so stale caches are rebuilt.
+CACHE_VERSION = 2
+MANIFEST_NAME = 'manifest.json'
+
+def cache_dir_for(filename):
+
+    """
+    Return the cache directory used for a CSV file.
+
+    The cache lives next to the source file, e.g. 'data/housing.csv' is
+    cached in 'data/.housing_cache/'.
+
+    Args:
+    - filename (str): Path to the CSV file.
+
+    Returns:
+    - cache_dir (str): Path to the cache directory.
+    """
+
+    directory, base = os.path.split(os.path.abspath(filename))
+    stem = os.path.splitext(base)[0]
+    return os.path.join(directory, f'.{stem}_cache')
+
+def file_checksum(filename, block_size=1 << 20):
+
+    """
+    Compute the SHA-1 checksum of a file, reading it in blocks.
+
+    Args:
+    - filename (str): Path to the file.
+    - block_size (int): Number of bytes read per block.
+
+    Returns:
+    - checksum (str): Hex digest of the file contents.
+    """
+
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_manifest(cache_dir):
+
+    """
+    Read the JSON manifest of a cache directory.
+
+    Args:
+    - cache_dir (str): Path to the cache directory.
+
+    Returns:
+    - manifest (dict or None): Parsed manifest, or None if it is missing
+      or unreadable.
+    """
+
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def is_cache_fresh(filename, manifest):
+
+    """
+    Check whether a cache manifest still matches its source CSV file.
+
+    Size and modification time are compared first; if only the
+    modification time differs the checksum decides, so touching the file
+    does not force a rebuild (load_columns then records the new
+    modification time, see refresh_stamp).
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - manifest (dict or None): Manifest returned by read_manifest.
+
+    Returns:
+    - fresh (bool): True if the cache can be used as is.
+    """
+
+    if manifest is None or manifest.get('version') != CACHE_VERSION:
+        return False
+    return is_source_fresh(filename, manifest['source'])
+
+def source_stamp(filename):
+
+    """
+    Return the size, modification time and checksum of a source file, as
+    recorded in cache manifests.
+    """
+
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'checksum': file_checksum(filename)}
+
+def is_source_fresh(filename, source):
+
+    """
+    Check whether a source file still matches its stamp, see
+    is_cache_fresh.
+
+    Args:
+    - filename (str): Path to the source file.
+    - source (dict or None): Stamp returned by source_stamp.
+
+    Returns:
+    - fresh (bool): True if the file is unchanged.
+    """
+
+    if not source:
+        return False
+    stat = os.stat(filename)
+    if stat.st_size != source['size']:
+        return False
+    if stat.st_mtime_ns == source['mtime_ns']:
+        return True
+    return file_checksum(filename) == source['checksum']
+
+def refresh_stamp(filename, source):
+
+    """
+    Record the current modification time of a source file in its stamp,
+    after is_source_fresh accepted it by checksum, so later checks skip
+    the checksum again.
+
+    Args:
+    - filename (str): Path to the source file.
+    - source (dict): Stamp returned by source_stamp, updated in place.
+
+    Returns:
+    - changed (bool): True if the stamp was updated and should be saved.
+    """
+
+    mtime_ns = os.stat(filename).st_mtime_ns
+    if source['mtime_ns'] == mtime_ns:
+        return False
+    source['mtime_ns'] = mtime_ns
+    return True
+
+def write_cache(filename, columns, column_names, categories=None):
+
+    """
+    Write a loaded dataset to the columnar cache of its CSV file.
+
+    Every column is stored as its own '.npy' file in its own dtype and a
+    JSON manifest records column names, dtypes, category names, row count
+    and the source size, mtime and checksum. The manifest is written last
+    so an interrupted write is never mistaken for a complete cache.
+
+    Args:
+    - filename (str): Path to the source CSV file.
+    - columns (list): One 1-D numpy array per column.
+    - column_names (list): List of column names.
+    - categories (dict): Category names of each categorical column.
+
+    Returns:
+    - cache_dir (str): Path to the cache directory.
+    """
+
+    cache_dir = cache_dir_for(filename)
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    entries = []
+    for i, (name, column) in enumerate(zip(column_names, columns)):
+        column_file = f'{i:03d}.npy'
+        np.save(os.path.join(cache_dir, column_file), np.ascontiguousarray(column))
+        entries.append({'name': name, 'dtype': column.dtype.str, 'file': column_file})
+
+    manifest = {
+        'version': CACHE_VERSION,
+        'rows': int(len(columns[0])) if columns else 0,
+        'columns': entries,
+        'categories': dict(categories or {}),
+        'source': source_stamp(filename),
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return cache_dir
+
+def load_columns(filename):
+
+    """
+    Load the cached columns of a CSV file as read-only memory maps.
+
+    Args:
+    - filename (str): Path to the source CSV file.
+
+    Returns:
+    - columns (list or None): One memory-mapped numpy array per column,
+      or None if there is no fresh cache.
+    - column_names (list or None): List of column names.
+    - categories (dict or None): Category names of each categorical column.
+    """
+
+    cache_dir = cache_dir_for(filename)
+    manifest = read_manifest(cache_dir)
+    if not is_cache_fresh(filename, manifest):
+        return None, None, None
+
+    try:
+        columns = [np.load(os.path.join(cache_dir, column['file']), mmap_mode='r')
+                   for column in manifest['columns']]
+    except (OSError, ValueError):
+        return None, None, None
+
+    if any(column.shape != (manifest['rows'],) for column in columns):
+        return None, None, None
+
+    if refresh_stamp(filename, manifest['source']):
+        # Replace the manifest in one step so readers never see it half written
+        try:
+            temporary = os.path.join(cache_dir, MANIFEST_NAME + '.tmp')
+            with open(temporary, 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(temporary, os.path.join(cache_dir, MANIFEST_NAME))
+        except OSError:
+            pass
+
+    column_names = [column['name'] for column in manifest['columns']]
+    return columns, column_names, manifest['categories']
@@ -0,0 +1,404 @@
+import argparse
+import csv
+import json
+import math
+import os
+import shlex
+import sys
+import time
+
+import numpy as np
+import analysis
+import cube
+import derived
+import groupby
+import instrument
+import memo
+import parallel
+import report
+
+# Thresholded averages of the "Generalized Analysis" menu, by query name
+# (function names, looked up at call time so instrumentation sees the calls)
+THRESHOLD_QUERIES = {
+    'population_bedrooms_gt_n': 'calculate_avg_population_bedrooms_gt_n',
+    'house_value_bedrooms_gt_n': 'calculate_avg_house_value_bedrooms_gt_n',
+    'income_bedrooms_gt_n': 'calculate_avg_income_bedrooms_gt_n',
+}
+FIXED_QUERIES = {
+    'income_rooms_gt_3': 'calculate_avg_income_rooms_gt_3',
+    'population_high_density': 'calculate_avg_population_high_density',
+    'house_value_high_density': 'calculate_avg_house_value_high_density',
+}
+AVG_QUERIES = ('income_mean',) + tuple(THRESHOLD_QUERIES) + tuple(FIXED_QUERIES)
+
+class QueryError(Exception):
+    pass
+
+class QueryParser(argparse.ArgumentParser):
+
+    """
+    Query parser that raises QueryError instead of printing usage or help
+    and exiting, so one bad batch line or service request cannot stop the
+    others. Subcommand parsers are made of the same class.
+    """
+
+    def error(self, message):
+        raise QueryError(message)
+
+    def print_help(self, file=None):
+        raise QueryError(f"help is not available here; {self.format_usage().strip()}")
+
+    def exit(self, status=0, message=None):
+        raise QueryError(message.strip() if message else 'invalid query')
+
+def to_jsonable(value):
+
+    """
+    Convert numpy values and containers into plain JSON types; NaN and
+    infinities become None.
+    """
+
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+def flatten(value, prefix=''):
+
+    """
+    Flatten a nested result into (key, value) pairs, joining keys with '.'.
+    """
+
+    if isinstance(value, dict):
+        for k, v in value.items():
+            yield from flatten(v, f'{prefix}.{k}' if prefix else str(k))
+    elif isinstance(value, list):
+        for i, v in enumerate(value):
+            yield from flatten(v, f'{prefix}.{i}' if prefix else str(i))
+    else:
+        yield prefix, value
+
+# Query commands. Each takes the parsed arguments and the loaded session
+# (see analysis.load_session) and returns a JSON-serializable result.
+
+def cmd_stats(args, session):
+    data, column_names = session['data'], session['column_names']
+    summary = analysis.describe(data, column_names)
+    if args.columns:
+        summary = {col: summary[col] if col in summary else
+                   analysis.describe_column(derived.values(data, col, column_names))
+                   for col in args.columns}
+    return to_jsonable(summary)
+
+def cmd_missing(args, session):
+    return analysis.count_missing_values(session['data'], session['column_names'],
+                                         session['validity'])
+
+def cmd_avg(args, session):
+    data, index = session['data'], session['index']
+    if args.query == 'income_mean':
+        return to_jsonable(analysis.calculate_income_mean(data))
+    if args.query in FIXED_QUERIES:
+        return to_jsonable(getattr(analysis, FIXED_QUERIES[args.query])(data, index))
+    if not args.n:
+        raise ValueError(f"'{args.query}' needs at least one -n value")
+    query = getattr(analysis, THRESHOLD_QUERIES[args.query])
+    return to_jsonable({n: query(data, n, index) for n in args.n})
+
+def cmd_groupby(args, session):
+    data, column_names, table = session['data'], session['column_names'], session['table']
+    keys = derived.values(data, args.key, column_names)
+    categories = table.categories.get(args.key) if args.bins is None else None
+    group_keys, result = groupby.group_by(keys, derived.values(data, args.value, column_names),
+                                          args.agg, bins=args.bins, categories=categories)
+    return to_jsonable({name: dict(zip(group_keys.tolist(), values.tolist()))
+                        for name, values in result.items()})
+
+def nest(keys, values):
+
+    """
+    Turn an array with one axis per key list into nested dicts.
+    """
+
+    if not keys:
+        return values.item() if isinstance(values, np.ndarray) else values
+    return {key: nest(keys[1:], value) for key, value in zip(keys[0].tolist(), values)}
+
+def cmd_cube(args, session):
+    where = {}
+    for condition in args.where or []:
+        dimension, _, value = condition.partition('=')
+        if not value:
+            raise ValueError(f"Expected DIMENSION=VALUE, got '{condition}'")
+        where.setdefault(dimension, []).append(value)
+    keys, result = session['cube'].query(args.value, args.agg, args.by, where)
+    return to_jsonable({name: nest(keys, values) for name, values in result.items()})
+
+def cmd_bbox(args, session):
+    return to_jsonable(session['grid'].query_bbox(*args.box))
+
+def cmd_radius(args, session):
+    return to_jsonable(session['grid'].query_radius(args.lon, args.lat, args.km))
+
+def cmd_plot(args, session):
+    suffix = {'population_bedrooms_gt_n': f'_{args.n:g}', 'house_value_bedrooms_gt_n': f'_{args.n:g}',
+              'income_population': f'_{args.threshold:g}'}.get(args.name, '')
+    os.makedirs(args.out_dir, exist_ok=True)
+    return report.render_chart(f'{args.name}{suffix}', args.name,
+                               {'n': args.n, 'income_threshold': args.threshold,
+                                'scatter_mode': args.scatter_mode},
+                               args.out_dir, args.image_format, session)
+
+def add_query_commands(subparsers):
+
+    """
+    Register the query subcommands on an argparse subparsers object.
+    """
+
+    stats = subparsers.add_parser('stats', help='Statistics for all attributes')
+    stats.add_argument('--columns', nargs='+',
+                       help='Only report these columns (stored or derived)')
+    stats.set_defaults(func=cmd_stats)
+
+    missing = subparsers.add_parser('missing', help='Missing value counts per column')
+    missing.set_defaults(func=cmd_missing)
+
+    avg = subparsers.add_parser('avg', help='Income mean and thresholded averages')
+    avg.add_argument('query', choices=AVG_QUERIES)
+    avg.add_argument('-n', type=float, nargs='+', help='Bedroom thresholds for *_gt_n queries')
+    avg.set_defaults(func=cmd_avg)
+
+    group = subparsers.add_parser('groupby', help='Aggregate a column per key value')
+    group.add_argument('--key', required=True, help='Key column name (stored or derived)')
+    group.add_argument('--value', required=True,
+                       help='Aggregated column name (stored or derived)')
+    group.add_argument('--agg', nargs='+', default=['mean'], choices=groupby.AGGREGATIONS)
+    group.add_argument('--bins', type=float, nargs='+', help='Bin edges for numeric keys')
+    group.set_defaults(func=cmd_groupby)
+
+    rollup = subparsers.add_parser(
+        'cube', help='Slice, dice and roll up the pre-aggregated data cube')
+    rollup.add_argument('--value', default=cube.DEFAULT_MEASURES[0], help='Measure column name')
+    rollup.add_argument('--by', nargs='*', default=[],
+                        choices=[column for column, _ in cube.DEFAULT_DIMENSIONS],
+                        help='Dimensions kept in the result; the others are rolled up')
+    rollup.add_argument('--agg', nargs='+', default=['mean'], choices=cube.AGGREGATIONS)
+    rollup.add_argument('--where', nargs='+', metavar='DIMENSION=VALUE',
+                        help='Keep only these key values (lower bin edges for binned '
+                             'dimensions); repeat a dimension for several values')
+    rollup.set_defaults(func=cmd_cube)
+
+    bbox = subparsers.add_parser('bbox', help='Aggregate values inside a bounding box')
+    bbox.add_argument('box', type=float, nargs=4,
+                      metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'))
+    bbox.set_defaults(func=cmd_bbox)
+
+    radius = subparsers.add_parser('radius', help='Aggregate values within a radius of a point')
+    radius.add_argument('lon', type=float)
+    radius.add_argument('lat', type=float)
+    radius.add_argument('km', type=float, help='Radius in kilometres')
+    radius.set_defaults(func=cmd_radius)
+
+    chart = subparsers.add_parser('plot', help='Render a chart to a file')
+    chart.add_argument('name', choices=report.PLOTS)
+    chart.add_argument('-n', type=float, default=3, help='Bedroom threshold')
+    chart.add_argument('--threshold', type=float, default=5, help='Income threshold')
+    chart.add_argument('--out-dir', default='reports')
+    chart.add_argument('--image-format', choices=('png', 'svg', 'pdf'), default='png')
+    chart.add_argument('--scatter-mode', choices=('auto', 'scatter', 'sample', 'density'),
+                       default='auto', help='How scatter charts draw large row counts')
+    chart.set_defaults(func=cmd_plot)
+
+def build_parser():
+
+    """
+    Build the command-line parser: global options plus one query
+    subcommand, or 'batch' to run a file of queries.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='main.py',
+        description='Run California housing analyses without the interactive menu.')
+    parser.add_argument('--data', default='data/housing.csv', help='Path to the dataset CSV')
+    parser.add_argument('-o', '--output', default='-', help="Output file, '-' for stdout")
+    parser.add_argument('--format', choices=('json', 'csv'), default='json')
+    parser.add_argument('--remove-missing', action='store_true',
+                        help='Replace missing values with 0 before the queries')
+    parser.add_argument('--no-cache', action='store_true', help='Always parse the CSV file')
+    parser.add_argument('--compact', action='store_true',
+                        help='Store the data in compact types (float32, int32, uint16)')
+    parser.add_argument('--instrument', action='store_true',
+                        help='Record per-function call counts, time, rows and memory')
+    parser.add_argument('--profile-dir', help='Write a cProfile dump per query to this directory')
+    parser.add_argument('--workers', type=int,
+                        help='Threads running the queries of a batch, defaults to the CPU count')
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    add_query_commands(subparsers)
+    batch = subparsers.add_parser(
+        'batch', help="Run many queries, one command line per line of a file ('-' for stdin)")
+    batch.add_argument('file')
+
+    charts = subparsers.add_parser(
+        'report', help='Render every chart to files in parallel worker processes')
+    charts.add_argument('--out-dir', default='reports')
+    charts.add_argument('--image-format', choices=('png', 'svg', 'pdf'), default='png')
+    charts.add_argument('--workers', type=int, help='Worker processes, defaults to the CPU count')
+    charts.add_argument('-n', type=float, default=3, help='Bedroom threshold')
+    charts.add_argument('--threshold', type=float, default=5, help='Income threshold')
+    return parser
+
+def build_query_parser(parser_class=argparse.ArgumentParser):
+    parser = parser_class(prog='batch query', add_help=False)
+    add_query_commands(parser.add_subparsers(dest='command', required=True))
+    return parser
+
+def read_queries(args):
+
+    """
+    Return the parsed queries to run: the single query from the command
+    line, or every non-empty, non-comment line of the batch file. A batch
+    line that does not parse gives its QueryError instead of the parsed
+    arguments, so the other lines still run.
+    """
+
+    if args.command != 'batch':
+        label = ' '.join([args.command] + [getattr(args, key) for key in ('query', 'name')
+                                           if hasattr(args, key)])
+        return [(label, args)]
+
+    if args.file == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(args.file, 'r') as f:
+            lines = f.read().splitlines()
+
+    query_parser = build_query_parser(QueryParser)
+    queries = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            try:
+                queries.append((line, query_parser.parse_args(shlex.split(line))))
+            except (QueryError, ValueError) as e:
+                queries.append((line, QueryError(str(e))))
+    return queries
+
+def write_output(report, args):
+
+    """
+    Write the report as JSON, or as CSV rows of (query, key, value).
+    """
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        if args.format == 'json':
+            json.dump(report, out, indent=2)
+            out.write('\n')
+        else:
+            writer = csv.writer(out)
+            writer.writerow(['query', 'key', 'value'])
+            for entry in report['results']:
+                for key, value in flatten(entry['result']):
+                    writer.writerow([entry['query'], key, value])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+def run_report(args):
+
+    """
+    Render the full chart report and write the per-chart paths and timings.
+    """
+
+    result = report.render_report(args.data, args.out_dir, args.image_format, args.workers,
+                                  args.n, args.threshold, not args.no_cache, args.remove_missing)
+    if result is None:
+        return 1
+    write_output({'dataset': args.data,
+                  'results': [{'query': f"report {entry['chart']}", 'result': entry}
+                              for entry in result['charts']],
+                  'timing': {'total_seconds': result['total_seconds']}}, args)
+    print(f"Rendered {len(result['charts'])} charts in {result['total_seconds']:.2f}s",
+          file=sys.stderr)
+    return 0
+
+def main(argv=None):
+
+    """
+    Command-line entry point. Loads the dataset once, runs every query
+    against it, writes the results and reports throughput on stderr.
+
+    Parameters:
+    argv (list): Command-line arguments, defaults to sys.argv[1:].
+
+    Returns:
+    status (int): Exit status.
+    """
+
+    args = build_parser().parse_args(argv)
+    instrument.enable_from_env()
+    if args.instrument:
+        instrument.enable()
+    if args.profile_dir:
+        instrument.enable_profiling(args.profile_dir)
+    if args.command == 'report':
+        return run_report(args)
+    queries = read_queries(args)
+
+    start = time.perf_counter()
+    session = analysis.load_session(args.data, not args.no_cache, args.remove_missing,
+                                      args.compact)
+    if session is None:
+        return 1
+    load_seconds = time.perf_counter() - start
+
+    def run_query(item):
+        text, query = item
+        try:
+            with instrument.profile_operation(text):
+                return {'query': text, 'result': query.func(query, session)}
+        except (ValueError, KeyError) as e:
+            return {'query': text, 'error': str(e), 'result': None}
+
+    # Queries run in threads on the shared session, except charts (matplotlib
+    # is not thread-safe) and everything while instrumenting or profiling
+    workers = 1 if instrument.is_enabled() or instrument.is_profiling() else args.workers
+    results = [None] * len(queries)
+    for i, (text, query) in enumerate(queries):
+        if isinstance(query, QueryError):
+            results[i] = {'query': text, 'error': str(query), 'result': None}
+    threaded = [i for i, (_, query) in enumerate(queries)
+                if results[i] is None and query.command != 'plot']
+    start = time.perf_counter()
+    for i, result in zip(threaded, parallel.map_tasks(run_query, [queries[i] for i in threaded],
+                                                      workers)):
+        results[i] = result
+    for i, item in enumerate(queries):
+        if results[i] is None:
+            results[i] = run_query(item)
+    query_seconds = time.perf_counter() - start
+
+    timing = {
+        'load_seconds': load_seconds,
+        'query_seconds': query_seconds,
+        'queries': len(queries),
+        'queries_per_second': len(queries) / query_seconds if query_seconds else None,
+        'result_cache': memo.stats(),
+    }
+    output = {'dataset': args.data, 'results': results, 'timing': timing}
+    if instrument.is_enabled():
+        output['instrumentation'] = instrument.report()
+    write_output(output, args)
+    print(f"Ran {len(queries)} queries in {query_seconds:.4f}s "
+          f"({timing['queries_per_second'] or 0:.1f} queries/s), load {load_seconds:.4f}s",
+          file=sys.stderr)
+    return 0 if all('error' not in entry for entry in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
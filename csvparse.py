@@ -0,0 +1,452 @@
+import contextlib
+import locale
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import parallel
+import table
+from table import CATEGORICAL_COLUMNS, MISSING_CODE, Table
+
+# Files smaller than this are parsed in this process
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+# Smallest byte range given to a worker
+MIN_RANGE_BYTES = 4 * 1024 * 1024
+# Byte ranges per worker, so that faster workers take more of the file
+RANGES_PER_WORKER = 4
+# Malformed rows listed in an error message
+MAX_REPORTED_LINES = 10
+# Longest field and most digits of the array-arithmetic number parsing;
+# 15 digits keep the mantissa below 2 ** 53
+FAST_WIDTH = 24
+FAST_DIGITS = 15
+# Exact powers of ten, as doubles
+POWERS_OF_TEN = np.array([float(10 ** k) for k in range(FAST_WIDTH)])
+
+class MalformedRowsError(ValueError):
+
+    """
+    Rows with the wrong number of fields, by 1-based line number of the
+    file (the header is line 1).
+    """
+
+    def __init__(self, filename, lines, num_columns):
+        self.filename = filename
+        self.lines = lines
+        shown = ', '.join(str(line) for line in lines[:MAX_REPORTED_LINES])
+        more = (f' and {len(lines) - MAX_REPORTED_LINES} more'
+                if len(lines) > MAX_REPORTED_LINES else '')
+        super().__init__(f"{len(lines)} malformed rows in '{filename}' (expected {num_columns} "
+                         f"fields) at lines {shown}{more}")
+
+def byte_ranges(filename, num_ranges):
+
+    """
+    Split the rows of a CSV file into byte ranges that start and end on
+    line boundaries.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - num_ranges (int): Number of ranges wanted; fewer are returned for
+      files with long lines.
+
+    Returns:
+    - data_start (int): Byte offset of the first row, after the header.
+    - ranges (list): (start, end) byte offsets.
+    """
+
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        f.readline()
+        data_start = f.tell()
+        bounds = [data_start]
+        for i in range(1, num_ranges):
+            target = data_start + (size - data_start) * i // num_ranges
+            if target <= bounds[-1]:
+                continue
+            f.seek(target - 1)
+            f.readline()
+            if bounds[-1] < f.tell() < size:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return data_start, list(zip(bounds[:-1], bounds[1:]))
+
+def _read_range(filename, start, end):
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+def _split_lines(raw):
+    # Lines of a byte range, with the newline handling of text mode
+    text = raw.decode(locale.getpreferredencoding(False))
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    return lines
+
+def field_bounds(raw, num_columns):
+
+    """
+    Locate every field of a byte range whose lines all have exactly
+    num_columns fields and '\n' endings, the common case.
+
+    Args:
+    - raw (bytes): Byte range, on line boundaries.
+    - num_columns (int): Number of fields per row.
+
+    Returns:
+    - buffer (numpy.ndarray): The bytes as uint8.
+    - starts, ends (numpy.ndarray): (rows, num_columns) byte offsets of
+      the fields; both are None if a line is blank or has another number
+      of fields, or the range holds a '\r'.
+    """
+
+    buffer = np.frombuffer(raw, dtype=np.uint8)
+    if b'\r' in raw:
+        return buffer, None, None
+    delimiters = np.flatnonzero((buffer == ord(',')) | (buffer == ord('\n')))
+    if buffer.size and buffer[-1] != ord('\n'):
+        delimiters = np.append(delimiters, buffer.size)
+    if delimiters.size % num_columns:
+        return buffer, None, None
+    ends = delimiters.reshape(-1, num_columns)
+    line_ends = ends[:, -1]
+    if (np.any(buffer[ends[:, :-1]] != ord(','))
+            or np.any(buffer[line_ends[line_ends < buffer.size]] != ord('\n'))):
+        return buffer, None, None
+    starts = np.empty_like(delimiters)
+    starts[:1] = 0
+    starts[1:] = delimiters[:-1] + 1
+    return buffer, starts.reshape(-1, num_columns), ends
+
+def count_range(filename, start, end, num_columns):
+
+    """
+    Count the lines and the non-blank rows of a byte range.
+
+    Returns:
+    - lines (int): Number of lines.
+    - rows (int): Number of non-blank lines.
+    - has_comment (bool): True if the range holds a '#', which
+      np.genfromtxt treats as the start of a comment.
+    """
+
+    raw = _read_range(filename, start, end)
+    _, starts, _ = field_bounds(raw, num_columns)
+    if starts is not None:
+        return starts.shape[0], starts.shape[0], b'#' in raw
+    lines = _split_lines(raw)
+    return len(lines), sum(1 for line in lines if line.strip()), b'#' in raw
+
+def _to_float(fields):
+    # Convert field strings like np.genfromtxt: missing and unparsable
+    # values become NaN. Returns the values and the positions of unparsable
+    # (non-blank) fields.
+    result = np.empty(len(fields))
+    invalid = []
+    for i, field in enumerate(fields):
+        try:
+            result[i] = float(field) if field else np.nan
+        except ValueError:
+            result[i] = np.nan
+            if field.strip():
+                invalid.append(i)
+    return result, invalid
+
+def parse_numbers(buffer, starts, ends):
+
+    """
+    Convert fields of a byte buffer to float64, like np.genfromtxt.
+
+    Plain decimals ([-]digits[.digits], at most FAST_DIGITS digits) are
+    converted with array arithmetic: the digits form an integer mantissa
+    below 2 ** 53 and the result is mantissa / 10 ** decimals. Both
+    operands are exact doubles, so the one IEEE division is correctly
+    rounded and gives the same bits as float() on the text. Other fields
+    (exponents, 'nan', spaces, ...) go through float().
+
+    Args:
+    - buffer (numpy.ndarray): uint8 bytes.
+    - starts, ends (numpy.ndarray): Byte offsets of the fields.
+
+    Returns:
+    - values (numpy.ndarray): Parsed values; empty and unparsable fields
+      are NaN.
+    - invalid (list): Positions of unparsable, non-blank fields.
+    """
+
+    lengths = ends - starts
+    values = np.full(starts.size, np.nan)
+    fast = (lengths > 0) & (lengths <= FAST_WIDTH)
+    width = int(lengths[fast].max()) if np.any(fast) else 0
+    if width:
+        positions = starts[:, None] + np.arange(width)
+        inside = positions < ends[:, None]
+        chars = np.where(inside, buffer[np.minimum(positions, buffer.size - 1)], 0)
+        negative = chars[:, 0] == ord('-')
+        body = inside.copy()
+        body[:, 0] &= ~negative
+        digits = body & (chars >= ord('0')) & (chars <= ord('9'))
+        dots = body & (chars == ord('.'))
+        num_digits = digits.sum(axis=1)
+        fast &= ~np.any(body & ~digits & ~dots, axis=1)
+        fast &= (dots.sum(axis=1) <= 1) & (num_digits >= 1) & (num_digits <= FAST_DIGITS)
+
+        mantissa = np.zeros(starts.size, dtype=np.int64)
+        for k in range(width):
+            mantissa = np.where(digits[:, k], mantissa * 10 + (chars[:, k] - ord('0')), mantissa)
+        decimals = (digits & (np.cumsum(dots, axis=1) > 0)).sum(axis=1)
+        parsed = mantissa.astype(np.float64) / POWERS_OF_TEN[decimals]
+        parsed[negative] = -parsed[negative]
+        values[fast] = parsed[fast]
+
+    slow = np.flatnonzero(~fast & (lengths > 0))
+    encoding = locale.getpreferredencoding(False)
+    fields = [bytes(buffer[starts[i]:ends[i]]).decode(encoding) for i in slow]
+    values[slow], invalid = _to_float(fields)
+    return values, [int(slow[i]) for i in invalid]
+
+def parse_categories(buffer, starts, ends):
+
+    """
+    Dictionary-encode fields of a byte buffer, like
+    table.encode_categories on their text.
+
+    Returns:
+    - codes (numpy.ndarray): uint8 code of each field.
+    - categories (list): Sorted distinct non-empty values.
+    """
+
+    width = max(int((ends - starts).max()) if starts.size else 0, 1)
+    positions = starts[:, None] + np.arange(width)
+    chars = np.where(positions < ends[:, None],
+                     buffer[np.minimum(positions, buffer.size - 1)], 0).astype(np.uint8)
+    labels, inverse = np.unique(chars.view(f'S{width}').ravel(), return_inverse=True)
+    encoding = locale.getpreferredencoding(False)
+    label_codes, categories = table.encode_categories(
+        [label.decode(encoding) for label in labels.tolist()])
+    return label_codes[inverse], categories
+
+def parse_range(filename, start, end, first_line, column_names, numeric_out, codes_out):
+
+    """
+    Parse the rows of a byte range into preallocated output arrays.
+
+    Ranges where every line has all its fields are parsed with array
+    operations on the bytes (see parse_numbers); others, e.g. with blank
+    lines or '\r\n' endings, line by line.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - start, end (int): Byte range, on line boundaries.
+    - first_line (int): Line number of the first line of the range.
+    - column_names (list): Column names from the header.
+    - numeric_out (numpy.ndarray): (numeric columns, rows of the range)
+      float64 output.
+    - codes_out (numpy.ndarray): (categorical columns, rows of the range)
+      uint8 output of the category codes, local to the range.
+
+    Returns:
+    - categories (list): Local category names of each categorical column.
+    - malformed (list): Line numbers of rows with the wrong field count;
+      nothing is written if there are any.
+    - invalid (list): Line numbers of rows with unparsable numbers.
+    """
+
+    num_columns = len(column_names)
+    raw = _read_range(filename, start, end)
+    buffer, starts, ends = field_bounds(raw, num_columns)
+    if starts is not None:
+        columns = [(starts[:, i], ends[:, i]) for i in range(num_columns)]
+        line_numbers = None
+
+        def parse_column(i, name):
+            if name in CATEGORICAL_COLUMNS:
+                return parse_categories(buffer, *columns[i])
+            return parse_numbers(buffer, *columns[i])
+    else:
+        lines = _split_lines(raw)
+        rows = [line for line in lines if line.strip()]
+        line_numbers = [first_line + i for i, line in enumerate(lines) if line.strip()]
+        malformed = [line_numbers[row] for row, line in enumerate(rows)
+                     if line.count(',') != num_columns - 1]
+        if malformed:
+            return [], malformed, []
+        fields = ','.join(rows).split(',') if rows else []
+
+        def parse_column(i, name):
+            values = fields[i::num_columns]
+            if name in CATEGORICAL_COLUMNS:
+                return table.encode_categories(values)
+            return _to_float(values)
+
+    categories = []
+    invalid = set()
+    numeric = categorical = 0
+    for i, name in enumerate(column_names):
+        if name in CATEGORICAL_COLUMNS:
+            codes_out[categorical], names = parse_column(i, name)
+            categories.append(names)
+            categorical += 1
+        else:
+            numeric_out[numeric], bad = parse_column(i, name)
+            invalid.update(line_numbers[row] if line_numbers else first_line + row
+                           for row in bad)
+            numeric += 1
+    return categories, [], sorted(invalid)
+
+def _parse_shared(filename, start, end, first_line, column_names, row_offset, spec):
+    # Worker task: parse a range into the shared output blocks
+    numeric_name, codes_name, shapes = spec
+    numeric_memory = shared_memory.SharedMemory(name=numeric_name)
+    codes_memory = shared_memory.SharedMemory(name=codes_name)
+    numeric = np.ndarray(shapes[0], dtype=np.float64, buffer=numeric_memory.buf)
+    codes = np.ndarray(shapes[1], dtype=np.uint8, buffer=codes_memory.buf)
+    try:
+        rows = slice(row_offset, row_offset + shapes[2])
+        return parse_range(filename, start, end, first_line, column_names,
+                           numeric[:, rows], codes[:, rows])
+    finally:
+        del numeric, codes
+        numeric_memory.close()
+        codes_memory.close()
+
+def _merge_codes(codes, local_categories, row_offsets, row_counts):
+    # Remap the range-local category codes of one column, in place, to the
+    # sorted categories of the whole file, like table.encode_categories
+    merged = sorted(set().union(*local_categories))
+    if len(merged) >= MISSING_CODE:
+        raise ValueError(f"Too many categories ({len(merged)}) for a uint8 column")
+    for local, offset, rows in zip(local_categories, row_offsets, row_counts):
+        lookup = np.full(MISSING_CODE + 1, MISSING_CODE, dtype=np.uint8)
+        lookup[:len(local)] = [merged.index(value) for value in local]
+        codes[offset:offset + rows] = lookup[codes[offset:offset + rows]]
+    return merged
+
+def _copy_column(values, name, schema):
+    # Column out of the shared buffer, in its schema type if it has one
+    if schema and name in schema:
+        column = table.to_compact(values, schema[name])
+        if column is not values:
+            return column
+    return np.array(values)
+
+@contextlib.contextmanager
+def _shared_empty(shape, dtype):
+    # Uninitialized array in a new shared memory block, released on exit
+    size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    memory = shared_memory.SharedMemory(create=True, size=size)
+    array = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+    try:
+        yield memory.name, array
+    finally:
+        del array
+        try:
+            memory.close()
+        except BufferError:
+            # A view is still held by an exception traceback; the mapping
+            # goes away with it
+            pass
+        memory.unlink()
+
+def read_csv(filename, workers=None, schema=None):
+
+    """
+    Parse a CSV file into a typed table, like table.read_csv, splitting it
+    into byte ranges parsed concurrently by worker processes.
+
+    The ranges start on line boundaries. A first pass counts the rows of
+    every range; the output columns are then preallocated in shared
+    memory and every worker parses its range straight into its rows.
+    Category codes are local to a range and remapped to the sorted
+    categories of the whole file at the end. Numbers are converted with
+    the same correctly rounded parsing as np.genfromtxt, so the table is
+    identical to table.read_csv's. Files holding a '#', which
+    np.genfromtxt reads as a comment, are parsed by table.read_csv.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - workers (int): Worker processes, defaults to the CPU count; with 1,
+      or for files below PARALLEL_MIN_BYTES, the ranges are parsed in
+      this process.
+    - schema (dict): Optional storage types per column, e.g.
+      table.COMPACT_SCHEMA. Every column is converted (see
+      table.to_compact) straight from the shared parse buffer, so no
+      float64 copy of the whole table is made.
+
+    Returns:
+    - table (Table): Parsed table.
+
+    Raises:
+    - MalformedRowsError: Some rows have the wrong number of fields.
+    """
+
+    with open(filename, 'r') as f:
+        column_names = f.readline().strip().split(',')
+    categorical = [name for name in column_names if name in CATEGORICAL_COLUMNS]
+    numeric = [name for name in column_names if name not in CATEGORICAL_COLUMNS]
+
+    workers = workers or parallel.DEFAULT_WORKERS
+    size = os.path.getsize(filename)
+    if size < PARALLEL_MIN_BYTES:
+        workers = 1
+    num_ranges = max(1, min(workers * RANGES_PER_WORKER, size // MIN_RANGE_BYTES))
+    data_start, ranges = byte_ranges(filename, num_ranges if workers > 1 else 1)
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        def run(func, *columns):
+            if pool is None:
+                return list(map(func, *columns))
+            return list(pool.map(func, *columns))
+
+        names = [filename] * len(ranges)
+        counts = run(count_range, names, [s for s, _ in ranges], [e for _, e in ranges],
+                     [len(column_names)] * len(ranges))
+        if any(has_comment for _, _, has_comment in counts):
+            loaded = table.read_csv(filename)
+            return loaded.compact(schema) if schema else loaded
+        first_lines = np.cumsum([2] + [lines for lines, _, _ in counts])[:-1].tolist()
+        row_counts = [rows for _, rows, _ in counts]
+        row_offsets = np.cumsum([0] + row_counts)[:-1].tolist()
+        num_rows = sum(row_counts)
+
+        shapes = ((len(numeric), num_rows), (len(categorical), num_rows))
+        with _shared_empty(shapes[0], np.float64) as (numeric_name, numeric_data), \
+                _shared_empty(shapes[1], np.uint8) as (codes_name, codes):
+            if pool is None:
+                results = [parse_range(filename, start, end, first_line, column_names,
+                                       numeric_data[:, offset:offset + rows],
+                                       codes[:, offset:offset + rows])
+                           for (start, end), first_line, offset, rows
+                           in zip(ranges, first_lines, row_offsets, row_counts)]
+            else:
+                specs = [(numeric_name, codes_name, shapes + (rows,)) for rows in row_counts]
+                results = run(_parse_shared, names, [s for s, _ in ranges],
+                              [e for _, e in ranges], first_lines,
+                              [column_names] * len(ranges), row_offsets, specs)
+
+            malformed = [line for _, lines, _ in results for line in lines]
+            if not malformed:
+                all_categories = {}
+                for j, name in enumerate(categorical):
+                    all_categories[name] = _merge_codes(codes[j], [local[j] for local, _, _
+                                                                   in results],
+                                                        row_offsets, row_counts)
+                columns = [_copy_column(numeric_data[numeric.index(name)], name, schema)
+                           if name in numeric else np.array(codes[categorical.index(name)])
+                           for name in column_names]
+            del numeric_data, codes
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if malformed:
+        raise MalformedRowsError(filename, malformed, len(column_names))
+    invalid = [line for _, _, lines in results for line in lines]
+    if invalid:
+        shown = ', '.join(str(line) for line in invalid[:MAX_REPORTED_LINES])
+        print(f"Warning: unparsable numbers read as missing in '{filename}' "
+              f"at lines {shown}{' ...' if len(invalid) > MAX_REPORTED_LINES else ''}")
+    return Table(columns, column_names, all_categories)
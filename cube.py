@@ -0,0 +1,297 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import cache
+import derived
+import groupby
+
+# Dimensions of the default cube: (column, bin edges), None to group by
+# distinct value (category for categorical columns)
+AGE_DECADES = tuple(range(0, 70, 10))
+INCOME_BANDS = (0, 1.5, 3, 4.5, 6, np.inf)
+DEFAULT_DIMENSIONS = (
+    ('ocean_proximity', None),
+    ('housing_median_age', AGE_DECADES),
+    ('median_income', INCOME_BANDS),
+)
+DEFAULT_MEASURES = ('median_house_value',)
+
+# Statistics stored per cell and measure
+CELL_STATISTICS = ('count', 'sum', 'sum_squares', 'min', 'max')
+AGGREGATIONS = ('count', 'sum', 'mean', 'std', 'min', 'max')
+
+class DataCube:
+
+    """
+    Pre-aggregated statistics of measure columns for every cell of a grid
+    of dimensions, e.g. ocean_proximity x age decade x income band.
+
+    Each cell stores per measure the count, sum, sum of squares, min and
+    max of the non-missing values; rows with a missing or out-of-range
+    dimension value belong to no cell. Queries select key values (slice
+    and dice) and sum the cells over the other dimensions (rollup), so
+    they never touch the rows.
+
+    Args:
+    - dimensions (list): Dimension column names.
+    - bins (list): Bin edges of each dimension, None for distinct values.
+    - keys (list): Key values of each dimension: category names, distinct
+      values or the lower edges of the bins.
+    - cells (dict): Per measure, the CELL_STATISTICS arrays, shaped like
+      the grid of keys.
+    """
+
+    def __init__(self, dimensions, bins, keys, cells):
+        self.dimensions = list(dimensions)
+        self.bins = list(bins)
+        self.keys = [np.asarray(k) for k in keys]
+        self.cells = cells
+
+    @property
+    def measures(self):
+        return list(self.cells)
+
+    def _select(self, where):
+        # Indices of the selected keys of every dimension
+        selection = [np.arange(keys.size) for keys in self.keys]
+        for dimension, values in (where or {}).items():
+            if dimension not in self.dimensions:
+                raise KeyError(f"Unknown dimension '{dimension}'")
+            d = self.dimensions.index(dimension)
+            values = np.atleast_1d(values)
+            if self.keys[d].dtype.kind == 'f':
+                values = values.astype(float)
+            unknown = values[~np.isin(values, self.keys[d])]
+            if unknown.size:
+                raise ValueError(f"Unknown value '{unknown[0]}' for dimension '{dimension}', "
+                                 f"expected one of {', '.join(map(str, self.keys[d]))}")
+            selection[d] = np.flatnonzero(np.isin(self.keys[d], values))
+        return selection
+
+    def query(self, measure, agg='mean', by=(), where=None):
+
+        """
+        Aggregate a measure from the cells.
+
+        Args:
+        - measure (str): Measure column name.
+        - agg (str or sequence): Aggregation name, or several names; one
+          of AGGREGATIONS.
+        - by (sequence): Dimensions kept in the result, in this order; the
+          others are rolled up.
+        - where (dict): Key values kept per dimension, a value or a list
+          (for numeric bins, their lower edges); unknown values raise
+          ValueError.
+
+        Returns:
+        - keys (list): Key values of each dimension in by.
+        - result (numpy.ndarray or dict): Aggregated values, one axis per
+          dimension in by (a 0-d array without by), or a dict from
+          aggregation name to values when agg is a sequence. Empty cells
+          give NaN (0 for 'count' and 'sum').
+        """
+
+        if measure not in self.cells:
+            raise KeyError(f"Measure '{measure}' is not in the cube, expected one of "
+                           f"{', '.join(self.cells)}")
+        for dimension in by:
+            if dimension not in self.dimensions:
+                raise KeyError(f"Unknown dimension '{dimension}'")
+        names = [agg] if isinstance(agg, str) else list(agg)
+        for name in names:
+            if name not in AGGREGATIONS:
+                raise ValueError(f"Unknown aggregation '{name}', expected one of {AGGREGATIONS}")
+
+        selection = self._select(where)
+        grid = np.ix_(*selection)
+        kept = [self.dimensions.index(dimension) for dimension in by]
+        rolled = tuple(d for d in range(len(self.dimensions)) if d not in kept)
+        order = np.argsort(kept)
+
+        def rollup(statistic, reduce, **identity):
+            values = reduce(self.cells[measure][statistic][grid], axis=rolled, **identity)
+            # Remaining axes are in cube order; put them in the order of by
+            return np.transpose(values, np.argsort(order))
+
+        count = rollup('count', np.sum)
+        result = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for name in names:
+                if name == 'count':
+                    result[name] = count
+                elif name == 'sum':
+                    result[name] = rollup('sum', np.sum)
+                elif name == 'mean':
+                    result[name] = np.where(count > 0, rollup('sum', np.sum) / count, np.nan)
+                elif name == 'std':
+                    mean = rollup('sum', np.sum) / count
+                    variance = np.maximum(rollup('sum_squares', np.sum) / count - mean * mean, 0)
+                    result[name] = np.where(count > 0, np.sqrt(variance), np.nan)
+                else:
+                    # An empty selection reduces to the identity, then to NaN
+                    reduce, initial = (np.min, np.inf) if name == 'min' else (np.max, -np.inf)
+                    values = rollup(name, reduce, initial=initial)
+                    result[name] = np.where(count > 0, values, np.nan)
+
+        keys = [self.keys[d][selection[d]] for d in kept]
+        return keys, result[agg] if isinstance(agg, str) else result
+
+    def save(self, path, source=None, dtype=None):
+
+        """
+        Write the cube to a '.npz' file.
+
+        Args:
+        - path (str): Output path.
+        - source (dict): Optional stamp of the source file, see
+          cache.source_stamp.
+        - dtype (numpy.dtype): Optional type of the data it was built from.
+        """
+
+        arrays = {f'keys_{d}': keys for d, keys in enumerate(self.keys)}
+        for m, measure in enumerate(self.cells):
+            for statistic, values in self.cells[measure].items():
+                arrays[f'cells_{m}_{statistic}'] = values
+        meta = {'version': cache.CACHE_VERSION, 'dimensions': self.dimensions,
+                'bins': [None if b is None else [float(edge) for edge in b] for b in self.bins],
+                'measures': self.measures, 'source': source,
+                'dtype': None if dtype is None else np.dtype(dtype).str}
+        with open(path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+
+def load_cube(path):
+
+    """
+    Read a cube written by DataCube.save.
+
+    Returns:
+    - cube (DataCube or None): Cube, or None if the file is missing or
+      unreadable.
+    - meta (dict or None): Its dimensions, bins, measures, source stamp
+      and data type.
+    """
+
+    try:
+        with np.load(path, allow_pickle=False) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            keys = [arrays[f'keys_{d}'] for d in range(len(meta['dimensions']))]
+            cells = {measure: {statistic: arrays[f'cells_{m}_{statistic}']
+                               for statistic in CELL_STATISTICS}
+                     for m, measure in enumerate(meta['measures'])}
+    except (OSError, ValueError, KeyError):
+        return None, None
+    return DataCube(meta['dimensions'], meta['bins'], keys, cells), meta
+
+def build_cube(data, column_names, categories=None, dimensions=DEFAULT_DIMENSIONS,
+               measures=DEFAULT_MEASURES):
+
+    """
+    Build a cube in one pass over the rows: every row gets one cell id and
+    all statistics are per-cell bincounts and reductions.
+
+    Args:
+    - data (numpy.ndarray): Input data.
+    - column_names (list): List of column names.
+    - categories (dict): Category names of each categorical column.
+    - dimensions (sequence): (column, bin edges or None) pairs; columns
+      may be derived (see derived.DERIVED_COLUMNS).
+    - measures (sequence): Columns aggregated in every cell, stored or
+      derived.
+
+    Returns:
+    - cube (DataCube): Built cube.
+    """
+
+    categories = categories or {}
+    keys, ids = [], []
+    for column, bins in dimensions:
+        values = derived.values(data, column, column_names)
+        if bins is None and column in categories:
+            dimension_keys, dimension_ids = groupby.category_ids(values, categories[column])
+        else:
+            dimension_keys, dimension_ids = groupby.group_ids(values, bins)
+        keys.append(dimension_keys)
+        ids.append(dimension_ids)
+
+    shape = tuple(k.size for k in keys)
+    num_cells = int(np.prod(shape))
+    in_cell = np.logical_and.reduce([i >= 0 for i in ids])
+    cell_ids = np.ravel_multi_index([i[in_cell] for i in ids], shape)
+
+    cells = {}
+    for measure in measures:
+        values = derived.values(data, measure, column_names)[in_cell].astype(np.float64)
+        present = ~np.isnan(values)
+        measure_ids, values = cell_ids[present], values[present]
+        statistics = {
+            'count': np.bincount(measure_ids, minlength=num_cells),
+            'sum': np.bincount(measure_ids, weights=values, minlength=num_cells),
+            'sum_squares': np.bincount(measure_ids, weights=values * values,
+                                       minlength=num_cells),
+        }
+        # Empty cells hold the identities of min and max, so rollups skip them
+        for name, empty in (('min', np.inf), ('max', -np.inf)):
+            result = groupby.aggregate(measure_ids, values, num_cells, name)
+            statistics[name] = np.where(statistics['count'] > 0, result, empty)
+        cells[measure] = {name: array.reshape(shape) for name, array in statistics.items()}
+    return DataCube([column for column, _ in dimensions],
+                    [bins for _, bins in dimensions], keys, cells)
+
+def cube_path(filename, dimensions=DEFAULT_DIMENSIONS, measures=DEFAULT_MEASURES,
+              dtype=np.float64):
+
+    """
+    Return the file of a cube configuration, in the columnar cache
+    directory of the CSV file (see cache.cache_dir_for). Data of another
+    type, e.g. the float32 array of the compact mode, gets its own file.
+    """
+
+    config = json.dumps([[column, None if bins is None else [float(e) for e in bins]]
+                         for column, bins in dimensions] + [list(measures), np.dtype(dtype).str])
+    digest = hashlib.sha1(config.encode()).hexdigest()[:12]
+    return os.path.join(cache.cache_dir_for(filename), f'cube_{digest}.npz')
+
+def cube_for(filename, data, column_names, categories=None, dimensions=DEFAULT_DIMENSIONS,
+             measures=DEFAULT_MEASURES, persist=True):
+
+    """
+    Return the cube of a dataset, read from next to the CSV file when it
+    was built from the current file and data of the same type, otherwise
+    built and saved there.
+
+    Args:
+    - filename (str): Path to the source CSV file.
+    - data (numpy.ndarray): Loaded data of the file.
+    - column_names (list): List of column names.
+    - categories (dict): Category names of each categorical column.
+    - dimensions (sequence): (column, bin edges or None) pairs.
+    - measures (sequence): Columns aggregated in every cell.
+    - persist (bool): Read and write the saved cube; False always builds.
+
+    Returns:
+    - cube (DataCube): Cube of the data.
+    """
+
+    path = cube_path(filename, dimensions, measures, data.dtype)
+    if persist:
+        saved, meta = load_cube(path)
+        if (saved is not None and meta['version'] == cache.CACHE_VERSION
+                and meta.get('dtype') == data.dtype.str
+                and cache.is_source_fresh(filename, meta['source'])):
+            if cache.refresh_stamp(filename, meta['source']):
+                _save(saved, path, filename, meta['source'], data.dtype)
+            return saved
+
+    built = build_cube(data, column_names, categories, dimensions, measures)
+    if persist:
+        _save(built, path, filename, cache.source_stamp(filename), data.dtype)
+    return built
+
+def _save(data_cube, path, filename, source, dtype):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data_cube.save(path, source, dtype)
+    except OSError as e:
+        print(f"Warning: could not save the data cube of '{filename}': {e}")
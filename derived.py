@@ -0,0 +1,198 @@
+import ast
+
+import numpy as np
+import memo
+import table
+
+# Rows evaluated at a time; every intermediate result of an expression is
+# a buffer of this many rows, never a full column
+CHUNK_ROWS = 1 << 16
+
+# Derived columns of the housing dataset: name -> expression over columns
+DERIVED_COLUMNS = {
+    'rooms_per_household': 'total_rooms / households',
+    'bedrooms_per_room': 'total_bedrooms / total_rooms',
+    'population_per_household': 'population / households',
+}
+
+# Binary operators allowed in expressions
+OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+}
+
+class Expression:
+
+    """
+    Arithmetic expression over named columns, e.g.
+    'total_rooms / households'.
+
+    Expressions hold column names, numbers, + - * / and parentheses. They
+    are evaluated vectorized but chunk by chunk, like numexpr: every
+    operation writes into a chunk-sized scratch buffer of its own, reused
+    for every chunk, and the last one writes straight into the output, so
+    no full-size temporary is created. Values are computed in float64;
+    missing inputs give NaN, and divisions by zero inf or NaN.
+
+    Args:
+    - text (str): Expression.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.columns = []
+        self.num_buffers = 0
+        try:
+            tree = ast.parse(text.strip(), mode='eval').body
+        except SyntaxError as e:
+            raise ValueError(f"Invalid expression '{text}': {e.msg}") from None
+        self.root = self._compile(tree)
+
+    def _compile(self, node):
+        # Tree of ('column', name), ('constant', value), ('negative', operand,
+        # buffer) and ('operation', ufunc, left, right, buffer) nodes
+        if isinstance(node, ast.Name):
+            if node.id not in self.columns:
+                self.columns.append(node.id)
+            return ('column', node.id)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return ('constant', float(node.value))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self._compile(node.operand)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+            self.num_buffers += 1
+            return ('negative', operand, self.num_buffers - 1)
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            left, right = self._compile(node.left), self._compile(node.right)
+            self.num_buffers += 1
+            return ('operation', OPERATORS[type(node.op)], left, right, self.num_buffers - 1)
+        raise ValueError(f"Unsupported syntax in expression '{self.text}', expected column "
+                         f"names, numbers and + - * /")
+
+    def evaluate(self, data, column_names=table.COLUMN_NAMES, chunk_rows=CHUNK_ROWS):
+
+        """
+        Evaluate the expression over every row of the data.
+
+        Args:
+        - data (numpy.ndarray): 2-D data with the referenced columns.
+        - column_names (sequence): Column names of the data.
+        - chunk_rows (int): Rows evaluated at a time.
+
+        Returns:
+        - values (numpy.ndarray): float64 value of every row.
+        """
+
+        column_names = list(column_names)
+        for name in self.columns:
+            if name not in column_names:
+                raise KeyError(f"Unknown column '{name}' in expression '{self.text}'")
+        positions = {name: column_names.index(name) for name in self.columns}
+
+        num_rows = data.shape[0]
+        result = np.empty(num_rows, dtype=np.float64)
+        buffers = [np.empty(min(chunk_rows, num_rows), dtype=np.float64)
+                   for _ in range(self.num_buffers)]
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            for start in range(0, num_rows, chunk_rows):
+                stop = min(start + chunk_rows, num_rows)
+                chunk = data[start:stop]
+                self._evaluate(self.root, chunk, positions,
+                               [buffer[:stop - start] for buffer in buffers], result[start:stop])
+        return result
+
+    def _evaluate(self, node, chunk, positions, buffers, out=None):
+        # Value of a node over a chunk of rows, written into out if given
+        kind = node[0]
+        if kind == 'column':
+            value = chunk[:, positions[node[1]]]
+        elif kind == 'constant':
+            value = node[1]
+        elif kind == 'negative':
+            operand = self._evaluate(node[1], chunk, positions, buffers)
+            return np.negative(operand, out=buffers[node[2]] if out is None else out,
+                               dtype=np.float64)
+        else:
+            _, ufunc, left, right, buffer = node
+            return ufunc(self._evaluate(left, chunk, positions, buffers),
+                         self._evaluate(right, chunk, positions, buffers),
+                         out=buffers[buffer] if out is None else out, dtype=np.float64)
+        if out is not None:
+            out[...] = value
+        return value
+
+def is_derived(name):
+    return name in DERIVED_COLUMNS
+
+def define(name, expression):
+
+    """
+    Add or replace a derived column, usable wherever the built-in ones
+    are.
+
+    Args:
+    - name (str): Column name; must not be a column of the dataset.
+    - expression (str): Expression over columns, see Expression.
+    """
+
+    if name in table.COLUMN_NAMES:
+        raise ValueError(f"'{name}' is already a column of the dataset")
+    Expression(expression)
+    DERIVED_COLUMNS[name] = expression
+
+def base_columns(name):
+
+    """
+    Return the dataset columns a column needs: itself for a stored column,
+    the columns of its expression for a derived one.
+    """
+
+    if not is_derived(name):
+        return [name]
+    return Expression(DERIVED_COLUMNS[name]).columns
+
+def evaluate(data, expression, column_names=table.COLUMN_NAMES):
+
+    """
+    Evaluate an expression over the data, see Expression.evaluate.
+
+    Results are kept with the data array (see memo.dataset_store), so
+    every expression is computed once per dataset, whatever its size, and
+    again only after the data is invalidated.
+    """
+
+    store = memo.dataset_store(data)
+    key = ('derived', expression, tuple(column_names))
+    if key not in store:
+        values = Expression(expression).evaluate(data, column_names)
+        values.flags.writeable = False
+        store[key] = values
+    return store[key]
+
+def values(data, name, column_names=table.COLUMN_NAMES):
+
+    """
+    Return a column of the data by name, stored or derived.
+
+    Derived columns are computed on first use and cached with the data,
+    see evaluate.
+
+    Args:
+    - data (numpy.ndarray): 2-D data.
+    - name (str): Column name, or a name of DERIVED_COLUMNS.
+    - column_names (sequence): Column names of the data.
+
+    Returns:
+    - values (numpy.ndarray): 1-D values; a view of the data for a stored
+      column, a read-only array for a derived one.
+    """
+
+    column_names = list(column_names)
+    if name in column_names:
+        return data[:, column_names.index(name)]
+    if not is_derived(name):
+        raise KeyError(f"Unknown column '{name}'")
+    return evaluate(data, DERIVED_COLUMNS[name], tuple(column_names))
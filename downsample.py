@@ -0,0 +1,153 @@
+import numpy as np
+
+# Above this many points, scatter plots draw a sample instead of every row
+MAX_SCATTER_POINTS = 50_000
+
+def histogram_edges(min_value, max_value, bins=30):
+
+    """
+    Return equal-width bin edges between two values, like numpy.histogram.
+
+    Args:
+    - min_value (float): Lower edge.
+    - max_value (float): Upper edge.
+    - bins (int): Number of bins.
+
+    Returns:
+    - edges (numpy.ndarray): bins + 1 edges.
+    """
+
+    if not min_value < max_value:
+        min_value, max_value = min_value - 0.5, max_value + 0.5
+    return np.linspace(min_value, max_value, bins + 1)
+
+def accumulate_histogram(counts, values, edges):
+
+    """
+    Add the values of one chunk to histogram counts with fixed edges.
+
+    Bins are half-open except the last, which includes the upper edge,
+    like numpy.histogram. NaN values and values outside the edges are
+    skipped.
+
+    Args:
+    - counts (numpy.ndarray): Counts to update in place, one per bin.
+    - values (numpy.ndarray): 1-D values of the chunk.
+    - edges (numpy.ndarray): Equal-width bin edges.
+
+    Returns:
+    - counts (numpy.ndarray): The updated counts.
+    """
+
+    bins = edges.size - 1
+    values = values[(values >= edges[0]) & (values <= edges[-1])]
+    ids = ((values - edges[0]) * (bins / (edges[-1] - edges[0]))).astype(np.intp)
+    np.minimum(ids, bins - 1, out=ids)
+    counts += np.bincount(ids, minlength=bins)
+    return counts
+
+def histogram_counts(values, bins=30):
+
+    """
+    Compute the histogram of a column, skipping NaN values.
+
+    Args:
+    - values (numpy.ndarray): 1-D column values.
+    - bins (int): Number of equal-width bins over the value range.
+
+    Returns:
+    - counts (numpy.ndarray): Number of values in each bin.
+    - edges (numpy.ndarray): bins + 1 bin edges.
+    """
+
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return np.zeros(bins, dtype=np.int64), histogram_edges(0.0, 1.0, bins)
+    return np.histogram(values, bins=bins)
+
+def histogram_counts_of_chunks(chunks, column, min_value, max_value, bins=30):
+
+    """
+    Compute the histogram of a column over a stream of row blocks.
+
+    The value range must be known up front, e.g. from a statistics pass,
+    so that every chunk uses the same edges.
+
+    Args:
+    - chunks (iterable): Row blocks, e.g. from stream.iter_chunks.
+    - column (int): Index of the column.
+    - min_value (float): Smallest value of the column.
+    - max_value (float): Largest value of the column.
+    - bins (int): Number of bins.
+
+    Returns:
+    - counts (numpy.ndarray): Number of values in each bin.
+    - edges (numpy.ndarray): bins + 1 bin edges.
+    """
+
+    edges = histogram_edges(min_value, max_value, bins)
+    counts = np.zeros(bins, dtype=np.int64)
+    for chunk in chunks:
+        accumulate_histogram(counts, chunk[:, column], edges)
+    return counts, edges
+
+def density_grid(x, y, bins=100):
+
+    """
+    Bin points into a 2-D grid of counts, to draw as a heatmap instead of
+    one marker per point.
+
+    Args:
+    - x (numpy.ndarray): x values.
+    - y (numpy.ndarray): y values.
+    - bins (int): Number of bins along each axis.
+
+    Returns:
+    - counts (numpy.ndarray): Array of shape (bins, bins), indexed [x, y].
+    - x_edges (numpy.ndarray): Bin edges along x.
+    - y_edges (numpy.ndarray): Bin edges along y.
+    """
+
+    valid = ~(np.isnan(x) | np.isnan(y))
+    return np.histogram2d(x[valid], y[valid], bins=bins)
+
+def stratified_sample(x, max_points=MAX_SCATTER_POINTS, strata=50, seed=0):
+
+    """
+    Choose a deterministic sample of about max_points rows, stratified
+    over equal-width ranges of x so that sparse ranges stay visible.
+
+    The budget is shared in proportion to the range sizes, and every
+    non-empty range keeps at least one row, so the sample may exceed
+    max_points by up to one row per range. The same input and seed always
+    give the same sample.
+
+    Args:
+    - x (numpy.ndarray): Values the strata are built on.
+    - max_points (int): Target number of rows in the sample.
+    - strata (int): Number of ranges.
+    - seed (int): Seed of the random generator.
+
+    Returns:
+    - rows (numpy.ndarray): Sorted indices of the sampled rows.
+    """
+
+    if x.size <= max_points:
+        return np.arange(x.size)
+
+    finite = ~np.isnan(x)
+    if not finite.any():
+        return np.arange(max_points)
+    edges = histogram_edges(np.min(x[finite]), np.max(x[finite]), strata)
+    stratum = np.full(x.size, strata, dtype=np.intp)
+    stratum[finite] = np.minimum(np.searchsorted(edges, x[finite], side='right') - 1, strata - 1)
+
+    sizes = np.bincount(stratum, minlength=strata + 1)
+    quotas = np.minimum(sizes, np.maximum(sizes * max_points // x.size, sizes > 0))
+
+    # Random order, then grouped by stratum: each stratum keeps its first rows
+    order = np.random.default_rng(seed).permutation(x.size)
+    order = order[np.argsort(stratum[order], kind='stable')]
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    rank = np.arange(x.size) - np.repeat(starts, sizes)
+    return np.sort(order[rank < np.repeat(quotas, sizes)])
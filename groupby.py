@@ -0,0 +1,137 @@
+import numpy as np
+
+AGGREGATIONS = ('mean', 'sum', 'count', 'min', 'max', 'std')
+
+def group_ids(keys, bins=None):
+
+    """
+    Assign every row to a group.
+
+    Without bins, every distinct key is a group. With bins, numeric keys
+    are grouped into the ranges between consecutive edges; ranges are
+    half-open [lo, hi) except the last, which includes its upper edge,
+    like numpy.histogram. Rows with a NaN key or outside the bins belong
+    to no group.
+
+    Args:
+    - keys (numpy.ndarray): 1-D key values, numeric or strings.
+    - bins (sequence): Optional increasing bin edges for numeric keys.
+
+    Returns:
+    - group_keys (numpy.ndarray): Key of each group, the lower edge of its
+      range when binning.
+    - ids (numpy.ndarray): Group of each row, -1 for rows in no group.
+    """
+
+    keys = np.asarray(keys)
+    if bins is not None:
+        edges = np.asarray(bins, dtype=float)
+        ids = np.searchsorted(edges, keys, side='right') - 1
+        ids[keys == edges[-1]] = edges.size - 2
+        ids[(ids < 0) | (ids > edges.size - 2) | np.isnan(keys)] = -1
+        return edges[:-1], ids
+
+    ids = np.full(keys.shape, -1, dtype=np.intp)
+    valid = ~np.isnan(keys) if keys.dtype.kind == 'f' else np.ones(keys.shape, dtype=bool)
+    group_keys, ids[valid] = np.unique(keys[valid], return_inverse=True)
+    return group_keys, ids
+
+def category_ids(codes, categories):
+
+    """
+    Assign every row to the group of its category code, without sorting.
+
+    Args:
+    - codes (numpy.ndarray): 1-D category codes; NaN or codes outside the
+      category list mark missing values.
+    - categories (list): Category names.
+
+    Returns:
+    - group_keys (numpy.ndarray): Category names.
+    - ids (numpy.ndarray): Group of each row, -1 for missing values.
+    """
+
+    codes = np.asarray(codes)
+    ids = np.full(codes.shape, -1, dtype=np.intp)
+    valid = (codes >= 0) & (codes < len(categories))
+    ids[valid] = codes[valid]
+    return np.asarray(categories), ids
+
+def aggregate(ids, values, num_groups, agg):
+
+    """
+    Aggregate values per group in one vectorized pass.
+
+    Args:
+    - ids (numpy.ndarray): Group of each row, -1 for rows in no group.
+    - values (numpy.ndarray): 1-D values to aggregate.
+    - num_groups (int): Number of groups.
+    - agg (str): One of 'mean', 'sum', 'count', 'min', 'max', 'std'.
+
+    Returns:
+    - result (numpy.ndarray): Aggregated value of each group. Empty groups
+      get NaN (0 for 'count' and 'sum').
+    """
+
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation '{agg}', expected one of {AGGREGATIONS}")
+
+    valid = ids >= 0
+    ids, values = ids[valid], np.asarray(values, dtype=float)[valid]
+    counts = np.bincount(ids, minlength=num_groups)
+    if agg == 'count':
+        return counts
+
+    sums = np.bincount(ids, weights=values, minlength=num_groups)
+    if agg == 'sum':
+        return sums
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    if agg == 'mean':
+        return means
+
+    if agg == 'std':
+        deviations = values - means[ids]
+        m2 = np.bincount(ids, weights=deviations * deviations, minlength=num_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(m2 / counts)
+
+    # min/max: one reduceat over the values sorted by group
+    result = np.full(num_groups, np.nan)
+    present = counts > 0
+    if ids.size:
+        ordered = values[np.argsort(ids, kind='stable')]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[present]
+        ufunc = np.minimum if agg == 'min' else np.maximum
+        result[present] = ufunc.reduceat(ordered, starts)
+    return result
+
+def group_by(keys, values, agg='mean', bins=None, categories=None):
+
+    """
+    Group values by a key column and aggregate each group.
+
+    Args:
+    - keys (numpy.ndarray): 1-D key values, numeric, category codes or strings.
+    - values (numpy.ndarray): 1-D values to aggregate.
+    - agg (str or sequence): Aggregation name, or several names.
+    - bins (sequence): Optional bin edges to group numeric keys into ranges.
+    - categories (list): Optional category names for integer code keys;
+      every category is a group, even an empty one, and the group keys
+      are returned as names.
+
+    Returns:
+    - group_keys (numpy.ndarray): Key of each group.
+    - result (numpy.ndarray or dict): Aggregated values per group, or a
+      dict from aggregation name to values when agg is a sequence.
+    """
+
+    if categories is not None:
+        group_keys, ids = category_ids(keys, categories)
+    else:
+        group_keys, ids = group_ids(keys, bins)
+
+    if isinstance(agg, str):
+        return group_keys, aggregate(ids, values, len(group_keys), agg)
+    return group_keys, {name: aggregate(ids, values, len(group_keys), name) for name in agg}
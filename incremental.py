@@ -0,0 +1,253 @@
+import numpy as np
+import analysis
+import csvparse
+import groupby
+import sketch
+import table
+from index import SegmentedThresholdIndex
+from table import MISSING_CODE
+
+# Columns whose per-value sums are kept up to date on every append
+GROUP_KEYS = ('total_bedrooms', 'ocean_proximity')
+
+class GroupSums:
+
+    """
+    Running per-key row counts and per-column sums, mergeable block by
+    block.
+
+    Args:
+    - num_columns (int): Number of value columns.
+    """
+
+    def __init__(self, num_columns):
+        self.keys = np.empty(0)
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros((0, num_columns))
+        self.valid = np.zeros((0, num_columns), dtype=np.int64)
+
+    def update(self, keys, data):
+
+        """
+        Add a block of rows. Rows with a NaN key are skipped.
+
+        Args:
+        - keys (numpy.ndarray): Key of each row of the block.
+        - data (numpy.ndarray): 2-D values of the block.
+        """
+
+        block_keys, ids = groupby.group_ids(keys)
+        rows = ids >= 0
+        ids, data = ids[rows], data[rows]
+        num_groups = block_keys.size
+
+        # Re-index the running groups onto the union of old and new keys
+        merged_keys = np.union1d(self.keys, block_keys)
+        old = np.searchsorted(merged_keys, self.keys)
+        new = np.searchsorted(merged_keys, block_keys)
+        shape = (merged_keys.size, self.sums.shape[1])
+        merged_rows, merged_sums = np.zeros(merged_keys.size, dtype=np.int64), np.zeros(shape)
+        merged_valid = np.zeros(shape, dtype=np.int64)
+        merged_rows[old], merged_sums[old], merged_valid[old] = self.rows, self.sums, self.valid
+
+        merged_rows[new] += np.bincount(ids, minlength=num_groups)
+        for j in range(data.shape[1]):
+            values = data[:, j]
+            present = ~np.isnan(values)
+            merged_sums[new, j] += np.bincount(ids[present], weights=values[present],
+                                               minlength=num_groups)
+            merged_valid[new, j] += np.bincount(ids[present], minlength=num_groups)
+        self.keys, self.rows, self.sums, self.valid = (merged_keys, merged_rows, merged_sums,
+                                                       merged_valid)
+
+class IncrementalDataset:
+
+    """
+    Loaded dataset that grows by appending delta CSV files.
+
+    Running aggregates are updated from each delta only: per column the
+    count, NaN count, sum, min, max, mean and sum of squared deviations
+    (see analysis.merge_summaries) and a quantile sketch, and per value of GROUP_KEYS the row
+    count and the sum and non-missing count of every column. The threshold
+    index is a SegmentedThresholdIndex, so calculate_avg_* queries given
+    `dataset.index` stay exact and cost no full rebuild.
+
+    Args:
+    - loaded (Table): Initial table, see analysis.load_table.
+    - dtype (numpy.dtype): Float type of the row blocks, see
+      Table.to_array.
+    """
+
+    def __init__(self, loaded, dtype=np.float64):
+        self.column_names = list(loaded.column_names)
+        self.categories = {name: list(values) for name, values in loaded.categories.items()}
+        self.dtype = dtype
+        self._data = None
+        self.summaries = [analysis.empty_summary() for _ in self.column_names]
+        self.sketches = [sketch.QuantileSketch() for _ in self.column_names]
+        self.group_sums = {key: GroupSums(len(self.column_names)) for key in GROUP_KEYS
+                           if key in self.column_names}
+        self.index = None
+        self.append_table(loaded)
+
+    @property
+    def num_rows(self):
+        return self.index.num_rows
+
+    @property
+    def data(self):
+
+        """
+        All rows as one 2-D array, concatenated from the index segments on
+        first use after an append. Only needed by queries over the full
+        history, such as medians.
+        """
+
+        if self._data is None:
+            segments = [data for data, _ in self.index.segments]
+            self._data = segments[0] if len(segments) == 1 else np.concatenate(segments)
+        return self._data
+
+    def _recode(self, delta):
+        # Map the delta's category codes onto ours; new categories are added
+        # at the end so existing codes never change
+        columns = []
+        for name in self.column_names:
+            column = delta.column(name)
+            if delta.is_categorical(name):
+                known = self.categories.setdefault(name, [])
+                lookup = np.full(MISSING_CODE + 1, MISSING_CODE, dtype=np.uint8)
+                for code, value in enumerate(delta.categories[name]):
+                    if value not in known:
+                        if len(known) >= MISSING_CODE:
+                            raise ValueError(f"Too many categories for column '{name}'")
+                        known.append(value)
+                    lookup[code] = known.index(value)
+                column = lookup[column]
+            columns.append(column)
+        return table.Table(columns, self.column_names, self.categories)
+
+    def append_table(self, delta):
+
+        """
+        Append the rows of a table with the same columns.
+
+        Args:
+        - delta (Table): New rows.
+        """
+
+        if list(delta.column_names) != self.column_names:
+            raise ValueError(f"Columns {delta.column_names} do not match {self.column_names}")
+        block = self._recode(delta).to_array(self.dtype)
+
+        for i in range(len(self.column_names)):
+            self.summaries[i] = analysis.merge_summaries(self.summaries[i],
+                                                         analysis.summarize_column(block[:, i]))
+            self.sketches[i].update(block[:, i])
+        for key, sums in self.group_sums.items():
+            sums.update(block[:, self.column_names.index(key)], block)
+        if self.index is None:
+            self.index = SegmentedThresholdIndex(block)
+        else:
+            self.index.append(block)
+        self._data = None
+
+    def append_csv(self, filename):
+
+        """
+        Append the rows of a delta CSV file with the same header.
+
+        Args:
+        - filename (str): Path to the delta CSV file.
+
+        Returns:
+        - rows (int): Number of rows appended.
+        """
+
+        delta = csvparse.read_csv(filename)
+        self.append_table(delta)
+        return delta.num_rows
+
+    def summary(self, name):
+
+        """
+        Return the running aggregates of a column.
+
+        Args:
+        - name (str): Column name.
+
+        Returns:
+        - summary (dict): count, nan_count, sum, sum_squares, min, max, mean
+          and var (population variance) of the non-missing values.
+        """
+
+        summary = dict(self.summaries[self.column_names.index(name)])
+        m2 = summary.pop('m2')
+        count = summary['count']
+        summary['sum_squares'] = m2 + count * summary['mean'] ** 2 if count else 0.0
+        summary['var'] = m2 / count if count else np.nan
+        return summary
+
+    def quantiles(self, name, quantiles=(0.5,)):
+
+        """
+        Return approximate quantiles of a column from its running sketch,
+        without concatenating the data.
+
+        Args:
+        - name (str): Column name.
+        - quantiles (sequence): Quantiles between 0 and 1.
+
+        Returns:
+        - values (numpy.ndarray): Value of each quantile.
+        - rank_error (float): Error bound, see QuantileSketch.rank_error.
+        """
+
+        column_sketch = self.sketches[self.column_names.index(name)]
+        return column_sketch.quantiles(quantiles), column_sketch.rank_error()
+
+    def group_summary(self, key, value):
+
+        """
+        Return the running count, sum and mean of a column per key value.
+
+        Args:
+        - key (str): One of GROUP_KEYS.
+        - value (str): Column name.
+
+        Returns:
+        - keys (numpy.ndarray): Key values; category names for categorical
+          keys.
+        - result (dict): 'rows' per key, and 'count' (non-missing values),
+          'sum' and 'mean' of the value column per key.
+        """
+
+        sums = self.group_sums[key]
+        j = self.column_names.index(value)
+        keys = sums.keys
+        if key in self.categories:
+            keys = np.asarray(self.categories[key])[keys.astype(np.intp)]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(sums.valid[:, j] > 0, sums.sums[:, j] / sums.valid[:, j], np.nan)
+        return keys, {'rows': sums.rows, 'count': sums.valid[:, j], 'sum': sums.sums[:, j],
+                      'mean': mean}
+
+def load(filename, use_cache=True, compact=False):
+
+    """
+    Load a CSV file as an IncrementalDataset.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - use_cache (bool): Read from and write to the columnar cache.
+    - compact (bool): Use float32 row blocks, see analysis.load_data.
+
+    Returns:
+    - dataset (IncrementalDataset or None): Loaded dataset, or None if the
+      file was not found.
+    """
+
+    loaded = analysis.load_table(filename, use_cache)
+    if loaded is None:
+        return None
+    return IncrementalDataset(loaded, table.COMPACT_ARRAY_DTYPE if compact else np.float64)
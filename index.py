@@ -0,0 +1,202 @@
+import threading
+
+import numpy as np
+import derived
+
+# Columns used by the "bedrooms > n", "density > 1000" and "rooms per
+# household > 3" questions; derived columns are referred to by name
+BEDROOMS_COLUMN = 4
+POPULATION_COLUMN = 5
+ROOMS_PER_HOUSEHOLD = 'rooms_per_household'
+INCOME_COLUMN = 7
+HOUSE_VALUE_COLUMN = 8
+
+class ThresholdIndex:
+
+    """
+    Sorted-column index answering "average of Y where X > n" queries.
+
+    For every filter column the index keeps the sorted filter values and,
+    for every target column, suffix sums of the target values in that
+    order. A query is then one searchsorted plus O(1) arithmetic, with no
+    mask over the rows and no row copies.
+
+    The index is a snapshot: rebuild it after the data is modified in
+    place. Derived filter columns are computed and indexed on their first
+    query, not when the index is built.
+
+    Args:
+    - data (numpy.ndarray): Input data.
+    - filter_columns (sequence): Indices of the columns compared with n,
+      or names of derived columns (see derived.DERIVED_COLUMNS).
+    - target_columns (sequence): Indices of the columns averaged.
+    """
+
+    def __init__(self, data,
+                 filter_columns=(BEDROOMS_COLUMN, POPULATION_COLUMN, ROOMS_PER_HOUSEHOLD),
+                 target_columns=(POPULATION_COLUMN, INCOME_COLUMN, HOUSE_VALUE_COLUMN)):
+        self.num_rows = data.shape[0]
+        self.target_columns = tuple(target_columns)
+        self.sorted_values = {}
+        self.suffix_sums = {}
+        # Derived filter columns not indexed yet; the data is kept for them
+        self.pending = {f for f in filter_columns if isinstance(f, str)}
+        self.data = data if self.pending else None
+        self.lock = threading.Lock()
+
+        for f in filter_columns:
+            if f not in self.pending:
+                self._index(data, f, data[:, f])
+
+    def _index(self, data, f, values):
+        # NaN sorts last and never satisfies "> n", so it is left out
+        order = np.argsort(values, kind='stable')
+        num_valid = self.num_rows - int(np.count_nonzero(np.isnan(values)))
+        order = order[:num_valid]
+        self.sorted_values[f] = values[order]
+
+        for t in self.target_columns:
+            suffix = np.zeros(num_valid + 1)
+            suffix[:num_valid] = np.cumsum(data[order[::-1], t], dtype=np.float64)[::-1]
+            self.suffix_sums[f, t] = suffix
+
+    def _sorted_values(self, filter_column):
+        # Sorted values of a filter column, indexing a derived one first
+        if filter_column in self.pending:
+            with self.lock:
+                if filter_column in self.pending:
+                    self._index(self.data, filter_column,
+                                derived.values(self.data, filter_column))
+                    self.pending.discard(filter_column)
+                    if not self.pending:
+                        self.data = None
+        return self.sorted_values[filter_column]
+
+    def count_gt(self, filter_column, n):
+
+        """
+        Count the rows where the filter column is greater than n.
+
+        Args:
+        - filter_column (int or str): Index (or derived column name) of an
+          indexed filter column.
+        - n (float): Threshold.
+
+        Returns:
+        - count (int): Number of rows with filter value > n.
+        """
+
+        sorted_values = self._sorted_values(filter_column)
+        return sorted_values.size - int(np.searchsorted(sorted_values, n, side='right'))
+
+    def sum_gt(self, filter_column, n, target_column):
+
+        """
+        Sum a target column over the rows where the filter column is
+        greater than n.
+
+        Args:
+        - filter_column (int or str): Index (or derived column name) of an
+          indexed filter column.
+        - n (float): Threshold.
+        - target_column (int): Index of an indexed target column.
+
+        Returns:
+        - total (float): Sum of the target column over the selected rows.
+        """
+
+        position = np.searchsorted(self._sorted_values(filter_column), n, side='right')
+        return float(self.suffix_sums[filter_column, target_column][position])
+
+    def avg_gt(self, filter_column, n, target_column):
+
+        """
+        Average a target column over the rows where the filter column is
+        greater than n.
+
+        Args:
+        - filter_column (int or str): Index (or derived column name) of an
+          indexed filter column.
+        - n (float): Threshold.
+        - target_column (int): Index of an indexed target column.
+
+        Returns:
+        - avg (float): Average of the target column over the selected rows,
+          NaN if no row is selected.
+        """
+
+        count = self.count_gt(filter_column, n)
+        if count == 0:
+            return np.nan
+        return self.sum_gt(filter_column, n, target_column) / count
+
+class SegmentedThresholdIndex:
+
+    """
+    Threshold index over data that grows by appended blocks of rows.
+
+    Every appended block gets its own ThresholdIndex and a query adds up
+    the answers of all segments. Consecutive segments of similar size are
+    merged (rebuilt together), like a binary counter, so there are at most
+    about log2(rows) segments and each row is re-indexed O(log rows)
+    times. Appending a small block to a large dataset therefore costs time
+    proportional to the block, not to the whole history.
+
+    Offers the count_gt, sum_gt and avg_gt queries of ThresholdIndex, so
+    it can be passed wherever an index is accepted.
+
+    Args:
+    - data (numpy.ndarray): Initial data.
+    - filter_columns (sequence): Indices of the columns compared with n,
+      or names of derived columns.
+    - target_columns (sequence): Indices of the columns averaged.
+    """
+
+    def __init__(self, data,
+                 filter_columns=(BEDROOMS_COLUMN, POPULATION_COLUMN, ROOMS_PER_HOUSEHOLD),
+                 target_columns=(POPULATION_COLUMN, INCOME_COLUMN, HOUSE_VALUE_COLUMN)):
+        self.filter_columns = tuple(filter_columns)
+        self.target_columns = tuple(target_columns)
+        # (data, index) per segment, oldest and largest first
+        self.segments = []
+        self.append(data)
+
+    @property
+    def num_rows(self):
+        return sum(data.shape[0] for data, _ in self.segments)
+
+    def append(self, data):
+
+        """
+        Index a block of new rows.
+
+        Args:
+        - data (numpy.ndarray): New rows, with the columns of the initial data.
+        """
+
+        self.segments.append((data, ThresholdIndex(data, self.filter_columns,
+                                                   self.target_columns)))
+        while (len(self.segments) > 1
+               and self.segments[-2][0].shape[0] <= 2 * self.segments[-1][0].shape[0]):
+            (older, _), (newer, _) = self.segments[-2:]
+            merged = np.concatenate([older, newer])
+            self.segments[-2:] = [(merged, ThresholdIndex(merged, self.filter_columns,
+                                                          self.target_columns))]
+
+    def count_gt(self, filter_column, n):
+        return sum(index.count_gt(filter_column, n) for _, index in self.segments)
+
+    def sum_gt(self, filter_column, n, target_column):
+        return sum(index.sum_gt(filter_column, n, target_column) for _, index in self.segments)
+
+    def avg_gt(self, filter_column, n, target_column):
+
+        """
+        Average a target column over the rows of every segment where the
+        filter column is greater than n, see ThresholdIndex.avg_gt.
+        """
+
+        count = self.count_gt(filter_column, n)
+        if count == 0:
+            return np.nan
+        return self.sum_gt(filter_column, n, target_column) / count
@@ -0,0 +1,265 @@
+import contextlib
+import cProfile
+import functools
+import inspect
+import os
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+# Environment variables that switch instrumentation and profiling on
+INSTRUMENT_ENV = 'HOUSING_INSTRUMENT'
+PROFILE_DIR_ENV = 'HOUSING_PROFILE_DIR'
+
+# Per-function statistics, keyed by 'module.function'
+_stats = {}
+_stats_lock = threading.Lock()
+# Original functions of wrapped modules, to restore them on disable
+_originals = {}
+# Peak memory bookkeeping of the calls in progress in each thread,
+# innermost last. tracemalloc counts the allocations of every thread, so
+# calls running concurrently still share their peaks.
+_local = threading.local()
+_profile_dir = None
+_profile_count = 0
+# (label, profiler) of the operation being profiled
+_active_profile = None
+
+def is_enabled():
+    return bool(_originals)
+
+def is_profiling():
+    return _profile_dir is not None
+
+def _rows_of(args, kwargs):
+    # Rows processed: length of the first array argument
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, np.ndarray) and value.ndim:
+            return value.shape[0]
+    return 0
+
+def _frames():
+    # Frame stack of the calling thread
+    if not hasattr(_local, 'frames'):
+        _local.frames = []
+    return _local.frames
+
+def _record(name, seconds, rows, allocated):
+    with _stats_lock:
+        stats = _stats.setdefault(name, {'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                                         'rows': 0, 'allocated_bytes': 0, 'peak_bytes': 0})
+        stats['calls'] += 1
+        stats['total_seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        stats['rows'] += rows
+        stats['allocated_bytes'] += allocated
+        stats['peak_bytes'] = max(stats['peak_bytes'], allocated)
+
+def wrap(func, name):
+
+    """
+    Wrap a function so every call records its wall time, rows processed
+    and the peak memory it allocated.
+
+    Args:
+    - func (callable): Function to wrap.
+    - name (str): Name it is reported under.
+
+    Returns:
+    - wrapper (callable): Instrumented function.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            frames = _frames()
+            current, peak = tracemalloc.get_traced_memory()
+            if frames:
+                frames[-1]['peak'] = max(frames[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frames.append({'start': current, 'peak': current})
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            allocated = 0
+            if tracing:
+                frame = frames.pop()
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                allocated = peak - frame['start']
+                if frames:
+                    frames[-1]['peak'] = max(frames[-1]['peak'], peak)
+            _record(name, seconds, _rows_of(args, kwargs), allocated)
+
+    wrapper.__wrapped_by_instrument__ = True
+    return wrapper
+
+def instrument_module(module):
+
+    """
+    Replace the public functions defined in a module with instrumented
+    wrappers. Calls through the module, including calls between its own
+    functions, are then recorded.
+    """
+
+    for name, func in list(vars(module).items()):
+        if (name.startswith('_') or not inspect.isfunction(func)
+                or func.__module__ != module.__name__
+                or getattr(func, '__wrapped_by_instrument__', False)):
+            continue
+        _originals[module, name] = func
+        setattr(module, name, wrap(func, f'{module.__name__}.{name}'))
+
+def enable(modules=None, track_memory=True, profile_dir=None):
+
+    """
+    Switch instrumentation on for analysis.py and plot.py (or the given
+    modules). While it is off no function is wrapped, so it costs nothing.
+
+    Args:
+    - modules (list): Modules to instrument, defaults to analysis and plot.
+    - track_memory (bool): Trace allocations with tracemalloc.
+    - profile_dir (str): Optional directory for cProfile dumps written by
+      profile_operation.
+    """
+
+    if modules is None:
+        import analysis
+        import plot
+        modules = [analysis, plot]
+    for module in modules:
+        instrument_module(module)
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if profile_dir:
+        enable_profiling(profile_dir)
+
+def enable_profiling(profile_dir):
+
+    """
+    Make profile_operation write a cProfile dump per operation to a directory.
+    """
+
+    global _profile_dir
+    os.makedirs(profile_dir, exist_ok=True)
+    _profile_dir = profile_dir
+
+def enable_from_env():
+
+    """
+    Enable instrumentation if HOUSING_INSTRUMENT is set to a non-empty
+    value other than '0', and profiling if HOUSING_PROFILE_DIR is set.
+    """
+
+    if os.environ.get(INSTRUMENT_ENV, '') not in ('', '0'):
+        enable()
+    if os.environ.get(PROFILE_DIR_ENV):
+        enable_profiling(os.environ[PROFILE_DIR_ENV])
+
+def disable():
+
+    """
+    Restore the original functions and stop tracing memory and profiling.
+    Collected statistics are kept until reset.
+    """
+
+    global _profile_dir
+    end_operation()
+    for (module, name), func in _originals.items():
+        setattr(module, name, func)
+    _originals.clear()
+    _profile_dir = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def reset():
+    with _stats_lock:
+        _stats.clear()
+
+def report():
+
+    """
+    Return the collected statistics.
+
+    Returns:
+    - stats (dict): For every called function, calls, total, mean and max
+      seconds, rows processed, total allocated bytes and the largest peak
+      of a single call, sorted by total time.
+    """
+
+    with _stats_lock:
+        items = [(name, dict(stats)) for name, stats in _stats.items()]
+    result = {}
+    for name, stats in sorted(items, key=lambda item: -item[1]['total_seconds']):
+        result[name] = dict(stats, mean_seconds=stats['total_seconds'] / stats['calls'])
+    return result
+
+def format_report():
+
+    """
+    Format the collected statistics as a text table.
+    """
+
+    lines = [f"{'function':<45} {'calls':>6} {'total s':>10} {'mean s':>10} "
+             f"{'rows':>12} {'peak MB':>9}"]
+    for name, stats in report().items():
+        lines.append(f"{name:<45} {stats['calls']:>6} {stats['total_seconds']:>10.4f} "
+                     f"{stats['mean_seconds']:>10.4f} {stats['rows']:>12} "
+                     f"{stats['peak_bytes'] / 1e6:>9.2f}")
+    return '\n'.join(lines)
+
+def begin_operation(label):
+
+    """
+    End the operation being profiled, if any, and start profiling a new
+    one with cProfile. Does nothing unless profiling is enabled, or when
+    label is None.
+
+    The dump is written to '<label>_<n>.prof' in the profile directory
+    when the operation ends, see end_operation.
+
+    Args:
+    - label (str): Name of the operation, e.g. a menu choice.
+    """
+
+    global _active_profile
+    end_operation()
+    if _profile_dir is None or label is None:
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    _active_profile = (label, profiler)
+
+def end_operation():
+
+    """
+    Stop profiling the current operation and write its dump.
+    """
+
+    global _active_profile, _profile_count
+    if _active_profile is None:
+        return
+    label, profiler = _active_profile
+    profiler.disable()
+    _active_profile = None
+    _profile_count += 1
+    safe_label = ''.join(c if c.isalnum() else '_' for c in label)
+    profiler.dump_stats(os.path.join(_profile_dir, f'{safe_label}_{_profile_count}.prof'))
+
+@contextlib.contextmanager
+def profile_operation(label):
+
+    """
+    Profile the body of a with statement as one operation, see
+    begin_operation.
+    """
+
+    begin_operation(label)
+    try:
+        yield
+    finally:
+        end_operation()
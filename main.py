@@ -1,22 +1,66 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import analysis
-import plot
+import instrument
+import memo
+import validity
+from index import ThresholdIndex
+
+# Menu choices that need the dataset; the others can run while it loads
+DATA_CHOICES = ('1', '3', '4', '5', '6', '7')
+
+def load_plot():
+
+    """
+    Import the plot module, and with it matplotlib, on the first chart
+    only, so the menu does not wait for it.
+    """
+
+    import plot
+    return plot
+
+def load_dataset(filename):
+
+    """
+    Load the dataset and build its validity bitmaps and threshold index.
+
+    Args:
+    - filename (str): Path to the CSV file.
 
-def main():
+    Returns:
+    - data (numpy.ndarray or None): Loaded data.
+    - column_names (list or None): Column names.
+    - index (ThresholdIndex or None): Index of the data.
+    - mask (ValidityMask or None): Missing values of the data.
+    """
+
+    data, column_names = analysis.load_data(filename)
+    if data is None:
+        return None, None, None, None
+    return (data, column_names, ThresholdIndex(data),
+            validity.ValidityMask.from_array(data, column_names))
+
+def main(filename='data/housing.csv'):
 
     """
     Main function to run the program. Provides a menu-driven interface 
     for dataset analysis and visualization.
 
     Parameters:
-    None
+    filename (str): Path to the CSV file, loaded in the background.
 
     Returns:
     None
     """
 
-    filename = 'data/housing.csv'
-    data, column_names = analysis.load_data(filename)
+    instrument.enable_from_env()
+    # The dataset loads in a background thread while the menu is shown
+    loader = ThreadPoolExecutor(max_workers=1)
+    loading = loader.submit(load_dataset, filename)
+    loader.shutdown(wait=False)
+    data = None
 
     # if data is not None and column_names is not None:
     #     data = analysis.remove_missing_values(data)
@@ -27,13 +71,21 @@ def main():
         print("1. Display Dataset - Preview")
         print("2. Show Column Names")
         print("3. Show Basic Information")
-        print("4. Show and remove Missing Values or null values")
+        print("4. Show Missing Values or null values")
         print("5. Statistics: for all attributes in our dataset")
         print("6. Generalized Analysis")
         print("7. Visualizations")
-        print("8. Exit")
+        print("8. Show Result Cache and Instrumentation Report")
+        print("9. Exit")
+
+        instrument.end_operation()
+        choice = input("\nEnter your choice (1-9): ")
+        instrument.begin_operation(None if choice in ('6', '7') else f'menu {choice}')
 
-        choice = input("\nEnter your choice (1-8): ")
+        if data is None and choice in DATA_CHOICES:
+            data, column_names, index, mask = loading.result()
+            if data is None:
+                return
 
         if choice == '1':
             analysis.display_dataset_preview(data, column_names)
@@ -45,9 +97,10 @@ def main():
             analysis.show_basic_info(data)
 
         elif choice == '4':
-            analysis.show_missing_values(data, filename)
-            analysis.remove_missing_values(data)
-            print('Successfully removed missing values')
+            analysis.show_missing_values(data, filename, mask)
+            # The data is left as loaded: statistics and averages skip the
+            # missing values instead of counting them as 0
+            print('Missing values are skipped by the statistics and analyses')
 
         elif choice == '5':
             # Calculate missing value statistics
@@ -69,7 +122,9 @@ def main():
                 print("9. Relation between Statistical Operations of All Attributes - GRAPH")
                 print("10. Back to Main Menu")
 
+                instrument.end_operation()
                 choice = input("\nEnter your choice (1-10): ")
+                instrument.begin_operation(f'menu 6.{choice}')
 
                 if choice == '1':
                     income_mean = analysis.calculate_income_mean(data)
@@ -78,39 +133,39 @@ def main():
                 elif choice in ['2', '3', '4']:
                     n = int(input('Enter the number of bedrooms to check: '))
                     if choice == '2':
-                        avg_population_bedrooms_gt_n = analysis.calculate_avg_population_bedrooms_gt_n(data, n)
+                        avg_population_bedrooms_gt_n = analysis.calculate_avg_population_bedrooms_gt_n(data, n, index)
                         print(f"\nAverage Population in Areas with Bedrooms > {n} : \
                               {avg_population_bedrooms_gt_n}")
                     elif choice == '3':
-                        avg_house_value_bedrooms_gt_n = analysis.calculate_avg_house_value_bedrooms_gt_n(data, n)
+                        avg_house_value_bedrooms_gt_n = analysis.calculate_avg_house_value_bedrooms_gt_n(data, n, index)
                         print(f"\nAverage House Value in Areas with Bedrooms > {n}: \
                               {avg_house_value_bedrooms_gt_n}")
                     elif choice == '4':
-                        avg_income_bedrooms_gt_n = analysis.calculate_avg_income_bedrooms_gt_n(data, n)
+                        avg_income_bedrooms_gt_n = analysis.calculate_avg_income_bedrooms_gt_n(data, n, index)
                         print(f"""\nAverage Income in Areas with Bedrooms > {n}:
                               {avg_income_bedrooms_gt_n}""")
 
                 elif choice == '5':
-                    avg_income_rooms_gt_3 = analysis.calculate_avg_income_rooms_gt_3(data)
+                    avg_income_rooms_gt_3 = analysis.calculate_avg_income_rooms_gt_3(data, index)
                     print(f"\nAverage Income of People with More Than 3 Rooms per Household: \
                           {avg_income_rooms_gt_3}")
 
                 elif choice == '6':
-                    avg_population_high_density = analysis.calculate_avg_population_high_density(data)
+                    avg_population_high_density = analysis.calculate_avg_population_high_density(data, index)
                     print(f"\nAverage Population in Households with High Density (> 1000): \
                           {avg_population_high_density}")
 
                 elif choice == '7':
-                    avg_house_value_high_density = analysis.calculate_avg_house_value_high_density(data)
+                    avg_house_value_high_density = analysis.calculate_avg_house_value_high_density(data, index)
                     print(f"\nAverage House Value in Households with High Density (> 1000): \
                           {avg_house_value_high_density}")
 
                 elif choice == '8':
                     unique_bedrooms, avg_income_by_bedrooms = analysis.average_income_by_bedrooms(data)
-                    plot.plot_income_vs_bedrooms(unique_bedrooms, avg_income_by_bedrooms)
+                    load_plot().plot_income_vs_bedrooms(unique_bedrooms, avg_income_by_bedrooms)
 
                 elif choice == '9':
-                    plot.plot_statistics_bar(column_names, data)
+                    load_plot().plot_statistics_bar(column_names, data)
 
                 elif choice == '10':
                     break
@@ -120,6 +175,7 @@ def main():
 
         elif choice == '7':
             # Visualization submenu
+            plot = load_plot()
             while True:
                 print('\nChoose Visualization: ')
                 print("1. Plot Income Mean")
@@ -132,7 +188,9 @@ def main():
                 print("8. Plot Income vs Population for Areas with Income > n")
                 print("9. Back to Main Menu")
 
+                instrument.end_operation()
                 choice = input("\nEnter your choice (1-8): ")
+                instrument.begin_operation(f'menu 7.{choice}')
 
                 if choice == '1':
                     income_mean = analysis.calculate_income_mean(data)
@@ -141,13 +199,13 @@ def main():
                 elif choice in ['2', '3']:
                     n = int(input('Enter the number of bedrooms to check: '))
                     if choice == '2':
-                        plot.plot_avg_population_bedrooms_gt_n(data, n)
+                        plot.plot_avg_population_bedrooms_gt_n(data, n, index)
                     elif choice == '3':
-                        plot.plot_avg_house_value_bedrooms_gt_n(data, n)
+                        plot.plot_avg_house_value_bedrooms_gt_n(data, n, index)
 
                 elif choice == '4':
                     income_mean = analysis.calculate_income_mean(data)
-                    avg_population_high_density = analysis.calculate_avg_population_high_density(data)
+                    avg_population_high_density = analysis.calculate_avg_population_high_density(data, index)
                     labels = ['Income Mean', 'Avg Pop. in High Density Households']
                     values = [income_mean, avg_population_high_density]
                     plot.plot_income_density_bar(labels, values)
@@ -175,11 +233,23 @@ def main():
                     print("Invalid choice. Please enter a number from 1 to 9.")
 
         elif choice == '8':
+            cache_stats = memo.stats()
+            print(f"\nResult cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                  f"{cache_stats['entries']} entries, {cache_stats['bytes'] / 1e6:.2f} MB")
+            if instrument.is_enabled():
+                print(instrument.format_report())
+
+        elif choice == '9':
             print("Exiting the program.")
+            instrument.end_operation()
             break
 
         else:
-            print("Invalid choice. Please enter a number from 1 to 8.")
+            print("Invalid choice. Please enter a number from 1 to 9.")
 
 if __name__ == "__main__":
+    # Any argument selects the non-interactive command-line mode
+    if len(sys.argv) > 1:
+        import cli
+        sys.exit(cli.main())
     main()
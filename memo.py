@@ -0,0 +1,236 @@
+import collections
+import functools
+import sys
+import threading
+import weakref
+
+import numpy as np
+
+# Default limits of the shared result cache
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 256
+
+# Version of every dataset array seen by the cache, keyed by id(array).
+# Versions come from one counter and are never reused, so a new array that
+# gets the id of a freed one never matches its cached results.
+_versions = {}
+_version_counter = 0
+
+# Data kept with a dataset array (see dataset_store), keyed by version
+_stores = {}
+
+def _new_version():
+    global _version_counter
+    _version_counter += 1
+    return _version_counter
+
+def dataset_version(array):
+
+    """
+    Return the current version of a dataset array, registering it first.
+
+    Args:
+    - array (numpy.ndarray): Dataset array.
+
+    Returns:
+    - version (int): Version, changed by invalidate.
+    """
+
+    key = id(array)
+    if key not in _versions:
+        _versions[key] = _new_version()
+        weakref.finalize(array, _forget_array, key, _versions[key])
+    return _versions[key]
+
+def _forget_array(key, version):
+    if _versions.get(key) == version:
+        del _versions[key]
+    _stores.pop(version, None)
+    default_cache.discard_version(version)
+
+def dataset_store(array):
+
+    """
+    Return a dict for data computed from a dataset array and kept with
+    it, e.g. its derived columns.
+
+    Unlike cached results, its entries are never evicted and have no size
+    limit. The dict is dropped when the array is invalidated or freed.
+
+    Args:
+    - array (numpy.ndarray): Dataset array.
+
+    Returns:
+    - store (dict): Store of the array's current version.
+    """
+
+    return _stores.setdefault(dataset_version(array), {})
+
+def invalidate(array):
+
+    """
+    Mark a dataset array as modified in place, so results computed from
+    its earlier contents are dropped and never served again.
+
+    Args:
+    - array (numpy.ndarray): Dataset array that was modified.
+    """
+
+    key = id(array)
+    if key in _versions:
+        old_version = _versions[key]
+        _versions[key] = _new_version()
+        weakref.finalize(array, _forget_array, key, _versions[key])
+        _stores.pop(old_version, None)
+        default_cache.discard_version(old_version)
+
+def _freeze(value, versions):
+    # Hashable form of an argument; arrays stand for their identity and version
+    if isinstance(value, np.ndarray):
+        version = dataset_version(value)
+        versions.add(version)
+        return ('array', id(value), version)
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,) + tuple(_freeze(item, versions) for item in value)
+    if isinstance(value, dict):
+        return ('dict',) + tuple(sorted((k, _freeze(v, versions)) for k, v in value.items()))
+    hash(value)
+    return value
+
+def _size_of(value):
+    # Approximate memory held by a cached result
+    if isinstance(value, np.ndarray):
+        return value.nbytes + sys.getsizeof(value) if value.base is None else value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_size_of(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size_of(k) + _size_of(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+def _read_only(value):
+    # Cached arrays are shared between callers, so they must not be modified
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _read_only(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _read_only(item)
+    return value
+
+class ResultCache:
+
+    """
+    Least-recently-used cache of function results, keyed by the function,
+    its arguments and the version of every dataset array among them.
+
+    Arrays are identified by object, not by content: pass the whole
+    dataset array, and call invalidate after modifying it in place.
+
+    Args:
+    - max_bytes (int): Memory budget of the cached results.
+    - max_entries (int): Largest number of cached results.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        # key -> (result, size in bytes, dataset versions)
+        self.entries = collections.OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Guards the entries and counters; results are computed outside it.
+        # Reentrant, since a garbage-collected array discards its results.
+        self.lock = threading.RLock()
+
+    def call(self, func, *args, **kwargs):
+
+        """
+        Return func(*args, **kwargs), from the cache when possible.
+
+        Calls with unhashable arguments are not cached. Results larger than
+        the memory budget are returned without being cached.
+        """
+
+        versions = set()
+        try:
+            key = (func.__module__, func.__qualname__,
+                   _freeze(args, versions), _freeze(kwargs, versions))
+        except TypeError:
+            return func(*args, **kwargs)
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+
+        result = _read_only(func(*args, **kwargs))
+        size = _size_of(result)
+        if size <= self.max_bytes:
+            with self.lock:
+                self._remove(key)
+                self.entries[key] = (result, size, versions)
+                self.nbytes += size
+                while self.nbytes > self.max_bytes or len(self.entries) > self.max_entries:
+                    self._remove(next(iter(self.entries)))
+                    self.evictions += 1
+        return result
+
+    def _remove(self, key):
+        # Caller holds the lock
+        if key in self.entries:
+            _, size, _ = self.entries.pop(key)
+            self.nbytes -= size
+
+    def discard_version(self, version):
+
+        """
+        Drop the results computed from a dataset version.
+        """
+
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if version in entry[2]]:
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+
+        """
+        Return the hit and miss counters.
+
+        Returns:
+        - stats (dict): hits, misses, evictions, hit_rate, entries and bytes.
+        """
+
+        calls = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / calls if calls else 0.0,
+                'entries': len(self.entries), 'bytes': self.nbytes}
+
+# Cache shared by the functions decorated with memoize
+default_cache = ResultCache()
+
+def memoize(func):
+
+    """
+    Decorate a function whose result depends only on its arguments so its
+    results are kept in the shared cache.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return default_cache.call(func, *args, **kwargs)
+
+    return wrapper
+
+def stats():
+    return default_cache.stats()
@@ -0,0 +1,134 @@
+import contextlib
+import copy
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Worker count used when none is given
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+MODES = ('serial', 'thread', 'process')
+
+@contextlib.contextmanager
+def shared_array(data):
+
+    """
+    Copy an array into a shared memory block for worker processes.
+
+    Workers attach to the block by name (see attached_array) instead of
+    receiving a pickled copy of the array. The block is released when the
+    with statement ends.
+
+    Args:
+    - data (numpy.ndarray): Array to share.
+
+    Yields:
+    - spec (tuple): (block name, shape, dtype string) for attached_array.
+    """
+
+    memory = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+    try:
+        shared = np.ndarray(data.shape, dtype=data.dtype, buffer=memory.buf)
+        shared[...] = data
+        del shared
+        yield (memory.name, data.shape, data.dtype.str)
+    finally:
+        memory.close()
+        memory.unlink()
+
+@contextlib.contextmanager
+def attached_array(name, shape, dtype):
+
+    """
+    Map an array shared by shared_array, read-only, for the duration of a
+    with statement; the mapping is closed on exit, even when the body
+    raises. Views of the array must not outlive the with statement.
+
+    Yields:
+    - data (numpy.ndarray): Read-only view of the shared array.
+    """
+
+    memory = shared_memory.SharedMemory(name=name)
+    data = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+    data.flags.writeable = False
+    try:
+        yield data
+    finally:
+        del data
+        try:
+            memory.close()
+        except BufferError:
+            # A view is still held by an exception traceback; the mapping
+            # goes away with it
+            pass
+
+def _call_on_column(func, spec, column, args):
+    # Worker task; the result is copied out before the mapping is closed
+    with attached_array(*spec) as data:
+        result = copy.deepcopy(func(data[:, column], *args))
+        del data
+    return result
+
+def map_columns(func, data, columns, args=(), workers=None, mode='thread'):
+
+    """
+    Apply a function to columns of a 2-D array, in parallel.
+
+    Every call receives the column view data[:, i], whatever the mode, so
+    the results are exactly those of a serial loop.
+
+    Args:
+    - func (callable): Function of a 1-D column and the extra args. Must
+      be a module-level function in 'process' mode.
+    - data (numpy.ndarray): 2-D data, columns along axis 1.
+    - columns (iterable): Indices of the columns.
+    - args (tuple): Extra arguments of every call.
+    - workers (int): Number of workers, defaults to the CPU count; 1 runs
+      serially in this thread.
+    - mode (str): 'thread' shares the array with threads, which suits
+      NumPy code that releases the GIL; 'process' shares it with worker
+      processes through shared memory; 'serial' runs a plain loop.
+
+    Returns:
+    - results (list): One result per column, in order.
+    """
+
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {', '.join(MODES)}")
+    columns = list(columns)
+    workers = min(workers or DEFAULT_WORKERS, max(len(columns), 1))
+
+    if mode == 'serial' or workers == 1:
+        return [func(data[:, i], *args) for i in columns]
+    if mode == 'thread':
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda i: func(data[:, i], *args), columns))
+    with shared_array(data) as spec, ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_call_on_column, itertools.repeat(func), itertools.repeat(spec),
+                             columns, itertools.repeat(args)))
+
+def map_tasks(func, tasks, workers=None):
+
+    """
+    Apply a function to independent tasks in a thread pool, keeping their
+    order. Used for batches of queries on a shared, read-only session.
+
+    Args:
+    - func (callable): Function of one task.
+    - tasks (iterable): Tasks.
+    - workers (int): Number of threads, defaults to the CPU count; 1 runs
+      serially in this thread.
+
+    Returns:
+    - results (list): One result per task, in order.
+    """
+
+    tasks = list(tasks)
+    workers = min(workers or DEFAULT_WORKERS, max(len(tasks), 1))
+    if workers == 1:
+        return [func(task) for task in tasks]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, tasks))
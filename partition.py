@@ -0,0 +1,351 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import analysis
+import derived
+import query
+from table import Table
+
+# Bump whenever the on-disk layout changes
+PARTITION_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+DEFAULT_ROWS_PER_PARTITION = 100_000
+
+def zone_map(data, column_names):
+
+    """
+    Compute the min, max and null count of every column of a partition.
+
+    Args:
+    - data (numpy.ndarray): 2-D float data of the partition, NaN where
+      missing (see Table.to_array).
+    - column_names (list): List of column names.
+
+    Returns:
+    - zones (dict): Per column name, 'min' and 'max' (None if every value
+      is missing) and 'null_count'.
+    """
+
+    zones = {}
+    for i, name in enumerate(column_names):
+        values = data[:, i]
+        missing = np.isnan(values)
+        null_count = int(np.count_nonzero(missing))
+        if null_count == values.size:
+            zones[name] = {'min': None, 'max': None, 'null_count': null_count}
+        else:
+            present = values[~missing] if null_count else values
+            zones[name] = {'min': float(np.min(present)), 'max': float(np.max(present)),
+                           'null_count': null_count}
+    return zones
+
+def may_match(zone, operator, value):
+
+    """
+    Check whether a zone map allows a row of the partition to satisfy a
+    predicate. Missing values never compare true, except with '!='.
+
+    Args:
+    - zone (dict): Zone map of the predicate's column.
+    - operator (str): One of query.OPERATORS.
+    - value (float): Compared value.
+
+    Returns:
+    - possible (bool): False if no row can match.
+    """
+
+    if zone['min'] is None:
+        return operator == '!='
+    low, high = zone['min'], zone['max']
+    if operator == '>':
+        return high > value
+    if operator == '>=':
+        return high >= value
+    if operator == '<':
+        return low < value
+    if operator == '<=':
+        return low <= value
+    if operator == '==':
+        return low <= value <= high
+    if operator == '!=':
+        return not (low == high == value and zone['null_count'] == 0)
+    raise ValueError(f"Unknown operator '{operator}', expected one of "
+                     f"{', '.join(query.OPERATORS)}")
+
+def partition_rows(loaded, by=None, rows_per_partition=DEFAULT_ROWS_PER_PARTITION, order_by=None):
+
+    """
+    Split the rows of a table into partitions.
+
+    Args:
+    - loaded (Table): Table to split.
+    - by (str): Optional categorical column; every category (and missing
+      values) gets its own partitions.
+    - rows_per_partition (int): Largest number of rows per partition.
+    - order_by (str): Optional column to sort the rows by first (missing
+      values last), so that its zone maps do not overlap.
+
+    Returns:
+    - partitions (list): (key, row indices) pairs; the key is the category
+      name, or None.
+    """
+
+    if rows_per_partition < 1:
+        raise ValueError("rows_per_partition must be at least 1")
+    rows = np.arange(loaded.num_rows)
+    if order_by is not None:
+        rows = np.argsort(loaded.values(order_by), kind='stable')
+
+    groups = [(None, rows)]
+    if by is not None:
+        if not loaded.is_categorical(by):
+            raise ValueError(f"Column '{by}' is not categorical")
+        codes = loaded.column(by)[rows]
+        order = np.argsort(codes, kind='stable')
+        values, starts = np.unique(codes[order], return_index=True)
+        names = loaded.categories[by]
+        groups = [(names[code] if code < len(names) else None, rows[order[start:end]])
+                  for code, start, end in zip(values, starts, list(starts[1:]) + [rows.size])]
+
+    return [(key, group[start:start + rows_per_partition])
+            for key, group in groups
+            for start in range(0, max(group.size, 1), rows_per_partition)]
+
+def write_partitioned(loaded, directory, by=None, rows_per_partition=DEFAULT_ROWS_PER_PARTITION,
+                      order_by=None):
+
+    """
+    Write a table as a partitioned dataset directory.
+
+    Every partition is a subdirectory with one '.npy' file per column, in
+    the column's own type; a JSON manifest records the columns, categories
+    and, per partition, its row count and the zone map of every column.
+    The manifest is written last, so an interrupted write is never
+    mistaken for a complete dataset.
+
+    Args:
+    - loaded (Table): Table to write, see analysis.load_table.
+    - directory (str): Output directory.
+    - by, rows_per_partition, order_by: Partitioning, see partition_rows.
+
+    Returns:
+    - dataset (PartitionedDataset): The written dataset.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    partitions = []
+    for number, (key, rows) in enumerate(partition_rows(loaded, by, rows_per_partition,
+                                                        order_by)):
+        part = Table([loaded.column(name)[rows] for name in loaded.column_names],
+                     loaded.column_names, loaded.categories)
+        path = f'part-{number:04d}'
+        os.makedirs(os.path.join(directory, path), exist_ok=True)
+        for i, name in enumerate(part.column_names):
+            np.save(os.path.join(directory, path, f'{i:03d}.npy'), part.column(name))
+        partitions.append({'path': path, 'key': key, 'rows': int(rows.size),
+                           'zone_map': zone_map(part.to_array(), part.column_names)})
+
+    manifest = {
+        'version': PARTITION_VERSION,
+        'column_names': loaded.column_names,
+        'categories': loaded.categories,
+        'partitioning': {'by': by, 'rows_per_partition': rows_per_partition,
+                         'order_by': order_by},
+        'rows': int(loaded.num_rows),
+        'partitions': partitions,
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return PartitionedDataset(directory)
+
+class PartitionedDataset:
+
+    """
+    Dataset directory written by write_partitioned.
+
+    Queries (see query.Query) first drop the partitions whose zone maps
+    prove that no row satisfies every predicate, then read only the
+    needed columns of the others, memory-mapped, and merge the partial
+    aggregates. query.run and query.select accept a PartitionedDataset in
+    place of a data array, so the analysis and plot functions built on
+    them prune partitions too. The partitions scanned and pruned are
+    counted in scan_stats.
+
+    Args:
+    - directory (str): Dataset directory.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, MANIFEST_NAME), 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != PARTITION_VERSION:
+            raise ValueError(f"Unsupported partitioned dataset version in '{directory}'")
+        self.directory = directory
+        self.manifest = manifest
+        self.column_names = manifest['column_names']
+        self.categories = manifest['categories']
+        self.partitions = manifest['partitions']
+        self.num_rows = manifest['rows']
+        self.last_scan = None
+        self.scan_stats = {'queries': 0, 'partitions_scanned': 0, 'partitions_pruned': 0,
+                           'rows_scanned': 0, 'rows_pruned': 0}
+
+    def partition_table(self, number, columns=None):
+
+        """
+        Return some columns of a partition as a memory-mapped Table.
+        """
+
+        part = self.partitions[number]
+        columns = self.column_names if columns is None else columns
+        return Table([np.load(os.path.join(self.directory, part['path'],
+                                           f'{self.column_names.index(name):03d}.npy'),
+                              mmap_mode='r') for name in columns],
+                     columns, {name: self.categories[name] for name in columns
+                               if name in self.categories})
+
+    def prune(self, where=()):
+
+        """
+        Return the partitions that may hold rows satisfying every predicate,
+        and record the scan in last_scan and scan_stats. Predicates on
+        derived columns, which have no zone map, prune nothing.
+
+        Args:
+        - where (sequence): Predicates (column, operator, value).
+
+        Returns:
+        - numbers (list): Numbers of the partitions to scan.
+        """
+
+        numbers = [number for number, part in enumerate(self.partitions)
+                   if all(may_match(part['zone_map'][column], operator, value)
+                          for column, operator, value in where
+                          if column in part['zone_map'])]
+        rows = sum(self.partitions[number]['rows'] for number in numbers)
+        self.last_scan = {'partitions': len(self.partitions), 'partitions_scanned': len(numbers),
+                          'partitions_pruned': len(self.partitions) - len(numbers),
+                          'rows_scanned': rows, 'rows_pruned': self.num_rows - rows}
+        self.scan_stats['queries'] += 1
+        for key in ('partitions_scanned', 'partitions_pruned', 'rows_scanned', 'rows_pruned'):
+            self.scan_stats[key] += self.last_scan[key]
+        return numbers
+
+    def _scan(self, where, columns):
+        # Query over the needed columns of every partition left after pruning;
+        # derived columns are computed from their stored columns
+        needed = list(dict.fromkeys(name for column in [column for column, _, _ in where]
+                                    + list(columns) for name in derived.base_columns(column)))
+        for number in self.prune(where):
+            yield self.partition_table(number, needed).to_array(), needed
+
+    def run(self, where=(), aggregates=(('count', None),)):
+
+        """
+        Evaluate a query over the partitions, see query.Query.run.
+        """
+
+        # Validate names and operators once, against the full schema
+        query.Query(where, aggregates, self.column_names)
+        partial = [('count', None)] + [('sum' if agg == 'mean' else agg, column)
+                                       for agg, column in aggregates if agg != 'count']
+        columns = [column for _, column in partial if column is not None]
+
+        count = 0
+        totals = {}
+        for data, needed in self._scan(where, columns):
+            result = query.Query(where, partial, needed).run(data)
+            if result['count'] == 0:
+                continue
+            count += result['count']
+            for agg, column in partial[1:]:
+                key = f'{agg}_{column}'
+                if key not in totals:
+                    totals[key] = result[key]
+                elif agg == 'sum':
+                    totals[key] += result[key]
+                else:
+                    reduce = np.minimum if agg == 'min' else np.maximum
+                    totals[key] = float(reduce(totals[key], result[key]))
+
+        merged = {}
+        for agg, column in aggregates:
+            key = agg if column is None else f'{agg}_{column}'
+            if agg == 'count':
+                merged[key] = count
+            elif agg == 'mean':
+                merged[key] = totals[f'sum_{column}'] / count if count else np.nan
+            elif agg == 'sum':
+                merged[key] = totals.get(key, 0.0)
+            else:
+                merged[key] = totals.get(key, np.nan)
+        return merged
+
+    def select(self, where, columns):
+
+        """
+        Return the values of some columns in the rows satisfying the
+        predicates, see query.Query.select.
+        """
+
+        query.Query(where, (), self.column_names)
+        parts = [query.Query(where, (), needed).select(data, columns)
+                 for data, needed in self._scan(where, columns)]
+        if not parts:
+            return [np.empty(0) for _ in columns]
+        return [np.concatenate([part[i] for part in parts]) for i in range(len(columns))]
+
+    def to_table(self):
+
+        """
+        Return all partitions as one Table, in partition order.
+        """
+
+        parts = [self.partition_table(number) for number in range(len(self.partitions))]
+        return Table([np.concatenate([part.column(name) for part in parts])
+                      for name in self.column_names], self.column_names, self.categories)
+
+def load(directory):
+
+    """
+    Open a partitioned dataset directory.
+
+    Returns:
+    - dataset (PartitionedDataset or None): Dataset, or None if the
+      directory holds no readable manifest.
+    """
+
+    try:
+        return PartitionedDataset(directory)
+    except (OSError, ValueError) as e:
+        print(f"Error: '{directory}' is not a partitioned dataset: {e}")
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Write a CSV file as a partitioned dataset directory with zone maps.')
+    parser.add_argument('data', help='Path to the dataset CSV')
+    parser.add_argument('directory', help='Output directory')
+    parser.add_argument('--by', help='Categorical column, one partition set per category')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS_PER_PARTITION,
+                        help='Largest number of rows per partition')
+    parser.add_argument('--order-by', help='Sort the rows by this column first')
+    args = parser.parse_args(argv)
+
+    loaded = analysis.load_table(args.data)
+    if loaded is None:
+        return 1
+    dataset = write_partitioned(loaded, args.directory, args.by, args.rows, args.order_by)
+    for part in dataset.partitions:
+        print(f"{part['path']}  {part['rows']:>8} rows  {part['key'] or ''}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
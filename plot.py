@@ -1,13 +1,66 @@
 import matplotlib.pyplot as plt
 import numpy as np
+import analysis
+import downsample
+import memo
+import parallel
+import query
+import validity
 
-def plot_income_mean(income_mean):
+def show_or_save(save_path=None):
+
+    """
+    Show the current figure, or save it to a file and close it.
+
+    Args:
+    - save_path (str): Optional output path; the format follows its
+      extension, e.g. '.png' or '.svg'.
+    """
+
+    if save_path is None:
+        plt.show()
+    else:
+        plt.savefig(save_path)
+        plt.close()
+
+def draw_points(x, y, mode='auto', **scatter_kwargs):
+
+    """
+    Draw points as a scatter plot, a sampled scatter plot or a density
+    heatmap, so large row counts stay fast to render.
+
+    Args:
+    - x (numpy.ndarray): x values.
+    - y (numpy.ndarray): y values.
+    - mode (str): 'scatter' draws every point, 'sample' a stratified
+      sample, 'density' a 2-D histogram; 'auto' scatters up to
+      downsample.MAX_SCATTER_POINTS points and samples above that.
+    - scatter_kwargs: Keyword arguments of plt.scatter.
+    """
+
+    if mode == 'auto':
+        mode = 'scatter' if x.size <= downsample.MAX_SCATTER_POINTS else 'sample'
+
+    if mode == 'density':
+        counts, x_edges, y_edges = downsample.density_grid(x, y)
+        plt.pcolormesh(x_edges, y_edges, counts.T, cmap='Blues')
+        plt.colorbar(label='Rows')
+        return
+    if mode == 'sample':
+        rows = downsample.stratified_sample(x)
+        x, y = x[rows], y[rows]
+    elif mode != 'scatter':
+        raise ValueError(f"Unknown mode '{mode}', expected auto, scatter, sample or density")
+    plt.scatter(x, y, **scatter_kwargs)
+
+def plot_income_mean(income_mean, save_path=None):
 
     """
     Plot the income mean.
 
     Args:
     - income_mean (float): Mean income value.
+    - save_path (str): Optional path to save the plot to instead of showing it.
     """
 
     plt.figure(figsize=(8, 6))
@@ -16,9 +69,9 @@ def plot_income_mean(income_mean):
     plt.ylabel('Income')
     plt.xticks(rotation=45)
     plt.tight_layout()
-    plt.show()
+    show_or_save(save_path)
 
-def plot_income_population(data, income_threshold):
+def plot_income_population(data, income_threshold, save_path=None, mode='auto'):
 
     """
     Plots income per household and population in areas where income is 
@@ -27,29 +80,26 @@ def plot_income_population(data, income_threshold):
     Parameters:
     data (numpy.ndarray): The numpy array containing the dataset.
     income_threshold (float): The income value to filter the dataset.
+    save_path (str): Optional path to save the plot to instead of showing it.
+    mode (str): How to draw the points, see draw_points.
 
     Returns:
     None
     """
 
-    income_column_index = -3
-    population_column_index = -6
-    # Filter the dataset
-    filtered_data = data[data[:, income_column_index] > income_threshold]
-
-    # Extract income and population
-    income = filtered_data[:, income_column_index]
-    population = filtered_data[:, population_column_index]
+    # Filter the dataset, copying only the two plotted columns
+    income, population = query.select(data, [('median_income', '>', income_threshold)],
+                                      ['median_income', 'population'])
 
     plt.figure(figsize=(10, 6))
-    plt.scatter(income, population, alpha=0.5, c='blue', edgecolors='w', s=50)
+    draw_points(income, population, mode, alpha=0.5, c='blue', edgecolors='w', s=50)
     plt.title(f'Income vs Population for Areas with Income > {income_threshold}')
     plt.xlabel('Income per Household')
     plt.ylabel('Population')
     plt.grid(True)
-    plt.show()
+    show_or_save(save_path)
 
-def plot_avg_population_bedrooms_gt_n(data, n):
+def plot_avg_population_bedrooms_gt_n(data, n, index=None, save_path=None):
 
     """
     Plot the average population in areas with bedrooms greater than n.
@@ -57,10 +107,11 @@ def plot_avg_population_bedrooms_gt_n(data, n):
     Args:
     - data (numpy.ndarray): Input data.
     - n (int): Number of bedrooms threshold.
+    - index (ThresholdIndex): Optional prebuilt index answering the query.
+    - save_path (str): Optional path to save the plot to instead of showing it.
     """
 
-    bedrooms_gt_n = data[data[:, 4] > n]
-    avg_population_bedrooms_gt_n = np.mean(bedrooms_gt_n[:, 5])
+    avg_population_bedrooms_gt_n = analysis.calculate_avg_population_bedrooms_gt_n(data, n, index)
 
     plt.figure(figsize=(8, 6))
     plt.bar([f'Avg Pop. in Bedrooms > {n}'], [avg_population_bedrooms_gt_n], 
@@ -69,9 +120,9 @@ def plot_avg_population_bedrooms_gt_n(data, n):
     plt.ylabel('Population')
     plt.xticks(rotation=45)
     plt.tight_layout()
-    plt.show()
+    show_or_save(save_path)
 
-def plot_income_density_bar(labels, values):
+def plot_income_density_bar(labels, values, save_path=None):
 
     """
     Plot income mean vs average population in high density households.
@@ -79,6 +130,7 @@ def plot_income_density_bar(labels, values):
     Args:
     - labels (list): List of labels for the bars.
     - values (list): Corresponding values for the bars.
+    - save_path (str): Optional path to save the plot to instead of showing it.
     """
 
     plt.figure(figsize=(12, 6))
@@ -87,9 +139,9 @@ def plot_income_density_bar(labels, values):
     plt.title('Income Mean and Avg Pop. in High Density Households')
     plt.ylabel('Values')
     plt.tight_layout()
-    plt.show()
+    show_or_save(save_path)
 
-def plot_avg_house_value_bedrooms_gt_n(data, n):
+def plot_avg_house_value_bedrooms_gt_n(data, n, index=None, save_path=None):
 
     """
     Plot the average house value in areas with bedrooms greater than n.
@@ -97,10 +149,11 @@ def plot_avg_house_value_bedrooms_gt_n(data, n):
     Args:
     - data (numpy.ndarray): Input data.
     - n (int): Number of bedrooms threshold.
+    - index (ThresholdIndex): Optional prebuilt index answering the query.
+    - save_path (str): Optional path to save the plot to instead of showing it.
     """
 
-    bedrooms_gt_n = data[data[:, 4] > n]
-    avg_house_value_bedrooms_gt_n = np.mean(bedrooms_gt_n[:, 8])
+    avg_house_value_bedrooms_gt_n = analysis.calculate_avg_house_value_bedrooms_gt_n(data, n, index)
 
     plt.figure(figsize=(8, 6))
     plt.bar([f'Avg House Value in Bedrooms > {n}'], [avg_house_value_bedrooms_gt_n], 
@@ -111,9 +164,10 @@ def plot_avg_house_value_bedrooms_gt_n(data, n):
     plt.ylim(0, max(avg_house_value_bedrooms_gt_n * 1.2, 400000))
     plt.grid(True)
     plt.tight_layout()
-    plt.show()
+    show_or_save(save_path)
 
-def plot_income_vs_bedrooms(unique_bedrooms, avg_income_by_bedrooms):
+def plot_income_vs_bedrooms(unique_bedrooms, avg_income_by_bedrooms, save_path=None,
+                            mode='auto'):
 
     """
     Plot average income vs total bedrooms.
@@ -122,19 +176,59 @@ def plot_income_vs_bedrooms(unique_bedrooms, avg_income_by_bedrooms):
     - unique_bedrooms (numpy.ndarray): Unique values of total bedrooms.
     - avg_income_by_bedrooms (numpy.ndarray): Average income corresponding
       to each unique total bedrooms value.
+    - save_path (str): Optional path to save the plot to instead of showing it.
+    - mode (str): How to draw the points, see draw_points.
     """
 
     plt.figure(figsize=(10, 6))
-    plt.scatter(unique_bedrooms, avg_income_by_bedrooms, marker='o', color='blue', 
+    draw_points(unique_bedrooms, avg_income_by_bedrooms, mode, marker='o', color='blue',
                 alpha=0.7)
     plt.title('Average Income vs. Total Bedrooms')
     plt.xlabel('Total Bedrooms')
     plt.ylabel('Average Income')
     plt.grid(True)
     plt.tight_layout()
-    plt.show()
+    show_or_save(save_path)
+
+def draw_histogram(column, values, histogram=None):
+
+    """
+    Draw the 30-bin histogram of one attribute on the current axes.
+
+    The bin counts are computed first and only the bins are handed to
+    matplotlib, so the cost of drawing does not grow with the row count.
+
+    Args:
+    - column (str): Column name.
+    - values (numpy.ndarray): Column values.
+    - histogram (tuple): Optional (counts, edges) computed beforehand,
+      see downsample.histogram_counts.
+    """
+
+    counts, edges = histogram or downsample.histogram_counts(values, bins=30)
+    plt.hist(edges[:-1], bins=edges, weights=counts, edgecolor='black')
+    plt.title(f'Histogram of {column}')
+    plt.xlabel(column)
+    plt.ylabel('Frequency')
+    plt.grid(True)
+
+def plot_histogram(column, values, save_path=None):
+
+    """
+    Plot the frequency histogram of a single attribute.
+
+    Args:
+    - column (str): Column name.
+    - values (numpy.ndarray): Column values.
+    - save_path (str): Optional path to save the plot to instead of showing it.
+    """
+
+    plt.figure(figsize=(8, 6))
+    draw_histogram(column, values)
+    plt.tight_layout()
+    show_or_save(save_path)
 
-def plot_frequency(column_names, data):
+def plot_frequency(column_names, data, save_path=None, workers=None):
 
     """
     Plot frequency vs attribute relation for every attribute
@@ -142,59 +236,97 @@ def plot_frequency(column_names, data):
     Args:
     - column_names (list): List of column names.
     - data (numpy.ndarray): Input data.
+    - save_path (str): Optional path to save the plot to instead of showing it.
+    - workers (int): Threads computing the histograms, defaults to the
+      CPU count.
     """
 
+    histograms = parallel.map_columns(downsample.histogram_counts, data,
+                                      range(len(column_names)), workers=workers)
     plt.figure(figsize=(15, 20))
 
     for i, column in enumerate(column_names):
         plt.subplot(len(column_names) // 3 + 1, 3, i + 1)
-        plt.hist(data[:, i], bins=30, edgecolor='black')
-        plt.title(f'Histogram of {column}')
-        plt.xlabel(column)
-        plt.ylabel('Frequency')
-        plt.grid(True)
+        draw_histogram(column, data[:, i], histograms[i])
 
     plt.tight_layout()
-    plt.show()
+    show_or_save(save_path)
 
-def plot_statistics_bar(column_names, data):
+@memo.memoize
+def statistics_panels(column_names, data, workers=None):
 
     """
-    Plot bar charts for statistical operations (min, max, median, mean) 
-    of selected attributes.
+    Compute the panels of the statistics bar chart. The medians, the
+    costly part, are computed per column in parallel. Missing values are
+    skipped.
 
     Args:
     - column_names (list): List of column names.
     - data (numpy.ndarray): Input data.
+    - workers (int): Threads computing the medians, defaults to the CPU
+      count.
+
+    Returns:
+    - panels (list): One (title, labels, values, color) tuple per panel:
+      minimum, maximum, median and mean values.
     """
 
-    selected_data = data[:, [3,5,6,7]]
-    stats_min = np.min(selected_data, axis=0)
-    stats_max = np.max(data[:, [3,4,5,6]], axis=0)
-    stats_median = np.median(data[:, :-2], axis=0)
-    stats_mean = np.mean(data[:, :-2], axis=0)
+    mask = validity.ValidityMask.from_array(data, column_names)
+    stats_min = np.array([mask.min(data, i) for i in [3,5,6,7]])
+    stats_max = np.array([mask.max(data, i) for i in [3,4,5,6]])
+    stats_median = np.array(parallel.map_columns(analysis.column_median, data,
+                                                 range(data.shape[1] - 2), workers=workers))
+    stats_mean = np.array([mask.mean(data, i) for i in range(data.shape[1] - 2)])
 
-    fig, axs = plt.subplots(4, 1, figsize=(10, 20))
+    selected_labels = ['Total rooms per area', 'Population', 'household', 'median income']
+    return [
+        ('Minimum Values', selected_labels, stats_min, 'blue'),
+        ('Maximum Values', selected_labels, stats_max, 'green'),
+        ('Median Values', column_names[:-2], stats_median, 'orange'),
+        ('Mean Values', column_names[:-2], stats_mean, 'red'),
+    ]
 
-    axs[0].bar(['Total rooms per area', 'Population', 'household', 'median income'],
-                stats_min, color='blue', alpha=0.7)
-    axs[0].set_title('Minimum Values')
-    axs[0].set_ylabel('Value')
+def plot_statistics_panel(title, labels, values, color, save_path=None):
 
-    axs[1].bar(['Total rooms per area', 'Population', 'household', 'median income'], 
-               stats_max, color='green', alpha=0.7)
-    axs[1].set_title('Maximum Values')
-    axs[1].set_ylabel('Value')
-
-    axs[2].bar(column_names[:-2], stats_median, color='orange', alpha=0.7)
-    axs[2].set_title('Median Values')
-    axs[2].set_ylabel('Value')
+    """
+    Plot a single panel of the statistics bar chart.
 
-    axs[3].bar(column_names[:-2], stats_mean, color='red', alpha=0.7)
-    axs[3].set_title('Mean Values')
-    axs[3].set_ylabel('Value')
+    Args:
+    - title (str): Panel title.
+    - labels (list): Bar labels.
+    - values (numpy.ndarray): Bar values.
+    - color (str): Bar color.
+    - save_path (str): Optional path to save the plot to instead of showing it.
+    """
 
+    plt.figure(figsize=(10, 5))
+    plt.bar(labels, values, color=color, alpha=0.7)
+    plt.title(title)
+    plt.ylabel('Value')
     plt.tight_layout()
-    plt.show()
+    show_or_save(save_path)
+
+def plot_statistics_bar(column_names, data, save_path=None, workers=None):
+
+    """
+    Plot bar charts for statistical operations (min, max, median, mean) 
+    of selected attributes.
+
+    Args:
+    - column_names (list): List of column names.
+    - data (numpy.ndarray): Input data.
+    - save_path (str): Optional path to save the plot to instead of showing it.
+    - workers (int): Threads computing the medians, defaults to the CPU
+      count.
+    """
 
+    fig, axs = plt.subplots(4, 1, figsize=(10, 20))
+    panels = statistics_panels(column_names, data, workers)
+
+    for ax, (title, labels, values, color) in zip(axs, panels):
+        ax.bar(labels, values, color=color, alpha=0.7)
+        ax.set_title(title)
+        ax.set_ylabel('Value')
 
+    plt.tight_layout()
+    show_or_save(save_path)
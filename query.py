@@ -0,0 +1,220 @@
+import numpy as np
+import derived
+import partition
+import table
+
+# Comparison operators of the predicates
+OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+
+AGGREGATIONS = ('count', 'sum', 'mean', 'min', 'max')
+
+class Query:
+
+    """
+    Filter/aggregate query over the columns of a 2-D data array, referring
+    to columns by name. Derived columns (see derived.DERIVED_COLUMNS) can
+    be used like stored ones; they are computed on first use.
+
+    The predicates are combined with "and" into one boolean mask, built in
+    a single buffer; every aggregate is then a masked reduction of its
+    column over that mask, with no copy of the selected rows. Each needed
+    column is summed once, however many aggregates use it.
+
+    Like numpy.mean over the selected rows, aggregates are NaN when a
+    selected value is NaN, and 'count' counts the selected rows. With a
+    validity mask (see validity.ValidityMask), the missing values of the
+    aggregated columns are skipped instead.
+
+    Args:
+    - where (sequence): Predicates (column, operator, value), e.g.
+      ('total_bedrooms', '>', 3); operators are the keys of OPERATORS.
+    - aggregates (sequence): Aggregates (aggregation, column), e.g.
+      ('mean', 'population'); the column of 'count' may be None.
+    - column_names (sequence): Column names of the data, by default the
+      housing dataset's.
+    """
+
+    def __init__(self, where=(), aggregates=(('count', None),),
+                 column_names=table.COLUMN_NAMES):
+        self.column_names = list(column_names)
+        self.predicates = []
+        for column, operator, value in where:
+            if operator not in OPERATORS:
+                raise ValueError(f"Unknown operator '{operator}', expected one of "
+                                 f"{', '.join(OPERATORS)}")
+            self.predicates.append((self._position(column), OPERATORS[operator], value))
+
+        self.aggregates = []
+        for agg, column in aggregates:
+            if agg not in AGGREGATIONS:
+                raise ValueError(f"Unknown aggregation '{agg}', expected one of {AGGREGATIONS}")
+            if column is None and agg != 'count':
+                raise ValueError(f"Aggregation '{agg}' needs a column")
+            self.aggregates.append((agg, column, None if column is None else
+                                    self._position(column)))
+
+    def _position(self, column):
+        # Index of a stored column, or the name of a derived one
+        if column in self.column_names:
+            return self.column_names.index(column)
+        if derived.is_derived(column) and all(name in self.column_names
+                                              for name in derived.base_columns(column)):
+            return column
+        raise KeyError(f"Unknown column '{column}'")
+
+    def _values(self, data, position):
+        if isinstance(position, str):
+            return derived.values(data, position, self.column_names)
+        return data[:, position]
+
+    def mask(self, data):
+
+        """
+        Return the rows satisfying every predicate.
+
+        Args:
+        - data (numpy.ndarray): 2-D data with the query's columns.
+
+        Returns:
+        - mask (numpy.ndarray or True): Boolean mask of the rows, True when
+          the query has no predicate.
+        """
+
+        if not self.predicates:
+            return True
+        mask = np.empty(data.shape[0], dtype=bool)
+        scratch = np.empty(data.shape[0], dtype=bool) if len(self.predicates) > 1 else None
+        for i, (column, operator, value) in enumerate(self.predicates):
+            if i == 0:
+                operator(self._values(data, column), value, out=mask)
+            else:
+                operator(self._values(data, column), value, out=scratch)
+                mask &= scratch
+        return mask
+
+    def run(self, data, validity=None):
+
+        """
+        Evaluate the aggregates over the rows satisfying the predicates.
+
+        Args:
+        - data (numpy.ndarray): 2-D data with the query's columns.
+        - validity (ValidityMask): Optional validity of the data; missing
+          values of the aggregated columns are then left out of their
+          aggregates (but not of 'count').
+
+        Returns:
+        - result (dict): Value of every aggregate, keyed by
+          '<aggregation>_<column>' ('count' for a count without column).
+          Aggregates over no row are NaN, except counts and sums (0).
+        """
+
+        mask = self.mask(data)
+        count = data.shape[0] if mask is True else int(np.count_nonzero(mask))
+        sums = {}
+        result = {}
+        for agg, column, position in self.aggregates:
+            key = agg if column is None else f'{agg}_{column}'
+            if agg == 'count':
+                result[key] = count
+                continue
+            values = self._values(data, position)
+            where, valid_count = mask, count
+            if validity is not None and isinstance(position, str):
+                where = ~np.isnan(values) & mask
+                valid_count = int(np.count_nonzero(where))
+            elif validity is not None and validity.null_count(position):
+                where = validity.valid(position) & mask
+                valid_count = int(np.count_nonzero(where))
+            if agg in ('sum', 'mean'):
+                if position not in sums:
+                    sums[position] = float(np.sum(values, where=where, dtype=np.float64))
+                if agg == 'sum':
+                    result[key] = sums[position]
+                else:
+                    result[key] = sums[position] / valid_count if valid_count else np.nan
+            elif valid_count == 0:
+                result[key] = np.nan
+            else:
+                reduce = np.min if agg == 'min' else np.max
+                initial = np.inf if agg == 'min' else -np.inf
+                result[key] = float(reduce(values, where=where, initial=initial))
+        return result
+
+    def select(self, data, columns):
+
+        """
+        Return the values of some columns in the rows satisfying the
+        predicates, e.g. for a scatter plot. Only these columns are copied.
+
+        Args:
+        - data (numpy.ndarray): 2-D data with the query's columns.
+        - columns (sequence): Column names.
+
+        Returns:
+        - values (list): 1-D array of selected values per column.
+        """
+
+        mask = self.mask(data)
+        positions = [self._position(column) for column in columns]
+        if mask is True:
+            return [self._values(data, position).copy() for position in positions]
+        return [self._values(data, position)[mask] for position in positions]
+
+def run(data, where=(), aggregates=(('count', None),), column_names=table.COLUMN_NAMES,
+        validity=None):
+
+    """
+    Compile and evaluate a query, see Query.
+
+    For example run(data, [('population', '>', 1000)],
+    [('mean', 'median_house_value'), ('count', None)]) returns
+    {'mean_median_house_value': ..., 'count': ...}.
+
+    data may also be a partitioned dataset (see partition.py), which skips
+    the partitions whose zone maps rule out every row. An optional
+    validity mask of an array skips missing values, see Query.run.
+    """
+
+    if isinstance(data, partition.PartitionedDataset):
+        return data.run(where, aggregates)
+    return Query(where, aggregates, column_names).run(data, validity)
+
+def select(data, where, columns, column_names=table.COLUMN_NAMES):
+
+    """
+    Return the values of some columns in the rows satisfying the
+    predicates, see Query.select; data may be a partitioned dataset, as
+    in run.
+    """
+
+    if isinstance(data, partition.PartitionedDataset):
+        return data.select(where, columns)
+    return Query(where, (), column_names).select(data, columns)
+
+def average(data, column, where=(), column_names=table.COLUMN_NAMES, validity=None):
+
+    """
+    Return the average of one column over the rows satisfying the
+    predicates, see Query.
+
+    Args:
+    - data (numpy.ndarray): Input data.
+    - column (str): Name of the column to average.
+    - where (sequence): Predicates (column, operator, value).
+    - column_names (sequence): Column names of the data.
+    - validity (ValidityMask): Optional validity of the data, to average
+      only the valid values.
+
+    Returns:
+    - avg (float): Average, NaN if no row is selected.
+    """
+
+    return run(data, where, [('mean', column)], column_names, validity)[f'mean_{column}']
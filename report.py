@@ -0,0 +1,213 @@
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import analysis
+import derived
+
+# Charts of the "Visualizations" menu
+PLOTS = ('income_mean', 'population_bedrooms_gt_n', 'house_value_bedrooms_gt_n',
+         'income_density', 'frequency', 'income_vs_bedrooms', 'statistics',
+         'income_population')
+
+# Session of a report worker process, loaded once by init_worker
+_worker_session = None
+
+def load_plot():
+
+    """
+    Import the plot module with the non-interactive Agg backend, so charts
+    render without a display and plt.show() never blocks.
+    """
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import plot
+    return plot
+
+def draw_chart(name, session, save_path, n=3, income_threshold=5, column=None, panel=0,
+               scatter_mode='auto'):
+
+    """
+    Render one chart of the dataset to a file.
+
+    Args:
+    - name (str): One of PLOTS, 'histogram' (one attribute of the
+      frequency chart) or 'statistics_panel' (one panel of the statistics
+      chart).
+    - session (dict): Loaded session, see analysis.load_session.
+    - save_path (str): Output path; the format follows its extension.
+    - n (float): Bedroom threshold of the *_bedrooms_gt_n charts.
+    - income_threshold (float): Income threshold of 'income_population'.
+    - column (str): Column of a 'histogram' chart, stored or derived.
+    - panel (int): Index of a 'statistics_panel' chart, 0-3 for minimum,
+      maximum, median and mean values.
+    - scatter_mode (str): How scatter charts draw their points, see
+      plot.draw_points.
+    """
+
+    plot = load_plot()
+    data, column_names, index = session['data'], session['column_names'], session['index']
+
+    if name == 'income_mean':
+        plot.plot_income_mean(analysis.calculate_income_mean(data), save_path=save_path)
+    elif name == 'population_bedrooms_gt_n':
+        plot.plot_avg_population_bedrooms_gt_n(data, n, index, save_path=save_path)
+    elif name == 'house_value_bedrooms_gt_n':
+        plot.plot_avg_house_value_bedrooms_gt_n(data, n, index, save_path=save_path)
+    elif name == 'income_density':
+        values = [analysis.calculate_income_mean(data),
+                  analysis.calculate_avg_population_high_density(data, index)]
+        plot.plot_income_density_bar(['Income Mean', 'Avg Pop. in High Density Households'],
+                                     values, save_path=save_path)
+    elif name == 'frequency':
+        plot.plot_frequency(column_names, data, save_path=save_path)
+    elif name == 'income_vs_bedrooms':
+        plot.plot_income_vs_bedrooms(*analysis.average_income_by_bedrooms(data),
+                                     save_path=save_path, mode=scatter_mode)
+    elif name == 'statistics':
+        plot.plot_statistics_bar(column_names, data, save_path=save_path)
+    elif name == 'income_population':
+        plot.plot_income_population(data, income_threshold, save_path=save_path,
+                                    mode=scatter_mode)
+    elif name == 'histogram':
+        plot.plot_histogram(column, derived.values(data, column, column_names),
+                            save_path=save_path)
+    elif name == 'statistics_panel':
+        plot.plot_statistics_panel(*plot.statistics_panels(column_names, data)[panel],
+                                   save_path=save_path)
+    else:
+        raise ValueError(f"Unknown chart '{name}'")
+
+def report_charts(column_names, n=3, income_threshold=5):
+
+    """
+    List the independent charts of a full report: every single-figure
+    chart, one histogram per attribute and derived column, and one chart
+    per statistics panel.
+
+    Args:
+    - column_names (list): List of column names.
+    - n (float): Bedroom threshold of the *_bedrooms_gt_n charts.
+    - income_threshold (float): Income threshold of 'income_population'.
+
+    Returns:
+    - charts (list): (file stem, chart name, keyword arguments) tuples.
+    """
+
+    charts = [
+        ('income_mean', 'income_mean', {}),
+        (f'population_bedrooms_gt_{n:g}', 'population_bedrooms_gt_n', {'n': n}),
+        (f'house_value_bedrooms_gt_{n:g}', 'house_value_bedrooms_gt_n', {'n': n}),
+        ('income_density', 'income_density', {}),
+        ('income_vs_bedrooms', 'income_vs_bedrooms', {}),
+        (f'income_population_gt_{income_threshold:g}', 'income_population',
+         {'income_threshold': income_threshold}),
+    ]
+    columns = list(column_names) + [name for name in derived.DERIVED_COLUMNS
+                                    if set(derived.base_columns(name)) <= set(column_names)]
+    charts += [(f'histogram_{column}', 'histogram', {'column': column})
+               for column in columns]
+    charts += [(f'statistics_{kind}', 'statistics_panel', {'panel': i})
+               for i, kind in enumerate(('min', 'max', 'median', 'mean'))]
+    return charts
+
+def render_chart(stem, name, params, out_dir, image_format, session=None):
+
+    """
+    Render one report chart and time it.
+
+    Args:
+    - stem (str): File name without extension.
+    - name (str): Chart name, see draw_chart.
+    - params (dict): Keyword arguments of draw_chart.
+    - out_dir (str): Output directory.
+    - image_format (str): 'png', 'svg' or 'pdf'.
+    - session (dict): Loaded session; defaults to the worker's session.
+
+    Returns:
+    - result (dict): Chart name, output path and rendering seconds.
+    """
+
+    path = os.path.join(out_dir, f'{stem}.{image_format}')
+    start = time.perf_counter()
+    draw_chart(name, session or _worker_session, path, **params)
+    return {'chart': stem, 'path': path, 'seconds': time.perf_counter() - start}
+
+def render_chart_image(name, params, image_format='png', session=None):
+
+    """
+    Render one chart into memory.
+
+    Args:
+    - name (str): Chart name, see draw_chart.
+    - params (dict): Keyword arguments of draw_chart.
+    - image_format (str): 'png', 'svg' or 'pdf'.
+    - session (dict): Loaded session; defaults to the worker's session.
+
+    Returns:
+    - image (bytes): Encoded image.
+    """
+
+    import matplotlib.pyplot as plt
+    buffer = io.BytesIO()
+    with plt.rc_context({'savefig.format': image_format}):
+        draw_chart(name, session or _worker_session, buffer, **params)
+    return buffer.getvalue()
+
+def init_worker(filename, use_cache, remove_missing):
+
+    """
+    Load the dataset once per worker process. Workers read the columnar
+    cache instead of receiving the arrays from the parent process.
+    """
+
+    global _worker_session
+    load_plot()
+    _worker_session = analysis.load_session(filename, use_cache, remove_missing)
+
+def render_report(filename, out_dir='reports', image_format='png', workers=None,
+                  n=3, income_threshold=5, use_cache=True, remove_missing=False):
+
+    """
+    Render every chart of the dataset to files, headless, with the charts
+    spread over a pool of worker processes.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - out_dir (str): Output directory, created if needed.
+    - image_format (str): 'png', 'svg' or 'pdf'.
+    - workers (int): Number of worker processes, defaults to the CPU
+      count; 1 renders in this process.
+    - n (float): Bedroom threshold of the *_bedrooms_gt_n charts.
+    - income_threshold (float): Income threshold of 'income_population'.
+    - use_cache (bool): Read from and write to the columnar cache.
+    - remove_missing (bool): Replace missing values with 0 first.
+
+    Returns:
+    - report (dict or None): 'charts', a list of results from
+      render_chart, and 'total_seconds', the wall time of the whole
+      report; None if the file was not found.
+    """
+
+    start = time.perf_counter()
+    # Loading here also refreshes the cache before the workers read it
+    session = analysis.load_session(filename, use_cache, remove_missing)
+    if session is None:
+        return None
+    os.makedirs(out_dir, exist_ok=True)
+    charts = report_charts(session['column_names'], n, income_threshold)
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        results = [render_chart(stem, name, params, out_dir, image_format, session)
+                   for stem, name, params in charts]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(filename, use_cache, remove_missing)) as pool:
+            futures = [pool.submit(render_chart, stem, name, params, out_dir, image_format)
+                       for stem, name, params in charts]
+            results = [future.result() for future in futures]
+
+    return {'charts': results, 'total_seconds': time.perf_counter() - start}
@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import collections
+import json
+import os
+import shlex
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+import analysis
+import cli
+import memo
+import report
+
+# Query commands of cli.py served as JSON endpoints
+QUERY_ENDPOINTS = ('stats', 'missing', 'avg', 'groupby', 'cube', 'bbox', 'radius')
+
+# Latencies kept per endpoint for the percentiles
+LATENCY_WINDOW = 10_000
+LATENCY_PERCENTILES = (50, 90, 99)
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+
+def query_argv(path, params):
+
+    """
+    Translate a request into query command-line arguments, see
+    cli.add_query_commands. Path segments become positional arguments and
+    every query parameter an option; comma-separated or repeated values
+    give several values.
+
+    For example '/avg/income_bedrooms_gt_n?n=1,3' becomes
+    ['avg', 'income_bedrooms_gt_n', '-n', '1', '3'].
+
+    Args:
+    - path (str): URL path.
+    - params (dict): Parsed query string, from urllib.parse.parse_qs.
+
+    Returns:
+    - argv (list): Command-line arguments.
+    """
+
+    argv = [unquote(part) for part in path.strip('/').split('/') if part]
+    for key, values in params.items():
+        argv.append(f'-{key}' if len(key) == 1 else '--' + key.replace('_', '-'))
+        argv += [value for joined in values for value in joined.split(',')]
+    return argv
+
+class LatencyRecorder:
+
+    """
+    Request latencies of the recent requests, per endpoint.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.counts = collections.Counter()
+
+    def record(self, endpoint, seconds):
+        for key in (endpoint, 'all'):
+            self.latencies[key].append(seconds)
+            self.counts[key] += 1
+
+    def summary(self):
+
+        """
+        Return the request count and latency percentiles of every endpoint.
+
+        Returns:
+        - summary (dict): For each endpoint and 'all', 'requests' and
+          'p50_ms', 'p90_ms', 'p99_ms' and 'max_ms' over the recent requests.
+        """
+
+        result = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            values = np.array(latencies) * 1000
+            result[endpoint] = {'requests': self.counts[endpoint]}
+            for p, value in zip(LATENCY_PERCENTILES, np.percentile(values, LATENCY_PERCENTILES)):
+                result[endpoint][f'p{p}_ms'] = float(value)
+            result[endpoint]['max_ms'] = float(np.max(values))
+        return result
+
+def init_plot_worker(filename, use_cache, remove_missing):
+
+    """
+    Load the dataset in a chart worker, see report.init_worker. Workers
+    ignore Ctrl-C so the service shuts them down cleanly.
+    """
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    report.init_worker(filename, use_cache, remove_missing)
+
+class QueryService:
+
+    """
+    HTTP/JSON service answering queries on a dataset loaded once.
+
+    Queries run in a thread pool on the shared, read-only arrays of the
+    session. Charts run in worker processes, since matplotlib is not
+    thread-safe; each worker loads the dataset from the columnar cache.
+
+    Endpoints:
+    - GET /stats, /missing, /avg/<query>, /groupby, /cube, /bbox/<4 values>,
+      /radius/<lon>/<lat>/<km>: the query commands of cli.py, with their
+      options as query parameters, e.g. /groupby?key=ocean_proximity&
+      value=median_house_value&agg=mean,count.
+    - GET /plot/<chart>: the chart as a PNG image, e.g.
+      /plot/income_population?threshold=8.
+    - POST /query: a JSON body {"queries": [...]} of batch query lines,
+      answered like the batch command.
+    - GET /metrics: request latency percentiles and result cache counters.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - workers (int): Query threads.
+    - plot_workers (int): Chart worker processes.
+    - use_cache (bool): Read from and write to the columnar cache.
+    - remove_missing (bool): Replace missing values with 0 first.
+    """
+
+    def __init__(self, filename, workers=None, plot_workers=None, use_cache=True,
+                 remove_missing=False):
+        self.session = analysis.load_session(filename, use_cache, remove_missing)
+        if self.session is None:
+            raise FileNotFoundError(filename)
+        self.session['data'].flags.writeable = False
+        self.parser = cli.build_query_parser(cli.QueryParser)
+        self.latency = LatencyRecorder()
+        # Writers of the open connections, closed on shutdown
+        self.connections = set()
+        self.query_pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        self.plot_pool = ProcessPoolExecutor(max_workers=plot_workers or os.cpu_count() or 1,
+                                             initializer=init_plot_worker,
+                                             initargs=(filename, use_cache, remove_missing))
+
+    def close(self):
+        self.query_pool.shutdown(cancel_futures=True)
+        self.plot_pool.shutdown(cancel_futures=True)
+
+    def run_query(self, argv):
+        args = self.parser.parse_args(argv)
+        if args.command == 'plot':
+            raise cli.QueryError('charts are served by GET /plot/<chart>')
+        return cli.to_jsonable(args.func(args, self.session))
+
+    def run_batch(self, lines):
+        results = []
+        for line in lines:
+            try:
+                results.append({'query': line, 'result': self.run_query(shlex.split(line))})
+            except (cli.QueryError, ValueError, KeyError) as e:
+                results.append({'query': line, 'error': str(e), 'result': None})
+        return {'results': results}
+
+    async def respond(self, method, target, body):
+
+        """
+        Answer one request.
+
+        Returns:
+        - status (int): HTTP status code.
+        - content_type (str): Content type of the body.
+        - body (bytes): Response body.
+        - endpoint (str): Endpoint name the latency is recorded under.
+        """
+
+        loop = asyncio.get_running_loop()
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        endpoint = url.path.strip('/').split('/')[0] or 'index'
+
+        if endpoint == 'metrics':
+            result = {'latency': self.latency.summary(), 'result_cache': memo.stats()}
+        elif endpoint == 'query':
+            if method != 'POST':
+                return 405, 'application/json', b'{"error": "use POST"}', endpoint
+            lines = json.loads(body or b'{}').get('queries', [])
+            result = await loop.run_in_executor(self.query_pool, self.run_batch, lines)
+        elif endpoint == 'plot':
+            args = self.parser.parse_args(query_argv(url.path, params))
+            image = await loop.run_in_executor(
+                self.plot_pool, report.render_chart_image, args.name,
+                {'n': args.n, 'income_threshold': args.threshold, 'scatter_mode': args.scatter_mode})
+            return 200, 'image/png', image, endpoint
+        elif endpoint in QUERY_ENDPOINTS:
+            result = await loop.run_in_executor(self.query_pool, self.run_query,
+                                                query_argv(url.path, params))
+        else:
+            return 404, 'application/json', b'{"error": "unknown endpoint"}', 'unknown'
+        return 200, 'application/json', json.dumps(result).encode(), endpoint
+
+    async def handle(self, reader, writer):
+
+        """
+        Serve the requests of one connection, keeping it open between
+        requests unless the client asks to close it.
+        """
+
+        self.connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                start = time.perf_counter()
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                try:
+                    status, content_type, payload, endpoint = await self.respond(method, target,
+                                                                                 body)
+                except (cli.QueryError, ValueError, KeyError) as e:
+                    status, content_type, endpoint = 400, 'application/json', 'error'
+                    payload = json.dumps({'error': str(e)}).encode()
+                except Exception as e:
+                    status, content_type, endpoint = 500, 'application/json', 'error'
+                    payload = json.dumps({'error': repr(e)}).encode()
+
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and version == 'HTTP/1.1')
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                             f"Content-Type: {content_type}\r\n"
+                             f"Content-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                             f"\r\n".encode('latin-1') + payload)
+                await writer.drain()
+                self.latency.record(endpoint, time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+async def serve(service, host='127.0.0.1', port=8000):
+
+    """
+    Serve a QueryService on host:port until interrupted (Ctrl-C or SIGTERM).
+    """
+
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Serving on http://{host}:{port}", file=sys.stderr)
+    async with server:
+        await stopped.wait()
+        for writer in list(service.connections):
+            writer.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve California housing analyses as a local HTTP/JSON service.')
+    parser.add_argument('--data', default='data/housing.csv', help='Path to the dataset CSV')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface, localhost by default')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, help='Query threads, defaults to the CPU count')
+    parser.add_argument('--plot-workers', type=int,
+                        help='Chart worker processes, defaults to the CPU count')
+    parser.add_argument('--remove-missing', action='store_true',
+                        help='Replace missing values with 0 before serving')
+    parser.add_argument('--no-cache', action='store_true', help='Always parse the CSV file')
+    args = parser.parse_args(argv)
+
+    try:
+        service = QueryService(args.data, args.workers, args.plot_workers, not args.no_cache,
+                               args.remove_missing)
+    except FileNotFoundError:
+        return 1
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    finally:
+        service.close()
+        print(json.dumps(service.latency.summary(), indent=2), file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
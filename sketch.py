@@ -0,0 +1,222 @@
+import numpy as np
+
+# Accuracy parameter of the sketches; the rank error shrinks about as 1/k
+DEFAULT_K = 200
+# Smallest capacity of a compactor level
+MIN_CAPACITY = 8
+# Capacity ratio between consecutive levels, from the KLL paper
+CAPACITY_RATIO = 2 / 3
+
+class QuantileSketch:
+
+    """
+    Mergeable KLL quantile sketch of a stream of values.
+
+    Values are kept in levels of compactors; an item at level h stands for
+    2 ** h values. When a level outgrows its capacity it is sorted and
+    every other item (from a random start) moves up one level, so memory
+    stays around 3 * k items whatever the number of values. Sketches of
+    different chunks, or built in different processes, merge into the
+    sketch of all their values.
+
+    Until the first compaction the sketch holds every value and answers
+    exactly, like numpy.quantile; exact=True never compacts, for small
+    data and for checking the approximation. NaN values are counted and
+    skipped; the minimum and maximum are always exact.
+
+    Args:
+    - k (int): Accuracy parameter, see rank_error.
+    - exact (bool): Keep every value instead of compacting.
+    - seed (int): Seed of the compaction offsets, for reproducible results.
+    """
+
+    def __init__(self, k=DEFAULT_K, exact=False, seed=0):
+        self.k = k
+        self.exact = exact
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.nan_count = 0
+        self.min = np.nan
+        self.max = np.nan
+        self.compacted = False
+        self.rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(MIN_CAPACITY, int(np.ceil(self.k * CAPACITY_RATIO ** depth)))
+
+    def _compress(self):
+        if self.exact:
+            return
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if items.size > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays at this level
+                odd = items.size % 2
+                promoted = items[odd + self.rng.integers(2)::2]
+                self.levels[level] = items[:odd]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                self.compacted = True
+            level += 1
+
+    def update(self, values):
+
+        """
+        Add values to the sketch.
+
+        Args:
+        - values (numpy.ndarray): Values, e.g. one column of a chunk.
+
+        Returns:
+        - sketch (QuantileSketch): This sketch.
+        """
+
+        values = np.asarray(values, dtype=np.float64).ravel()
+        missing = np.isnan(values)
+        self.nan_count += int(np.count_nonzero(missing))
+        values = values[~missing]
+        if values.size == 0:
+            return self
+        self.count += values.size
+        self.min = float(np.min(values)) if np.isnan(self.min) else min(self.min, np.min(values))
+        self.max = float(np.max(values)) if np.isnan(self.max) else max(self.max, np.max(values))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+
+        """
+        Merge another sketch into this one, which then summarizes the
+        values of both.
+
+        Args:
+        - other (QuantileSketch): Sketch of other values, with the same k.
+
+        Returns:
+        - sketch (QuantileSketch): This sketch.
+
+        Raises:
+        - ValueError: The sketches have different k; the capacities of
+          their levels differ, so rank_error would not hold.
+        """
+
+        if other.k != self.k:
+            raise ValueError(f"Cannot merge a sketch with k={other.k} into one with k={self.k}")
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.nan_count += other.nan_count
+        self.min = np.nanmin([self.min, other.min]) if other.count else self.min
+        self.max = np.nanmax([self.max, other.max]) if other.count else self.max
+        self.compacted = self.compacted or other.compacted
+        self.exact = self.exact and other.exact
+        self._compress()
+        return self
+
+    def rank_error(self):
+
+        """
+        Return the error bound of the quantiles, as a fraction of the
+        number of values: a returned q-quantile lies between the true
+        (q - e)- and (q + e)-quantiles with 99% confidence. The constants
+        are the empirical KLL bound of Apache DataSketches. 0 while the
+        sketch is exact.
+        """
+
+        if not self.compacted:
+            return 0.0
+        return 2.296 / self.k ** 0.9723
+
+    def quantiles(self, quantiles):
+
+        """
+        Return quantiles of the values.
+
+        Exact sketches interpolate linearly like numpy.quantile; compacted
+        ones return the item whose cumulative weight reaches the quantile.
+
+        Args:
+        - quantiles (sequence): Quantiles between 0 and 1.
+
+        Returns:
+        - values (numpy.ndarray): Value of each quantile, NaN if the sketch
+          has no values.
+        """
+
+        quantiles = np.asarray(quantiles, dtype=float)
+        if self.count == 0:
+            return np.full(quantiles.shape, np.nan)
+        if not self.compacted:
+            return np.quantile(self.levels[0], quantiles)
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.size, 2.0 ** h)
+                                  for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, quantiles * cumulative[-1], side='left')
+        values = items[np.minimum(positions, items.size - 1)]
+        values = np.where(quantiles <= 0, self.min, values)
+        return np.where(quantiles >= 1, self.max, values)
+
+    def median(self):
+        return float(self.quantiles([0.5])[0])
+
+    @property
+    def num_items(self):
+        return sum(level.size for level in self.levels)
+
+def column_sketch(column, k=DEFAULT_K, exact=False, block_size=1 << 16):
+
+    """
+    Build the sketch of a column, adding it block by block.
+    """
+
+    sketch = QuantileSketch(k, exact)
+    for start in range(0, column.shape[0], block_size):
+        sketch.update(column[start:start + block_size])
+    return sketch
+
+def accuracy_report(data, column_names, quantiles=(0.25, 0.5, 0.75), k=DEFAULT_K):
+
+    """
+    Compare sketch quantiles with the exact numpy quantiles of every
+    column.
+
+    Args:
+    - data (numpy.ndarray): Input data.
+    - column_names (list): List of column names.
+    - quantiles (sequence): Quantiles to compare.
+    - k (int): Accuracy parameter of the sketches.
+
+    Returns:
+    - report (dict): For each column, the 'exact' and 'sketch' values,
+      the largest observed 'rank_error' (distance between the rank of the
+      sketch value and the requested one, as a fraction of the values),
+      the stated 'error_bound' and the 'items' kept by the sketch.
+    """
+
+    report = {}
+    for i, name in enumerate(column_names):
+        values = np.sort(data[~np.isnan(data[:, i]), i])
+        sketch = column_sketch(data[:, i], k)
+        approximate = sketch.quantiles(quantiles)
+        if values.size:
+            low = np.searchsorted(values, approximate, side='left') / values.size
+            high = np.searchsorted(values, approximate, side='right') / values.size
+            q = np.asarray(quantiles)
+            # The sketch value is right for any rank between low and high
+            observed = float(np.max(np.maximum(0, np.maximum(low - q, q - high))))
+        else:
+            observed = 0.0
+        report[name] = {'exact': np.quantile(values, quantiles).tolist() if values.size else None,
+                        'sketch': approximate.tolist(), 'rank_error': observed,
+                        'error_bound': sketch.rank_error(), 'items': sketch.num_items}
+    return report
@@ -0,0 +1,186 @@
+import numpy as np
+
+# Kilometres per degree of latitude, and of longitude at the equator
+KM_PER_DEGREE = 111.195
+
+DEFAULT_VALUE_COLUMNS = ('median_house_value', 'median_income', 'population')
+
+class GridIndex:
+
+    """
+    Uniform longitude/latitude grid answering region aggregate queries.
+
+    Rows are bucketed into square cells. Every cell keeps the list of its
+    rows and pre-aggregated row counts, value sums and non-missing value
+    counts, with 2-D prefix sums over the grid. A query adds up the cells
+    that lie entirely inside the region from the pre-aggregates and scans
+    the rows of the cells on its boundary exactly, so the answer matches a
+    full scan without touching most rows.
+
+    The index is a snapshot: rebuild it after the data is modified.
+
+    Args:
+    - data (numpy.ndarray): Input data.
+    - column_names (list): List of column names.
+    - value_columns (sequence): Names of the columns to aggregate.
+    - cell_size (float): Cell width and height in degrees.
+    """
+
+    def __init__(self, data, column_names, value_columns=DEFAULT_VALUE_COLUMNS, cell_size=0.1):
+        self.value_columns = list(value_columns)
+        self.cell_size = cell_size
+        longitude = data[:, column_names.index('longitude')]
+        latitude = data[:, column_names.index('latitude')]
+
+        located = ~(np.isnan(longitude) | np.isnan(latitude))
+        rows = np.flatnonzero(located)
+        self.longitude, self.latitude = longitude[rows], latitude[rows]
+        self.values = {name: data[rows, column_names.index(name)] for name in self.value_columns}
+
+        def edges(coordinates):
+            low = np.min(coordinates) if coordinates.size else 0.0
+            count = int((np.max(coordinates) - low) // cell_size) + 2 if coordinates.size else 1
+            return low + cell_size * np.arange(count + 1)
+
+        # A row with edges[j] <= coordinate < edges[j + 1] belongs to cell j
+        self.x_edges, self.y_edges = edges(self.longitude), edges(self.latitude)
+        self.nx, self.ny = self.x_edges.size - 1, self.y_edges.size - 1
+        cell_x = np.searchsorted(self.x_edges, self.longitude, side='right') - 1
+        cell_y = np.searchsorted(self.y_edges, self.latitude, side='right') - 1
+        cells = cell_y * self.nx + cell_x
+
+        # Row lists per cell, in CSR form
+        num_cells = self.nx * self.ny
+        self.order = np.argsort(cells, kind='stable')
+        self.cell_start = np.concatenate(([0], np.cumsum(np.bincount(cells, minlength=num_cells))))
+
+        # Per-cell aggregates and their 2-D prefix sums
+        self.cell_totals = {'count': np.diff(self.cell_start).astype(float)}
+        for name, values in self.values.items():
+            valid = ~np.isnan(values)
+            self.cell_totals['sum', name] = np.bincount(cells[valid], weights=values[valid],
+                                                        minlength=num_cells)
+            self.cell_totals['valid', name] = np.bincount(cells[valid], minlength=num_cells)
+        self.prefix = {key: self._prefix_sums(totals) for key, totals in self.cell_totals.items()}
+
+    def _prefix_sums(self, per_cell):
+        prefix = np.zeros((self.ny + 1, self.nx + 1))
+        prefix[1:, 1:] = np.cumsum(np.cumsum(per_cell.reshape(self.ny, self.nx), axis=0), axis=1)
+        return prefix
+
+    def _cell_totals(self, key, y0, y1, x0, x1):
+        # Total of cells y0..y1-1, x0..x1-1 from the prefix sums
+        prefix = self.prefix[key]
+        return prefix[y1, x1] - prefix[y0, x1] - prefix[y1, x0] + prefix[y0, x0]
+
+    def _cell_range(self, edges, low, high):
+        # Cells that can hold coordinates in [low, high], and the sub-range
+        # of cells lying entirely inside it
+        outer = (max(int(np.searchsorted(edges, low, side='right')) - 1, 0),
+                 min(int(np.searchsorted(edges, high, side='right')), edges.size - 1))
+        inner = (int(np.searchsorted(edges, low, side='left')),
+                 int(np.searchsorted(edges, high, side='right')) - 1)
+        return outer, (inner[0], max(inner[0], inner[1]))
+
+    def _rows_of_cells(self, cells):
+        # Concatenated row lists of the given cells, without a Python loop
+        starts = self.cell_start[cells]
+        lengths = self.cell_start[np.asarray(cells) + 1] - starts
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        return self.order[offsets + np.arange(offsets.size)]
+
+    def _aggregate(self, count, sums, valid, rows, inside):
+        # Combine pre-aggregated cell totals with an exact scan of rows
+        selected = rows[inside]
+        result = {'count': int(count) + selected.size, 'sum': {}, 'mean': {}}
+        for name, values in self.values.items():
+            scanned = values[selected]
+            scanned = scanned[~np.isnan(scanned)]
+            total = float(sums[name]) + float(np.sum(scanned, dtype=np.float64))
+            num_valid = int(valid[name]) + scanned.size
+            result['sum'][name] = total
+            result['mean'][name] = total / num_valid if num_valid else np.nan
+        result['scanned_rows'] = int(rows.size)
+        return result
+
+    def query_bbox(self, min_lon, min_lat, max_lon, max_lat):
+
+        """
+        Aggregate the rows inside a bounding box (edges included).
+
+        Args:
+        - min_lon (float): West edge.
+        - min_lat (float): South edge.
+        - max_lon (float): East edge.
+        - max_lat (float): North edge.
+
+        Returns:
+        - result (dict): 'count' of rows, 'sum' and 'mean' of every value
+          column (NaN values skipped) and 'scanned_rows', the number of
+          rows checked one by one.
+        """
+
+        (ox0, ox1), (ix0, ix1) = self._cell_range(self.x_edges, min_lon, max_lon)
+        (oy0, oy1), (iy0, iy1) = self._cell_range(self.y_edges, min_lat, max_lat)
+        if ox0 >= ox1 or oy0 >= oy1:
+            return self._aggregate(0, {n: 0.0 for n in self.values}, {n: 0 for n in self.values},
+                                   np.empty(0, dtype=np.intp), np.empty(0, dtype=bool))
+
+        count = self._cell_totals('count', iy0, iy1, ix0, ix1)
+        sums = {name: self._cell_totals(('sum', name), iy0, iy1, ix0, ix1) for name in self.values}
+        valid = {name: self._cell_totals(('valid', name), iy0, iy1, ix0, ix1)
+                 for name in self.values}
+
+        y, x = np.arange(oy0, oy1)[:, None], np.arange(ox0, ox1)[None, :]
+        boundary = ~((y >= iy0) & (y < iy1) & (x >= ix0) & (x < ix1))
+        rows = self._rows_of_cells((y * self.nx + x)[boundary])
+        lon, lat = self.longitude[rows], self.latitude[rows]
+        inside = (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+        return self._aggregate(count, sums, valid, rows, inside)
+
+    def query_radius(self, lon, lat, radius_km):
+
+        """
+        Aggregate the rows within a distance of a point.
+
+        Distances use an equirectangular projection centred on the point,
+        which is accurate for the short radii of map queries.
+
+        Args:
+        - lon (float): Longitude of the centre.
+        - lat (float): Latitude of the centre.
+        - radius_km (float): Radius in kilometres (boundary included).
+
+        Returns:
+        - result (dict): Same keys as query_bbox.
+        """
+
+        x_scale = KM_PER_DEGREE * np.cos(np.radians(lat))
+        dlon, dlat = radius_km / x_scale, radius_km / KM_PER_DEGREE
+        (ox0, ox1), _ = self._cell_range(self.x_edges, lon - dlon, lon + dlon)
+        (oy0, oy1), _ = self._cell_range(self.y_edges, lat - dlat, lat + dlat)
+
+        # Classify candidate cells: inside if their farthest corner is
+        # within the radius, outside if their nearest point is beyond it
+        dx_low = (self.x_edges[ox0:ox1] - lon) * x_scale
+        dx_high = (self.x_edges[ox0 + 1:ox1 + 1] - lon) * x_scale
+        dy_low = (self.y_edges[oy0:oy1] - lat) * KM_PER_DEGREE
+        dy_high = (self.y_edges[oy0 + 1:oy1 + 1] - lat) * KM_PER_DEGREE
+        far_x = np.maximum(np.abs(dx_low), np.abs(dx_high))
+        far_y = np.maximum(np.abs(dy_low), np.abs(dy_high))
+        near_x = np.where((dx_low <= 0) & (dx_high >= 0), 0.0, np.minimum(np.abs(dx_low), np.abs(dx_high)))
+        near_y = np.where((dy_low <= 0) & (dy_high >= 0), 0.0, np.minimum(np.abs(dy_low), np.abs(dy_high)))
+        inner = far_y[:, None] ** 2 + far_x[None, :] ** 2 <= radius_km ** 2
+        touched = near_y[:, None] ** 2 + near_x[None, :] ** 2 <= radius_km ** 2
+
+        cells = (np.arange(oy0, oy1)[:, None] * self.nx + np.arange(ox0, ox1)[None, :])
+        inner_cells = cells[inner]
+        count = np.sum(self.cell_totals['count'][inner_cells])
+        sums = {name: np.sum(self.cell_totals['sum', name][inner_cells]) for name in self.values}
+        valid = {name: np.sum(self.cell_totals['valid', name][inner_cells])
+                 for name in self.values}
+
+        rows = self._rows_of_cells(cells[touched & ~inner])
+        distance2 = (((self.longitude[rows] - lon) * x_scale) ** 2
+                     + ((self.latitude[rows] - lat) * KM_PER_DEGREE) ** 2)
+        return self._aggregate(count, sums, valid, rows, distance2 <= radius_km ** 2)
@@ -0,0 +1,324 @@
+import os
+from itertools import islice
+
+import numpy as np
+import cache
+import sketch
+import table
+from table import CATEGORICAL_COLUMNS, MISSING_CODE
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+def read_header(filename):
+
+    """
+    Read the column names from the header row of a CSV file.
+
+    Args:
+    - filename (str): Path to the CSV file.
+
+    Returns:
+    - column_names (list): List of column names.
+    """
+
+    with open(filename, 'r') as f:
+        return f.readline().strip().split(',')
+
+def cached_categories(filename):
+
+    """
+    Return the categories recorded in the columnar cache of a CSV file
+    (see cache.write_cache), without reading the file: only a cache whose
+    size and modification time match the file is used.
+
+    Returns:
+    - categories (dict): Sorted category names per categorical column,
+      empty if there is no such cache.
+    """
+
+    manifest = cache.read_manifest(cache.cache_dir_for(filename))
+    if manifest is None or manifest.get('version') != cache.CACHE_VERSION:
+        return {}
+    stat = os.stat(filename)
+    source = manifest['source']
+    if (stat.st_size, stat.st_mtime_ns) != (source['size'], source['mtime_ns']):
+        return {}
+    return {name: list(values) for name, values in manifest['categories'].items()}
+
+def iter_chunks(filename, chunk_size=DEFAULT_CHUNK_SIZE, categories=None):
+
+    """
+    Stream a CSV file as fixed-size blocks of rows, in a single pass.
+
+    Only one block of text lines and its parsed array are held in memory
+    at a time. Numeric values are parsed with np.genfromtxt. Categorical
+    columns such as 'ocean_proximity' hold category codes as floats (NaN
+    for empty values): the position of the value in categories[name].
+
+    The categories start from those of a fresh columnar cache (see
+    cached_categories), so the codes are those of analysis.load_table.
+    Values the cache does not list, or all of them without a cache, are
+    appended in order of first appearance; the codes of earlier blocks
+    never change. After the stream, sort_categories gives the remapping
+    to the sorted codes of table.encode_categories.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - chunk_size (int): Maximum number of rows per block.
+    - categories (dict): Optional dict filled with the category names of
+      the file, keyed by column name; the code of a name is its position.
+
+    Yields:
+    - chunk (numpy.ndarray): Array of shape (rows, columns), rows <= chunk_size.
+    """
+
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    if categories is None:
+        categories = {}
+
+    with open(filename, 'r') as f:
+        column_names = f.readline().strip().split(',')
+        categorical = [i for i, name in enumerate(column_names) if name in CATEGORICAL_COLUMNS]
+        known = cached_categories(filename) if categorical else {}
+        for i in categorical:
+            categories[column_names[i]] = known.get(column_names[i], [])
+
+        while True:
+            lines = [line for line in islice(f, chunk_size) if line.strip()]
+            if not lines:
+                break
+            chunk = np.genfromtxt(lines, delimiter=',', dtype=float, ndmin=2)
+            for i in categorical:
+                names = categories[column_names[i]]
+                codes, local = table.encode_categories(
+                    [line.rstrip('\r\n').split(',')[i] for line in lines])
+                for value in local:
+                    if value not in names:
+                        if len(names) >= MISSING_CODE:
+                            raise ValueError(f"Too many categories for column "
+                                             f"'{column_names[i]}'")
+                        names.append(value)
+                # Remap the block's codes onto the categories of the stream
+                lookup = np.full(MISSING_CODE + 1, np.nan)
+                lookup[:len(local)] = [names.index(value) for value in local]
+                chunk[:, i] = lookup[codes]
+            yield chunk
+
+def sort_categories(categories):
+
+    """
+    Sort the categories filled in by iter_chunks, in place, into the order
+    of table.encode_categories, once the stream has been read.
+
+    Args:
+    - categories (dict): Category names per column, from iter_chunks.
+
+    Returns:
+    - lookups (dict): Per column, a float array mapping the stream codes
+      to the sorted codes; see remap_codes.
+    """
+
+    lookups = {}
+    for name, values in categories.items():
+        ordered = sorted(values)
+        lookup = np.full(MISSING_CODE + 1, np.nan)
+        lookup[:len(values)] = [ordered.index(value) for value in values]
+        lookups[name] = lookup
+        values[:] = ordered
+    return lookups
+
+def remap_codes(codes, lookup):
+
+    """
+    Map float category codes of iter_chunks (NaN for empty values) through
+    a lookup of sort_categories.
+    """
+
+    codes = np.asarray(codes, dtype=float)
+    return lookup[np.where(np.isnan(codes), MISSING_CODE, codes).astype(np.intp)]
+
+def mean_of_chunks(chunks, column):
+
+    """
+    Calculate the mean of a column over a stream of row blocks.
+
+    Like numpy.mean, the result is NaN if the column holds a NaN.
+
+    Args:
+    - chunks (iterable): Row blocks, e.g. from iter_chunks.
+    - column (int): Index of the column to average.
+
+    Returns:
+    - mean (float): Mean of the column, NaN if there are no rows.
+    """
+
+    total = 0.0
+    count = 0
+    for chunk in chunks:
+        total += np.sum(chunk[:, column])
+        count += chunk.shape[0]
+    return total / count if count else np.nan
+
+def avg_gt_of_chunks(chunks, filter_column, threshold, target_column):
+
+    """
+    Calculate the average of one column over rows where another column is
+    greater than a threshold, over a stream of row blocks.
+
+    Args:
+    - chunks (iterable): Row blocks, e.g. from iter_chunks.
+    - filter_column (int): Index of the column compared with the threshold.
+    - threshold (float): Rows with filter value > threshold are selected.
+    - target_column (int): Index of the column to average.
+
+    Returns:
+    - avg (float): Average of the target column over the selected rows,
+      NaN if no row is selected.
+    """
+
+    total = 0.0
+    count = 0
+    for chunk in chunks:
+        mask = chunk[:, filter_column] > threshold
+        total += np.sum(chunk[:, target_column], where=mask)
+        count += np.count_nonzero(mask)
+    return total / count if count else np.nan
+
+def missing_counts_of_chunks(chunks):
+
+    """
+    Count missing (NaN) values per column over a stream of row blocks.
+
+    Args:
+    - chunks (iterable): Row blocks, e.g. from iter_chunks.
+
+    Returns:
+    - missing_counts (numpy.ndarray): Number of NaN values in each column.
+    """
+
+    missing_counts = None
+    for chunk in chunks:
+        counts = np.count_nonzero(np.isnan(chunk), axis=0)
+        missing_counts = counts if missing_counts is None else missing_counts + counts
+    return missing_counts
+
+def sketches_of_chunks(chunks, k=sketch.DEFAULT_K, exact=False):
+
+    """
+    Build a quantile sketch of every column over a stream of row blocks.
+
+    Sketches of different streams, e.g. parts of a file read by different
+    processes, can be combined with QuantileSketch.merge.
+
+    Args:
+    - chunks (iterable): Row blocks, e.g. from iter_chunks.
+    - k (int): Accuracy parameter of the sketches.
+    - exact (bool): Keep every value, for small data.
+
+    Returns:
+    - sketches (list): One QuantileSketch per column.
+    """
+
+    sketches = None
+    for chunk in chunks:
+        if sketches is None:
+            sketches = [sketch.QuantileSketch(k, exact) for _ in range(chunk.shape[1])]
+        for i, column_sketch in enumerate(sketches):
+            column_sketch.update(chunk[:, i])
+    return sketches or []
+
+# Streaming versions of the analysis functions
+
+def stream_income_mean(filename, chunk_size=DEFAULT_CHUNK_SIZE):
+
+    """
+    Calculate the mean income of a CSV file without loading it whole.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - chunk_size (int): Maximum number of rows held in memory.
+
+    Returns:
+    - income_mean (float): Mean income.
+    """
+
+    return mean_of_chunks(iter_chunks(filename, chunk_size), 7)
+
+def stream_avg_bedrooms_gt_n(filename, n, target_column, chunk_size=DEFAULT_CHUNK_SIZE):
+
+    """
+    Calculate the average of a column in areas with bedrooms greater than n
+    without loading the CSV file whole.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - n (int): Number of bedrooms threshold.
+    - target_column (int): Index of the column to average, e.g. 5 for
+      population, 7 for income or 8 for house value.
+    - chunk_size (int): Maximum number of rows held in memory.
+
+    Returns:
+    - avg (float): Average of the target column in areas with bedrooms > n.
+    """
+
+    return avg_gt_of_chunks(iter_chunks(filename, chunk_size), 4, n, target_column)
+
+def stream_avg_high_density(filename, target_column, chunk_size=DEFAULT_CHUNK_SIZE):
+
+    """
+    Calculate the average of a column in households with high density
+    (> 1000) without loading the CSV file whole.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - target_column (int): Index of the column to average, e.g. 5 for
+      population or 8 for house value.
+    - chunk_size (int): Maximum number of rows held in memory.
+
+    Returns:
+    - avg (float): Average of the target column in high density households.
+    """
+
+    return avg_gt_of_chunks(iter_chunks(filename, chunk_size), 5, 1000, target_column)
+
+def stream_missing_values(filename, chunk_size=DEFAULT_CHUNK_SIZE):
+
+    """
+    Count missing values per column without loading the CSV file whole.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - chunk_size (int): Maximum number of rows held in memory.
+
+    Returns:
+    - missing_counts (dict): Number of NaN values keyed by column name.
+    """
+
+    column_names = read_header(filename)
+    missing_counts = missing_counts_of_chunks(iter_chunks(filename, chunk_size))
+    return {col: int(missing_counts[i]) for i, col in enumerate(column_names)}
+
+def stream_quantiles(filename, quantiles=(0.5,), chunk_size=DEFAULT_CHUNK_SIZE,
+                     k=sketch.DEFAULT_K, exact=False):
+
+    """
+    Approximate quantiles (e.g. the median) of every numeric column without
+    loading the CSV file whole, from quantile sketches.
+
+    Args:
+    - filename (str): Path to the CSV file.
+    - quantiles (sequence): Quantiles between 0 and 1.
+    - chunk_size (int): Maximum number of rows held in memory.
+    - k (int): Accuracy parameter of the sketches.
+    - exact (bool): Keep every value, for small data.
+
+    Returns:
+    - result (dict): For each numeric column, its 'quantiles' in the order
+      given and the 'rank_error' bound, see QuantileSketch.rank_error.
+    """
+
+    column_names = read_header(filename)
+    sketches = sketches_of_chunks(iter_chunks(filename, chunk_size), k, exact)
+    return {col: {'quantiles': s.quantiles(quantiles).tolist(), 'rank_error': s.rank_error()}
+            for col, s in zip(column_names, sketches) if col not in CATEGORICAL_COLUMNS}
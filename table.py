@@ -0,0 +1,279 @@
+import numpy as np
+
+# Columns of the housing dataset, in file order
+COLUMN_NAMES = ('longitude', 'latitude', 'housing_median_age', 'total_rooms', 'total_bedrooms',
+                'population', 'households', 'median_income', 'median_house_value',
+                'ocean_proximity')
+
+# Text columns stored dictionary-encoded instead of as all-NaN floats
+CATEGORICAL_COLUMNS = ('ocean_proximity',)
+
+# Code of a missing (empty) category value
+MISSING_CODE = np.iinfo(np.uint8).max
+
+# Storage types of the compact mode, see Table.compact. Integer columns
+# mark missing values with the largest value of their type, like
+# MISSING_CODE; float32 keeps about 7 significant digits.
+COMPACT_SCHEMA = {
+    'longitude': np.float32,
+    'latitude': np.float32,
+    'housing_median_age': np.uint16,
+    'total_rooms': np.int32,
+    'total_bedrooms': np.int32,
+    'population': np.int32,
+    'households': np.int32,
+    'median_income': np.float32,
+    'median_house_value': np.int32,
+}
+
+# Type of the 2-D array of the compact mode; it holds every integer below
+# 2 ** 24 exactly
+COMPACT_ARRAY_DTYPE = np.float32
+
+def missing_value(dtype):
+
+    """
+    Return the value marking a missing entry in a column type: NaN for
+    floats, the largest value for integers.
+    """
+
+    dtype = np.dtype(dtype)
+    return np.iinfo(dtype).max if dtype.kind in 'iu' else np.nan
+
+def to_compact(column, dtype):
+
+    """
+    Convert a float column to a compact type, if it fits.
+
+    Integer types are used only when every value is a whole number inside
+    the type's range (its largest value is reserved for missing values);
+    otherwise the column is returned unchanged.
+
+    Args:
+    - column (numpy.ndarray): 1-D float column, NaN for missing values.
+    - dtype (numpy.dtype): Target type.
+
+    Returns:
+    - column (numpy.ndarray): Converted column.
+    """
+
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return column.astype(dtype)
+
+    missing = np.isnan(column)
+    values = column[~missing]
+    info = np.iinfo(dtype)
+    if values.size and (np.any(values != np.round(values))
+                        or np.min(values) < info.min or np.max(values) >= info.max):
+        return column
+    return np.where(missing, info.max, column).astype(dtype)
+
+class Table:
+
+    """
+    Typed columnar table.
+
+    Numeric columns are float arrays, or compact integer or float32
+    arrays (see compact). Categorical columns are dictionary-encoded: a
+    uint8 code array plus the list of category names, with MISSING_CODE
+    marking an empty value.
+
+    Args:
+    - columns (list): One 1-D numpy array per column.
+    - column_names (list): List of column names.
+    - categories (dict): Category names of each categorical column, keyed
+      by column name.
+    """
+
+    def __init__(self, columns, column_names, categories=None):
+        self.columns = dict(zip(column_names, columns))
+        self.column_names = list(column_names)
+        self.categories = dict(categories or {})
+
+    @property
+    def num_rows(self):
+        return len(self.columns[self.column_names[0]]) if self.column_names else 0
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    def column(self, name):
+
+        """
+        Return a column by name, as stored (codes for categorical columns).
+        """
+
+        return self.columns[name]
+
+    def is_categorical(self, name):
+        return name in self.categories
+
+    def is_missing(self, name):
+
+        """
+        Return a boolean mask of the missing values of a column.
+        """
+
+        column = self.columns[name]
+        if self.is_categorical(name):
+            return column >= len(self.categories[name])
+        if column.dtype.kind in 'iu':
+            return column == missing_value(column.dtype)
+        return np.isnan(column)
+
+    def values(self, name):
+
+        """
+        Return a column as float64, NaN where missing (codes for
+        categorical columns).
+        """
+
+        column = self.columns[name]
+        if column.dtype == np.float64:
+            return column
+        values = column.astype(np.float64)
+        if column.dtype.kind in 'iu':
+            values[self.is_missing(name)] = np.nan
+        return values
+
+    def compact(self, schema=COMPACT_SCHEMA):
+
+        """
+        Return a copy of the table with columns stored in smaller types.
+
+        Args:
+        - schema (dict): Storage type per column name; other columns are
+          kept as they are.
+
+        Returns:
+        - table (Table): Compact table.
+        """
+
+        columns = [to_compact(self.columns[name], schema[name])
+                   if name in schema and not self.is_categorical(name) else self.columns[name]
+                   for name in self.column_names]
+        return Table(columns, self.column_names, self.categories)
+
+    def category_code(self, name, value):
+
+        """
+        Return the integer code of a category value.
+
+        Args:
+        - name (str): Name of a categorical column.
+        - value (str): Category value, e.g. 'NEAR BAY'.
+
+        Returns:
+        - code (int): Code of the value in the column.
+        """
+
+        try:
+            return self.categories[name].index(value)
+        except ValueError:
+            raise ValueError(f"Unknown category '{value}' for column '{name}'") from None
+
+    def category_mask(self, name, value):
+
+        """
+        Return a boolean mask of the rows holding a category value, using
+        an integer comparison on the codes.
+        """
+
+        return self.columns[name] == self.category_code(name, value)
+
+    def decode(self, name):
+
+        """
+        Return the values of a categorical column as strings, '' for
+        missing values.
+        """
+
+        labels = np.array(self.categories[name] + [''], dtype=object)
+        codes = self.columns[name].astype(np.intp)
+        codes[codes >= len(self.categories[name])] = len(self.categories[name])
+        return labels[codes]
+
+    def to_array(self, dtype=np.float64):
+
+        """
+        Return the table as a 2-D float array, one column per attribute.
+
+        Categorical columns hold their codes as floats, and every missing
+        value is NaN.
+
+        Args:
+        - dtype (numpy.dtype): Float type of the array, e.g.
+          COMPACT_ARRAY_DTYPE to halve its size.
+
+        Returns:
+        - data (numpy.ndarray): Float array of shape (rows, columns).
+        """
+
+        data = np.empty((self.num_rows, len(self.column_names)), dtype=dtype)
+        for i, name in enumerate(self.column_names):
+            column = self.columns[name]
+            data[:, i] = column
+            if column.dtype.kind in 'iu':
+                data[self.is_missing(name), i] = np.nan
+        return data
+
+def encode_categories(values):
+
+    """
+    Dictionary-encode a sequence of strings.
+
+    Args:
+    - values (sequence): String values, '' for missing.
+
+    Returns:
+    - codes (numpy.ndarray): uint8 code of each value, MISSING_CODE for ''.
+    - categories (list): Sorted distinct non-empty values.
+    """
+
+    labels, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    categories = [str(label) for label in labels if label != '']
+    if len(categories) >= MISSING_CODE:
+        raise ValueError(f"Too many categories ({len(categories)}) for a uint8 column")
+
+    # Re-map so the empty label, if present, becomes MISSING_CODE
+    lookup = np.arange(len(labels), dtype=np.uint8)
+    if len(labels) > len(categories):
+        lookup[1:] -= 1
+        lookup[0] = MISSING_CODE
+    return lookup[inverse], categories
+
+def read_csv(filename):
+
+    """
+    Parse a CSV file into a typed table.
+
+    Numeric columns are parsed with np.genfromtxt; the columns listed in
+    CATEGORICAL_COLUMNS are dictionary-encoded.
+
+    Args:
+    - filename (str): Path to the CSV file.
+
+    Returns:
+    - table (Table): Parsed table.
+    """
+
+    with open(filename, 'r') as f:
+        column_names = f.readline().strip().split(',')
+        lines = [line for line in f if line.strip()]
+
+    categorical = [i for i, name in enumerate(column_names) if name in CATEGORICAL_COLUMNS]
+    numeric = [i for i in range(len(column_names)) if i not in categorical]
+
+    numeric_data = np.genfromtxt(lines, delimiter=',', dtype=float, usecols=numeric, ndmin=2)
+    columns = [None] * len(column_names)
+    for j, i in enumerate(numeric):
+        columns[i] = np.ascontiguousarray(numeric_data[:, j])
+
+    categories = {}
+    for i in categorical:
+        values = [line.rstrip('\r\n').split(',')[i] for line in lines]
+        columns[i], categories[column_names[i]] = encode_categories(values)
+
+    return Table(columns, column_names, categories)
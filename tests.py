@@ -18,4 +18,150 @@
 # ValueError: 'list' argument must have no negative elements
 
 #Resolution: You have to remove missing values before calculation of general statistics, since mean
-# does not take missing values.
\ No newline at end of file
+# does not take missing values.
+
+import asyncio
+import json
+
+import numpy as np
+import pytest
+import analysis
+import cli
+import csvparse
+import server
+import sketch
+import table
+
+HOUSING_CSV = 'data/housing.csv'
+
+@pytest.fixture(scope='module')
+def service():
+    service = server.QueryService(HOUSING_CSV, workers=1, plot_workers=1, use_cache=False)
+    yield service
+    service.close()
+
+def test_server_help_parameter_is_a_query_error(service):
+    with pytest.raises(cli.QueryError):
+        asyncio.run(service.respond('GET', '/stats?h=1', b''))
+    with pytest.raises(cli.QueryError):
+        asyncio.run(service.respond('GET', '/stats?help=1', b''))
+
+def test_server_batch_help_line_is_an_error_entry(service):
+    results = service.run_batch(['stats -h', 'missing'])['results']
+    assert results[0]['result'] is None and 'help' in results[0]['error']
+    assert results[1]['result']['total_bedrooms'] == 207
+
+def test_cube_rejects_unknown_where_values(service):
+    with pytest.raises(ValueError, match="'NOPE' for dimension 'ocean_proximity'"):
+        service.run_query(['cube', '--agg', 'min', '--where', 'ocean_proximity=NOPE'])
+
+def test_cube_min_max_of_empty_selection_is_nan(service):
+    cube = service.session['cube']
+    _, result = cube.query('median_house_value', ['count', 'min', 'max'],
+                           where={'ocean_proximity': []})
+    assert result['count'] == 0 and np.isnan(result['min']) and np.isnan(result['max'])
+
+CSV_HEADER = ('longitude,latitude,housing_median_age,total_rooms,total_bedrooms,population,'
+              'households,median_income,median_house_value,ocean_proximity')
+
+def csv_rows(num_rows=300):
+    # Rows mixing the number spellings found in real files
+    spellings = ['-122.23', '37.88', '41.0', '880', '', '1.29e3', '126', '8.3252',
+                 '452600.0', 'NEAR BAY']
+    rows = []
+    for i in range(num_rows):
+        fields = list(spellings)
+        fields[0] = f'{-124 + i / 97:.6f}'
+        fields[3] = str(i * 7)
+        fields[4] = ['', '129', '1E2', '-0.5', '3.141592653589793238', '.5', '7.'][i % 7]
+        fields[7] = ['8.3252', '12345678901234567890', '1.5e-3', '+4', '0.1234567890123456'][i % 5]
+        fields[9] = ['NEAR BAY', 'INLAND', '', '<1H OCEAN'][i % 4]
+        rows.append(','.join(fields))
+    return rows
+
+def write_csv(tmp_path, rows, newline='\n', trailing=True, name='data.csv'):
+    path = tmp_path / name
+    text = newline.join([CSV_HEADER] + rows) + (newline if trailing else '')
+    path.write_bytes(text.encode())
+    return str(path)
+
+def assert_same_tables(parsed, expected):
+    assert parsed.column_names == expected.column_names
+    assert parsed.categories == expected.categories
+    for name in expected.column_names:
+        a, b = parsed.column(name), expected.column(name)
+        assert a.dtype == b.dtype and a.tobytes() == b.tobytes(), name
+
+@pytest.fixture
+def small_ranges(monkeypatch):
+    # Split even small files into several ranges, parsed by several workers
+    monkeypatch.setattr(csvparse, 'PARALLEL_MIN_BYTES', 0)
+    monkeypatch.setattr(csvparse, 'MIN_RANGE_BYTES', 256)
+
+@pytest.mark.parametrize('workers', [1, 3])
+@pytest.mark.parametrize('newline, trailing', [('\n', True), ('\r\n', True), ('\n', False),
+                                               ('\r\n', False)])
+def test_read_csv_matches_table_read_csv(tmp_path, small_ranges, workers, newline, trailing):
+    path = write_csv(tmp_path, csv_rows(), newline, trailing)
+    assert_same_tables(csvparse.read_csv(path, workers), table.read_csv(path))
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_read_csv_blank_lines_and_bad_numbers(tmp_path, small_ranges, workers):
+    rows = csv_rows(120)
+    rows[5] = rows[5].replace('880', '8x0', 1)
+    rows[40] = rows[40].replace('126', '1.2.6', 1)
+    rows[60:60] = ['', '   ']
+    path = write_csv(tmp_path, rows + [''])
+    assert_same_tables(csvparse.read_csv(path, workers), table.read_csv(path))
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_read_csv_schema_matches_compact(tmp_path, small_ranges, workers):
+    path = write_csv(tmp_path, csv_rows())
+    assert_same_tables(csvparse.read_csv(path, workers, schema=table.COMPACT_SCHEMA),
+                       table.read_csv(path).compact())
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_read_csv_malformed_rows(tmp_path, small_ranges, workers):
+    rows = csv_rows()
+    rows[10] += ',extra'
+    rows[200] = rows[200].rsplit(',', 1)[0]
+    path = write_csv(tmp_path, rows)
+    with pytest.raises(csvparse.MalformedRowsError) as error:
+        csvparse.read_csv(path, workers)
+    assert error.value.lines == [12, 202]
+    assert analysis.load_table(path, use_cache=False) is None
+
+def sketch_rank_errors(values, sketch_of_values, quantiles):
+    # Largest distance between the rank of each sketch quantile and q
+    returned = sketch_of_values.quantiles(quantiles)
+    ranks = np.searchsorted(np.sort(values), returned, side='right') / values.size
+    return np.abs(ranks - quantiles)
+
+def test_sketch_rank_error_within_bound():
+    values = np.random.default_rng(1).permutation(200_000).astype(float)
+    quantiles = np.linspace(0.01, 0.99, 99)
+    one = sketch.column_sketch(values, k=200)
+    assert one.compacted and one.num_items < 3 * 200 + 100
+    assert np.max(sketch_rank_errors(values, one, quantiles)) <= one.rank_error()
+
+    merged = sketch.QuantileSketch(k=200)
+    for i, chunk in enumerate(np.array_split(values, 20)):
+        merged.merge(sketch.QuantileSketch(k=200, seed=i).update(chunk))
+    assert merged.count == values.size and (merged.min, merged.max) == (0, values.size - 1)
+    assert np.max(sketch_rank_errors(values, merged, quantiles)) <= merged.rank_error()
+
+def test_sketch_merge_needs_same_k():
+    with pytest.raises(ValueError, match='k=100'):
+        sketch.QuantileSketch(k=200).merge(sketch.QuantileSketch(k=100).update([1.0, 2.0]))
+
+def test_batch_bad_lines_are_error_entries(tmp_path):
+    batch = tmp_path / 'queries.txt'
+    batch.write_text('missing\navg no_such_query\nstats -h\navg "unclosed\n'
+                     'avg income_bedrooms_gt_n -n 3\n')
+    output = tmp_path / 'out.json'
+    status = cli.main(['--data', HOUSING_CSV, '--no-cache', '-o', str(output), 'batch',
+                       str(batch)])
+    results = json.loads(output.read_text())['results']
+    assert status == 1
+    assert ['error' in entry for entry in results] == [False, True, True, True, False]
+    assert 'invalid choice' in results[1]['error'] and 'help' in results[2]['error']
@@ -0,0 +1,323 @@
+import numpy as np
+
+# Replacement values of missing entries, see ImputedColumn
+IMPUTATIONS = ('zero', 'mean', 'median')
+
+# Number of set bits of every byte value
+_BIT_COUNTS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+class ValidityMask:
+
+    """
+    Per-column validity bitmaps of a 2-D dataset: bit i of a column is set
+    when row i holds a value, clear when it is missing (NaN).
+
+    The bits are packed eight rows to a byte, 1/64 of the size of a
+    float64 column, and the null count of every column is counted from
+    them once, so null counts are O(1) afterwards. Reductions take the
+    bitmap as the where= mask of the numpy reduction, so missing entries
+    are skipped without copying the valid ones, and the data itself is
+    never modified.
+
+    Args:
+    - bits (numpy.ndarray): (columns, ceil(rows / 8)) uint8 bitmaps, in
+      little bit order.
+    - num_rows (int): Number of rows.
+    - column_names (sequence): Column names, in data order.
+    """
+
+    def __init__(self, bits, num_rows, column_names):
+        self.bits = bits
+        self.num_rows = num_rows
+        self.column_names = list(column_names)
+        self._null_counts = num_rows - _BIT_COUNTS[bits].sum(axis=1)
+
+    @classmethod
+    def from_array(cls, data, column_names):
+
+        """
+        Build the bitmaps of a 2-D float array, NaN where missing (see
+        table.Table.to_array).
+        """
+
+        bits = np.packbits(~np.isnan(data), axis=0, bitorder='little')
+        return cls(np.ascontiguousarray(bits.T), data.shape[0], column_names)
+
+    def _position(self, column):
+        # Column index from a name or an index
+        if isinstance(column, str):
+            if column not in self.column_names:
+                raise KeyError(f"Unknown column '{column}'")
+            return self.column_names.index(column)
+        return int(column)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def null_count(self, column):
+
+        """
+        Return the number of missing values of a column (name or index).
+        """
+
+        return int(self._null_counts[self._position(column)])
+
+    def null_counts(self):
+
+        """
+        Return the number of missing values of every column, keyed by name.
+        """
+
+        return {name: int(count) for name, count in zip(self.column_names, self._null_counts)}
+
+    def valid(self, column):
+
+        """
+        Return a boolean array of the rows holding a value in a column.
+        """
+
+        bits = self.bits[self._position(column)]
+        return np.unpackbits(bits, count=self.num_rows, bitorder='little').view(bool)
+
+    def valid_at(self, column, key):
+
+        """
+        Return whether the rows selected by an index, slice or index array
+        hold a value in a column. A single row reads one bit and a slice
+        unpacks only the bytes it covers.
+
+        Args:
+        - column (str or int): Column name or index.
+        - key: Row index, slice, or integer or boolean index array.
+
+        Returns:
+        - valid (bool or numpy.ndarray): Validity of the selected rows.
+        """
+
+        bits = self.bits[self._position(column)]
+        if isinstance(key, (int, np.integer)):
+            row = int(key) + self.num_rows if key < 0 else int(key)
+            if not 0 <= row < self.num_rows:
+                raise IndexError(f"Row {key} out of range for {self.num_rows} rows")
+            return bool(bits[row >> 3] >> (row & 7) & 1)
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.num_rows)
+            if step > 0:
+                first = start >> 3
+                stop = max(stop, start)
+                covered = np.unpackbits(bits[first:(stop + 7) >> 3], count=stop - 8 * first,
+                                        bitorder='little').view(bool)
+                return covered[start - 8 * first::step]
+        return self.valid(column)[key]
+
+    def _where(self, column, where):
+        # Rows to reduce: the valid ones, among where if given
+        if self.null_count(column) == 0:
+            return True if where is None else where
+        valid = self.valid(column)
+        return valid if where is None else valid & where
+
+    def count(self, column, where=None):
+
+        """
+        Return the number of valid values of a column, among the rows of
+        an optional boolean mask.
+        """
+
+        if where is None:
+            return self.num_rows - self.null_count(column)
+        return int(np.count_nonzero(self._where(column, where)))
+
+    def sum(self, data, column, where=None):
+
+        """
+        Sum the valid values of a column, in float64.
+
+        Args:
+        - data (numpy.ndarray): 2-D data the mask was built from.
+        - column (str or int): Column name or index.
+        - where (numpy.ndarray): Optional boolean mask of the rows to sum.
+
+        Returns:
+        - total (float): Sum, 0 if no value is selected.
+        """
+
+        values = data[:, self._position(column)]
+        return float(np.sum(values, where=self._where(column, where), dtype=np.float64))
+
+    def mean(self, data, column, where=None):
+
+        """
+        Average the valid values of a column, see sum; NaN if no value is
+        selected.
+        """
+
+        count = self.count(column, where)
+        return self.sum(data, column, where) / count if count else np.nan
+
+    def min(self, data, column, where=None):
+
+        """
+        Return the smallest valid value of a column, see sum; NaN if no
+        value is selected.
+        """
+
+        if self.count(column, where) == 0:
+            return np.nan
+        values = data[:, self._position(column)]
+        return float(np.min(values, where=self._where(column, where), initial=np.inf))
+
+    def max(self, data, column, where=None):
+
+        """
+        Return the largest valid value of a column, see min.
+        """
+
+        if self.count(column, where) == 0:
+            return np.nan
+        values = data[:, self._position(column)]
+        return float(np.max(values, where=self._where(column, where), initial=-np.inf))
+
+    def impute(self, data, column, strategy='zero'):
+
+        """
+        Return a lazy view of a column with its missing values replaced,
+        see ImputedColumn.
+        """
+
+        return ImputedColumn(self, data, column, strategy)
+
+class ImputedColumn:
+
+    """
+    Lazy view of a column with its missing values replaced by 0, or the
+    mean or median of its valid values.
+
+    Nothing is computed when the view is made: the fill value is computed
+    on first use and kept, and indexing fills only the selected rows. The
+    underlying data is never modified, and only the validity bits of the
+    selected rows are unpacked (see ValidityMask.valid_at).
+    np.asarray(view) gives the whole filled column.
+
+    Args:
+    - mask (ValidityMask): Validity of the data.
+    - data (numpy.ndarray): 2-D data the mask was built from.
+    - column (str or int): Column name or index.
+    - strategy (str): One of IMPUTATIONS.
+    """
+
+    def __init__(self, mask, data, column, strategy='zero'):
+        if strategy not in IMPUTATIONS:
+            raise ValueError(f"Unknown imputation '{strategy}', expected one of {IMPUTATIONS}")
+        self.mask = mask
+        self.column = mask._position(column)
+        self.data = data
+        self.values = data[:, self.column]
+        self.strategy = strategy
+        self._fill_value = None
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def fill_value(self):
+
+        """
+        Value replacing the missing entries, NaN for a mean or median of
+        a column with no valid value.
+        """
+
+        if self._fill_value is None:
+            if self.strategy == 'zero':
+                self._fill_value = 0.0
+            elif self.strategy == 'mean':
+                self._fill_value = self.mask.mean(self.data, self.column)
+            elif self.mask.count(self.column) == 0:
+                self._fill_value = np.nan
+            else:
+                valid = self.mask.valid(self.column)
+                self._fill_value = float(np.median(self.values[valid]))
+        return self._fill_value
+
+    def __getitem__(self, key):
+        values = self.values[key]
+        if self.mask.null_count(self.column) == 0:
+            return values
+        fill = self.values.dtype.type(self.fill_value)
+        valid = self.mask.valid_at(self.column, key)
+        if isinstance(valid, bool):
+            return values if valid else fill
+        return np.where(valid, values, fill)
+
+    def __array__(self, dtype=None):
+        values = self[:]
+        return values if dtype is None else values.astype(dtype)
+
+class ImputedData:
+
+    """
+    Lazy view of a 2-D dataset with the missing values of every column
+    replaced, see ImputedColumn. view[:, j] and view[rows, j] fill only
+    the selected column; np.asarray(view) gives a filled copy of the data.
+
+    Args:
+    - mask (ValidityMask): Validity of the data.
+    - data (numpy.ndarray): 2-D data the mask was built from.
+    - strategy (str): One of IMPUTATIONS.
+    """
+
+    def __init__(self, mask, data, strategy='zero'):
+        self.mask = mask
+        self.columns = [ImputedColumn(mask, data, i, strategy) for i in range(data.shape[1])]
+        self.shape = data.shape
+        self.dtype = data.dtype
+
+    def column(self, column):
+
+        """
+        Return the lazy view of one column (name or index).
+        """
+
+        return self.columns[self.mask._position(column)]
+
+    def __getitem__(self, key):
+        rows, columns = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(columns, (int, np.integer, str)):
+            return self.column(columns)[rows]
+        positions = np.arange(self.shape[1])[columns]
+        return np.stack([self.columns[p][rows] for p in positions], axis=-1)
+
+    def __array__(self, dtype=None):
+        data = self[:, :]
+        return data if dtype is None else data.astype(dtype)
+
+def impute(data, mask=None, strategy='zero', column_names=None):
+
+    """
+    Return a lazy view of a dataset with its missing values replaced.
+
+    Args:
+    - data (numpy.ndarray): 2-D data, NaN where missing.
+    - mask (ValidityMask): Validity of the data, built if not given.
+    - strategy (str): One of IMPUTATIONS: 0, or the mean or median of the
+      valid values of each column.
+    - column_names (sequence): Column names, when the mask is built.
+
+    Returns:
+    - view (ImputedData): Lazy imputed view; data is left unchanged.
+    """
+
+    if mask is None:
+        if column_names is None:
+            column_names = [str(i) for i in range(data.shape[1])]
+        mask = ValidityMask.from_array(data, column_names)
+    return ImputedData(mask, data, strategy)